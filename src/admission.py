@@ -0,0 +1,335 @@
+"""
+Admission control for the master.py proxy.
+
+Every backend gets a concurrency limit that adapts to its latency (AIMD):
+each response at most `tolerance` x the backend's baseline latency adds
+1/limit (about +1 per limit's worth of responses, once the backend is kept
+at least half busy), a slower one or a failure multiplies it by `backoff`,
+at most once per observed latency so one burst of slow responses counts
+once. The baseline is a slowly decaying minimum, so it follows a backend
+that genuinely got slower instead of pinning its best-ever figure.
+
+A request that finds no backend with a free slot (or no eligible backend
+at all: down, ejected, users >= max) waits in a bounded queue ordered by
+priority class, then arrival. A freed slot is handed straight to the head
+waiter; new arrivals only skip the queue when nobody of their class or
+better waits. Each class has a deadline and may use only its share of the
+queue; a higher class arriving at a full queue evicts the newest waiter of
+the lowest class. A request that can't be queued or outlives its deadline
+is shed with Overloaded, which carries a Retry-After estimate.
+
+Limits are per process: with --workers N a backend sees up to N x limit.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+from balancing import InFlight
+
+PRIORITIES = ("high", "normal", "low")
+
+WAITING, ADMITTED, SHED = 0, 1, 2
+PICK_ATTEMPTS = 3   # picks whose slot was taken concurrently before a request queues instead
+
+
+class Overloaded(Exception):
+    """Shed by admission control; answer 503 with Retry-After: retry_after."""
+
+    def __init__(self, retry_after, reason):
+        super().__init__(reason)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdaptiveLimit:
+    __slots__ = ("limit", "baseline", "calm_until")
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.baseline = None
+        self.calm_until = 0.0   # no further decrease before this (monotonic)
+
+
+class _Waiter:
+    __slots__ = ("pick", "priority", "seq", "deadline", "notify", "state", "target", "queued_at")
+
+    def __init__(self, pick, priority, seq, deadline, notify):
+        self.pick = pick
+        self.priority = priority
+        self.seq = seq
+        self.deadline = deadline
+        self.notify = notify
+        self.state = WAITING
+        self.target = None
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """
+    admit(pick, priority, deadline) / admit_async(...) return the chosen
+    backend's stats with a slot taken, or raise Overloaded; without a
+    deadline they don't queue and return None instead. pick(full) is the
+    balancer: it must skip the backend names in `full` (at their limit) and
+    return None when nothing fits. pick() runs outside the lock, so node
+    selection is not serialized; only the slot is reserved under it. A pick
+    that lost its slot to a concurrent request in the meantime is handed to
+    on_discard(target) and picked again. Every admitted request is paired
+    with one release(name); observe(name, latency, ok) feeds the limit.
+    wake() re-runs the queue after the set of eligible backends changed.
+
+    `in_flight` is the balancing.InFlight the strategies read, kept in step
+    with admitted requests. timeouts and shares are per class, in PRIORITIES
+    order. Thread-safe; the async proxy uses the same instance.
+    """
+
+    def __init__(self, in_flight=None, initial_limit=20, min_limit=2, max_limit=200,
+                 tolerance=2.0, backoff=0.9, drift=0.01, queue_size=256,
+                 timeouts=(10.0, 5.0, 1.0), shares=(1.0, 0.8, 0.4),
+                 max_retry_after=30, idle_retry_after=5,
+                 on_shed=None, on_wait=None, on_discard=None):
+        self.in_flight = in_flight or InFlight()
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.drift = drift
+        self.queue_size = queue_size
+        self.timeouts = timeouts
+        self.shares = shares
+        self.max_retry_after = max_retry_after
+        self.idle_retry_after = idle_retry_after
+        self.on_shed = on_shed      # on_shed(priority, reason)
+        self.on_wait = on_wait      # on_wait(seconds queued), admitted waiters only
+        self.on_discard = on_discard    # on_discard(target), a pick that was not used
+        self.lock = threading.Lock()
+        self.limits = {}            # name -> AdaptiveLimit
+        self.full = set()           # names at their limit
+        self.queue = []             # heap of _Waiter, SHED/ADMITTED ones removed lazily
+        self.queued = [0] * len(PRIORITIES)
+        self.seq = itertools.count()
+
+    def priority_of(self, value):
+        """Class index for a priority name (e.g. a request header), the middle one if unknown."""
+        try:
+            return PRIORITIES.index((value or "").strip().lower())
+        except ValueError:
+            return PRIORITIES.index("normal")
+
+    def deadline(self, priority):
+        return time.monotonic() + self.timeouts[priority]
+
+    # -- limits --------------------------------------------------------------
+
+    def _limit(self, name):
+        state = self.limits.get(name)
+        if state is None:
+            state = self.limits[name] = AdaptiveLimit(self.initial_limit)
+        return state
+
+    def _refresh(self, name):
+        if self.in_flight.get(name) >= int(self._limit(name).limit):
+            self.full.add(name)
+        else:
+            self.full.discard(name)
+
+    def observe(self, name, latency, ok=True):
+        """One upstream attempt's time to response headers (seconds) and outcome."""
+        now = time.monotonic()
+        with self.lock:
+            state = self._limit(name)
+            if latency is not None:
+                state.baseline = latency if state.baseline is None else \
+                    min(latency, state.baseline * (1 + self.drift))
+            slow = latency is not None and latency > self.tolerance * state.baseline
+            if not ok or slow:
+                if now >= state.calm_until:
+                    state.limit = max(self.min_limit, state.limit * self.backoff)
+                    state.calm_until = now + (latency or 0.0)
+            elif self.in_flight.get(name) * 2 >= state.limit:
+                state.limit = min(self.max_limit, state.limit + 1 / state.limit)
+            self._refresh(name)
+        self._dispatch()
+
+    def snapshot(self):
+        return {name: round(state.limit, 2) for name, state in list(self.limits.items())}
+
+    def forget(self, name):
+        with self.lock:
+            self.limits.pop(name, None)
+            self.full.discard(name)
+
+    # -- slots ---------------------------------------------------------------
+
+    def _discard(self, target):
+        if self.on_discard is not None:
+            self.on_discard(target)
+
+    def _take(self, target):
+        name = target['name']
+        self.in_flight.acquire(name)
+        self._refresh(name)
+
+    def release(self, name):
+        with self.lock:
+            self.in_flight.release(name)
+            if name in self.limits:
+                self._refresh(name)
+        self._dispatch()
+
+    def wake(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hands free slots to queued requests, best class first."""
+        misses = 0
+        while self.queue and misses < PICK_ATTEMPTS:
+            with self.lock:
+                while self.queue and self.queue[0].state != WAITING:
+                    heapq.heappop(self.queue)
+                if not self.queue:
+                    return
+                waiter = self.queue[0]
+                full = list(self.full)
+            target = waiter.pick(full)
+            if target is None:
+                return
+            with self.lock:
+                # Still the head waiter, and the slot still free?
+                admitted = (waiter.state == WAITING and self.queue and self.queue[0] is waiter
+                            and target['name'] not in self.full)
+                if admitted:
+                    heapq.heappop(self.queue)
+                    self.queued[waiter.priority] -= 1
+                    self._take(target)
+                    waiter.state = ADMITTED
+                    waiter.target = target
+            if admitted:
+                waiter.notify()
+                misses = 0
+            else:
+                self._discard(target)
+                misses += 1
+
+    # -- queueing ------------------------------------------------------------
+
+    def retry_after(self):
+        """Seconds until the queue has likely drained: waiting requests over slots per second."""
+        slots = sum(state.limit / state.baseline for state in self.limits.values() if state.baseline)
+        if not slots:
+            return self.idle_retry_after
+        return max(1, min(self.max_retry_after, math.ceil((sum(self.queued) + 1) / slots)))
+
+    def _shed(self, priority, reason):
+        if self.on_shed is not None:
+            self.on_shed(PRIORITIES[priority], reason)
+        return Overloaded(self.retry_after(), reason)
+
+    def _enter(self, pick, priority, deadline, notify):
+        """A target (admitted now), None (deadline None, nothing free), a queued _Waiter, or raises Overloaded."""
+        for _ in range(PICK_ATTEMPTS):
+            with self.lock:
+                if any(self.queued[:priority + 1]):
+                    break   # no jumping ahead of waiters of this class or better
+                full = list(self.full)
+            target = pick(full)
+            if target is None:
+                break
+            with self.lock:
+                if not any(self.queued[:priority + 1]) and target['name'] not in self.full:
+                    self._take(target)
+                    return target
+            self._discard(target)
+
+        with self.lock:
+            if deadline is None:
+                return None
+            if deadline <= time.monotonic():
+                raise self._shed(priority, "no free backend")
+            total = sum(self.queued)
+            if total >= self.queue_size * self.shares[priority]:
+                victim = self._victim(priority) if total >= self.queue_size else None
+                if victim is None:
+                    raise self._shed(priority, "queue full")
+                victim.state = SHED
+                self.queued[victim.priority] -= 1
+                victim.notify()
+            waiter = _Waiter(pick, priority, next(self.seq), deadline, notify)
+            heapq.heappush(self.queue, waiter)
+            self.queued[priority] += 1
+            return waiter
+
+    def _victim(self, priority):
+        """Newest waiter of the lowest class below `priority`, evicted for a better one."""
+        worst = None
+        for waiter in self.queue:
+            if waiter.state == WAITING and waiter.priority > priority and \
+                    (worst is None or (waiter.priority, waiter.seq) > (worst.priority, worst.seq)):
+                worst = waiter
+        return worst
+
+    def _leave(self, waiter):
+        """After the wait: the target it was handed, or Overloaded (and it leaves the queue)."""
+        with self.lock:
+            if waiter.state == ADMITTED:
+                target = waiter.target
+            else:
+                if waiter.state == WAITING:
+                    waiter.state = SHED
+                    self.queued[waiter.priority] -= 1
+                    reason = "queue deadline"
+                else:
+                    reason = "evicted by a higher priority request"
+                raise self._shed(waiter.priority, reason)
+        if self.on_wait is not None:
+            self.on_wait(time.monotonic() - waiter.queued_at)
+        return target
+
+    def _abandon(self, waiter):
+        """The caller went away while queued: give back a slot it may have been handed."""
+        with self.lock:
+            if waiter.state == WAITING:
+                waiter.state = SHED
+                self.queued[waiter.priority] -= 1
+                return
+            target = waiter.target if waiter.state == ADMITTED else None
+        if target is not None:
+            self.release(target['name'])
+
+    def admit(self, pick, priority=1, deadline=None):
+        """Blocking admission; deadline is a time.monotonic() value."""
+        event = threading.Event()
+        waiter = self._enter(pick, priority, deadline, event.set)
+        if not isinstance(waiter, _Waiter):
+            return waiter
+        self._dispatch()    # a backend may have freed up without a wake()
+        try:
+            event.wait(max(0.0, deadline - time.monotonic()))
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return self._leave(waiter)
+
+    async def admit_async(self, pick, priority=1, deadline=None):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._enter(pick, priority, deadline,
+                             lambda: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None)))
+        if not isinstance(waiter, _Waiter):
+            return waiter
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return self._leave(waiter)
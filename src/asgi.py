@@ -0,0 +1,93 @@
+"""
+Async serving mode for master.py and brain.py (ASGI, run under uvicorn).
+
+Hot paths get native async handlers; every other route falls through to the
+existing Flask app via asgiref's WsgiToAsgi, so nothing has to be written
+twice.
+"""
+
+import json
+
+from asgiref.wsgi import WsgiToAsgi
+
+
+async def iter_body(receive):
+    """Request body as an async iterator of chunks."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        chunk = message.get("body", b"")
+        if chunk:
+            yield chunk
+        if not message.get("more_body", False):
+            return
+
+
+async def send_response(send, status, body=b"", headers=(), content_type=b"text/plain; charset=utf-8"):
+    raw = [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]
+    raw.extend(headers)
+    await send({"type": "http.response.start", "status": status, "headers": raw})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    await send_response(send, status, body, content_type=b"application/json")
+
+
+def header(scope, name):
+    name = name.lower().encode()
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class Router:
+    """
+    Minimal ASGI dispatcher: exact-path async routes, then `default` (if
+    set), then the wrapped Flask app. Paths under `flask_prefixes` always go
+    to Flask. startup/shutdown hooks run on the ASGI lifespan events.
+    """
+
+    def __init__(self, flask_app, default=None, flask_prefixes=()):
+        self.routes = {}
+        self.default = default
+        self.flask = WsgiToAsgi(flask_app)
+        self.flask_prefixes = tuple(flask_prefixes)
+        self.on_startup = []
+        self.on_shutdown = []
+
+    def route(self, path):
+        def register(handler):
+            self.routes[path] = handler
+            return handler
+        return register
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                for hook in self.on_startup:
+                    await hook()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for hook in self.on_shutdown:
+                    await hook()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        handler = self.routes.get(path)
+        if handler is None and not path.startswith(self.flask_prefixes):
+            handler = self.default
+        if handler is None:
+            return await self.flask(scope, receive, send)
+        await handler(scope, receive, send)
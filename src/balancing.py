@@ -0,0 +1,404 @@
+import math
+import random
+import struct
+import threading
+from bisect import bisect, bisect_left
+from hashlib import blake2b
+
+import geo
+from selector import node_score
+
+
+class InFlight:
+    """Requests currently outstanding per backend, as seen by this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.total = 0
+
+    def acquire(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.total += 1
+
+    def release(self, name):
+        with self.lock:
+            if name in self.counts:
+                self.total -= 1
+            n = self.counts.get(name, 0) - 1
+            if n > 0:
+                self.counts[name] = n
+            else:
+                self.counts.pop(name, None)
+
+    def get(self, name):
+        return self.counts.get(name, 0)
+
+
+class Strategy:
+    """
+    Picks a backend from a NodeIndex. pick() returns the chosen node's stats
+    dict (same shape the index was fed) or None when nothing is eligible.
+    Strategies with uses_key = True route by pick(key=...), the caller's
+    affinity key (see affinity_key()); the others ignore it. `exclude` names
+    nodes the request already failed on (or that are at their admission
+    limit); every strategy skips them.
+    """
+
+    uses_key = False
+
+    def __init__(self, index, in_flight=None):
+        self.index = index
+        self.in_flight = in_flight or InFlight()
+
+    def candidates(self, exclude=()):
+        """The index's eligible (name, stats) pairs, minus `exclude`."""
+        nodes = self.index.candidates()
+        if exclude:
+            nodes = [n for n in nodes if n[0] not in exclude]
+        return nodes
+
+    def cost(self, name, stats):
+        # Outstanding requests first, the (stale) health score breaks ties
+        return (self.in_flight.get(name) / max(stats.get('weight', 1.0), 0.01), node_score(stats))
+
+    def pick(self, key=None, exclude=()):
+        raise NotImplementedError
+
+    def forget(self, name):
+        """The node left the mesh (gossip, set_nodes): drop anything kept for it."""
+
+
+class BestScore(Strategy):
+    """Always the lowest ping + load node (the original behaviour)."""
+
+    def pick(self, key=None, exclude=()):
+        best = self.index.best()
+        if best is not None and best['name'] in exclude:
+            nodes = self.candidates(exclude)
+            return min(nodes, key=lambda n: node_score(n[1]))[1] if nodes else None
+        return best
+
+
+class PowerOfTwo(Strategy):
+    """Sample two eligible nodes at random, keep the cheaper one."""
+
+    def pick(self, key=None, exclude=()):
+        nodes = self.candidates(exclude)
+        if not nodes:
+            return None
+        if len(nodes) == 1:
+            return nodes[0][1]
+        a, b = random.sample(nodes, 2)
+        return a[1] if self.cost(*a) <= self.cost(*b) else b[1]
+
+
+class LeastOutstanding(Strategy):
+    """Fewest in-flight requests per unit of weight."""
+
+    def pick(self, key=None, exclude=()):
+        nodes = self.candidates(exclude)
+        if not nodes:
+            return None
+        return min(nodes, key=lambda n: self.cost(*n))[1]
+
+
+class WeightedRoundRobin(Strategy):
+    """Smooth weighted round-robin (nginx style) over NODE_SETTINGS weights."""
+
+    def __init__(self, index, in_flight=None):
+        super().__init__(index, in_flight)
+        self.lock = threading.Lock()
+        self.current = {}
+
+    def pick(self, key=None, exclude=()):
+        nodes = self.candidates(exclude)
+        if not nodes:
+            return None
+
+        with self.lock:
+            total = 0.0
+            best = None
+            for name, stats in nodes:
+                weight = max(0.0, stats.get('weight', 1.0))
+                total += weight
+                self.current[name] = self.current.get(name, 0.0) + weight
+                if best is None or self.current[name] > self.current[best[0]]:
+                    best = (name, stats)
+            self.current[best[0]] -= total
+
+            if len(self.current) > 2 * len(nodes):
+                live = {name for name, _ in nodes}
+                self.current = {k: v for k, v in self.current.items() if k in live}
+            return best[1]
+
+
+def _hash64(text):
+    return int.from_bytes(blake2b(text.encode(), digest_size=8).digest(), "big")
+
+
+def _vnode_hashes(name, count):
+    """`count` ring positions for a node, eight per 64-byte digest."""
+    out = []
+    block = 0
+    while len(out) < count:
+        out.extend(struct.unpack(">8Q", blake2b(f"{name}#{block}".encode(), digest_size=64).digest()))
+        block += 1
+    return out[:count]
+
+
+class ConsistentHash(Strategy):
+    """
+    Session affinity: a weighted consistent-hash ring with bounded loads.
+
+    Every node gets vnodes in proportion to weight * max_users (`replicas`
+    points per `unit` users), hashed with blake2b so master and brain build
+    the same ring. A key maps to the first node clockwise from its hash that
+    is eligible, not excluded and under its load bound: at most
+    (1 + balance) x its weighted share of the in-flight requests, so a hot
+    key range spills to the next node instead of piling up.
+
+    Nodes that drop out of the index (down, full, maintenance) stay on the
+    ring and are skipped, so only their keys move; a new node or a weight
+    change only moves the arcs its vnodes cover, about 1/n of the keys.
+    Nodes removed from the mesh are taken off the ring by forget().
+    Requests without a key fall back to power-of-two choices.
+    """
+
+    uses_key = True
+
+    def __init__(self, index, in_flight=None, replicas=64, unit=100, max_vnodes=1024, balance=0.25):
+        super().__init__(index, in_flight)
+        self.replicas = replicas
+        self.unit = unit
+        self.max_vnodes = max_vnodes
+        self.balance = balance
+        self.lock = threading.Lock()
+        self.weights = {}        # name -> weighted capacity its vnodes were built for
+        self.node_points = {}    # name -> ring positions of its vnodes
+        self.ring = ([], [])     # (sorted hashes, owner per hash), swapped atomically
+        self.live = (None, {}, 0.0)   # (candidates snapshot, {name: stats}, summed capacity)
+        self.fallback = PowerOfTwo(index, self.in_flight)
+
+    def capacity(self, stats):
+        return max(0.0, stats.get('weight', 1.0)) * stats.get('max', 100)
+
+    def vnodes(self, capacity):
+        if capacity <= 0:
+            return 0
+        return max(1, min(self.max_vnodes, round(self.replicas * capacity / self.unit)))
+
+    def _sync(self, nodes):
+        """Refreshes the live set, rebuilding the ring only if a node is new or reweighted."""
+        changed = {}
+        for name, stats in nodes:
+            capacity = self.capacity(stats)
+            if self.weights.get(name) != capacity:
+                self.weights[name] = capacity
+                changed[name] = self.node_points.get(name, [])
+                self.node_points[name] = _vnode_hashes(name, self.vnodes(capacity))
+
+        if len(changed) > len(self.node_points) // 10:
+            # Full rebuild: sort plain ints with the owner packed into the low bits (much faster than tuples)
+            names = list(self.node_points)
+            packed = sorted((h << 20) | i for i, name in enumerate(names) for h in self.node_points[name])
+            self.ring = ([p >> 20 for p in packed], [names[p & 0xFFFFF] for p in packed])
+        elif changed:
+            # A few nodes joined or were reweighted: patch a copy of the ring in place
+            self._patch(changed)
+        live = dict(nodes)
+        self.live = (nodes, live, sum(self.weights[name] for name in live))
+
+    def _patch(self, changed):
+        """Swaps each {name: old points} for the node's current node_points (none if forgotten)."""
+        hashes, owners = list(self.ring[0]), list(self.ring[1])
+        for name, old in changed.items():
+            for h in old:
+                i = bisect_left(hashes, h)
+                while owners[i] != name:
+                    i += 1
+                del hashes[i], owners[i]
+            for h in self.node_points.get(name, ()):
+                i = bisect(hashes, h)
+                hashes.insert(i, h)
+                owners.insert(i, name)
+        self.ring = (hashes, owners)
+
+    def forget(self, name):
+        """Takes a removed node's vnodes off the ring (down or full nodes stay on it)."""
+        with self.lock:
+            if name not in self.weights:
+                return
+            del self.weights[name]
+            self._patch({name: self.node_points.pop(name)})
+            self.live = (None,) + self.live[1:]    # re-sync on the next pick
+
+    def lookup(self, key, exclude=()):
+        hashes, owners = self.ring
+        _, live, live_capacity = self.live
+        if not hashes or live_capacity <= 0:
+            return None
+
+        total = self.in_flight.total + 1
+        start = bisect(hashes, _hash64(key))
+        checked = set()
+        spare = None
+        for step in range(len(hashes)):
+            name = owners[(start + step) % len(hashes)]
+            if name in checked:
+                continue
+            checked.add(name)
+            stats = live.get(name)
+            if stats is not None and name not in exclude:
+                bound = math.ceil((1 + self.balance) * total * self.weights[name] / live_capacity)
+                if self.in_flight.get(name) < bound:
+                    return stats
+                spare = spare or stats
+            if len(checked) >= len(self.weights):
+                break
+        return spare
+
+    def pick(self, key=None, exclude=()):
+        nodes = self.index.candidates()
+        if not nodes:
+            return None
+        if key is None:
+            return self.fallback.pick(exclude=exclude)
+        if nodes is not self.live[0]:
+            with self.lock:
+                if nodes is not self.live[0]:
+                    self._sync(nodes)
+        return self.lookup(key, exclude)
+
+
+class GeoNearest(Strategy):
+    """
+    Geo routing: each client goes to the nearest eligible node.
+
+    The key is the client address (GEO_KEY in master.py / brain.py), looked
+    up in an offline IP-prefix table (geo.PrefixTable). Nodes are placed by
+    the location their agent reports and searched with a k-d tree
+    (geo.NodeTree) that is only rebuilt when a node appears, moves or is
+    forgotten; nodes that drop out of the index stay in the tree and are
+    skipped. When the two nearest eligible nodes are within `slack_km` of
+    each other the cheaper one wins, so a metro area with several nodes
+    still spreads its load. Clients without coordinates go to a node in
+    their region; unknown clients (or regions with no node left) fall back
+    to power-of-two choices.
+    """
+
+    uses_key = True
+
+    def __init__(self, index, in_flight=None, prefixes=None, slack_km=300):
+        super().__init__(index, in_flight)
+        self.prefixes = prefixes if prefixes is not None else geo.PrefixTable()
+        self.slack_km = slack_km
+        self.lock = threading.Lock()
+        self.located = {}           # name -> (lat, lon) the tree was built with
+        self.tree = None
+        self.live = (None, {}, {})  # (candidates snapshot, {name: stats}, {region: [(name, stats)]})
+        self.fallback = PowerOfTwo(index, self.in_flight)
+
+    def _sync(self, nodes):
+        located = dict(self.located)
+        regions = {}
+        for name, stats in nodes:
+            loc = geo.location_of(stats)
+            if loc is not None:
+                located[name] = loc
+            regions.setdefault(stats.get('region'), []).append((name, stats))
+        if located != self.located:
+            self.tree = geo.NodeTree(located)
+            self.located = located
+        self.live = (nodes, dict(nodes), regions)
+
+    def forget(self, name):
+        """Rebuilds the tree without a removed node."""
+        with self.lock:
+            if name not in self.located:
+                return
+            located = {n: loc for n, loc in self.located.items() if n != name}
+            self.tree = geo.NodeTree(located)
+            self.located = located
+            self.live = (None,) + self.live[1:]    # re-sync on the next pick
+
+    def locate(self, key):
+        """(lat, lon, region, city) for a client address (first hop of an X-Forwarded-For list), or None."""
+        if not key:
+            return None
+        return self.prefixes.lookup(key.split(",", 1)[0].strip())
+
+    def pick(self, key=None, exclude=()):
+        nodes = self.index.candidates()
+        if not nodes:
+            return None
+        if nodes is not self.live[0]:
+            with self.lock:
+                if nodes is not self.live[0]:
+                    self._sync(nodes)
+        client = self.locate(key)
+        if client is None:
+            return self.fallback.pick(exclude=exclude)
+
+        lat, lon, region, _ = client
+        _, live, regions = self.live
+        if lat is not None and lon is not None and self.tree is not None:
+            near = self.tree.nearest(lat, lon, lambda n: n in live and n not in exclude, 2)
+            if len(near) == 2 and near[1][0] - near[0][0] <= self.slack_km:
+                a, b = near[0][1], near[1][1]
+                return live[a] if self.cost(a, live[a]) <= self.cost(b, live[b]) else live[b]
+            if near:
+                return live[near[0][1]]
+
+        local = [n for n in regions.get(region, ()) if n[0] not in exclude]
+        if len(local) > 1:
+            a, b = random.sample(local, 2)
+            return a[1] if self.cost(*a) <= self.cost(*b) else b[1]
+        if local:
+            return local[0][1]
+        return self.fallback.pick(exclude=exclude)
+
+
+STRATEGIES = {
+    "best": BestScore,
+    "p2c": PowerOfTwo,
+    "least-outstanding": LeastOutstanding,
+    "weighted-rr": WeightedRoundRobin,
+    "consistent-hash": ConsistentHash,
+    "geo": GeoNearest,
+}
+
+
+def affinity_key(spec, header, client_ip):
+    """
+    Affinity key for a request. `spec` lists sources in order of preference:
+    "cookie:<name>", "header:<name>" or "ip"; the first one present wins,
+    so e.g. ("cookie:PHPSESSID", "ip") keeps a user on the node that issued
+    their session cookie and pins them by address until they have one.
+    header(name) returns a request header or None.
+    """
+    for source in spec:
+        kind, _, name = source.partition(":")
+        if kind == "ip":
+            if client_ip:
+                return client_ip
+        elif kind == "header":
+            value = header(name)
+            if value:
+                return value
+        elif kind == "cookie":
+            for part in (header("Cookie") or "").split(";"):
+                k, _, v = part.strip().partition("=")
+                if k == name and v:
+                    return v
+    return None
+
+
+def make_strategy(name, index, in_flight=None, geoip=None):
+    """`geoip` is the prefix database path for "geo" (see geo.load_prefixes), ignored otherwise."""
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown balancing strategy '{name}', expected one of {', '.join(STRATEGIES)}")
+    if name == "geo":
+        return GeoNearest(index, in_flight, prefixes=geo.load_prefixes(geoip))
+    return STRATEGIES[name](index, in_flight)
@@ -0,0 +1,181 @@
+"""
+Admission control (admission.py) against simulated backends, in-process.
+
+Each backend serves `--capacity` requests at a time in `--service` ms and
+queues the rest; every request past capacity also slows all of them down by
+`--thrash` (context switching, cache and lock contention), so piling more
+work on a saturated backend lowers its throughput (overload collapse).
+
+1. Overload: --clients closed-loop clients against the backends, first with
+   no limit (every request goes upstream, as master.py did), then through
+   AdmissionController. Throughput, client latency and the limits reached.
+2. Spike: the only backend is full (users >= max) for --spike ms while
+   requests arrive. Without a queue they all get 503; with it they wait and
+   are served once the backend frees up. Low priority ones past their
+   class deadline are shed with Retry-After.
+
+    python bench/admission.py --clients 100 --capacity 8 --seconds 3
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admission import AdmissionController, Overloaded
+from balancing import InFlight, PowerOfTwo
+from selector import NodeIndex
+
+
+class Backend:
+    def __init__(self, capacity, service, thrash):
+        self.slots = threading.Semaphore(capacity)
+        self.capacity = capacity
+        self.service = service
+        self.thrash = thrash
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def handle(self):
+        with self.lock:
+            self.active += 1
+        try:
+            with self.slots:
+                with self.lock:
+                    excess = max(0, self.active - self.capacity)
+                time.sleep(self.service * (1 + self.thrash * excess))
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def make_pool(count):
+    index, in_flight = NodeIndex(), InFlight()
+    for i in range(count):
+        index.update(f"NODE-{i}", {"name": f"NODE-{i}", "alive": True, "maintenance": False,
+                                   "ping": 1.0, "load": 10, "users": 0, "max": 100})
+    balancer = PowerOfTwo(index, in_flight)
+
+    def pick(full):
+        best = balancer.pick(None, full)
+        if best and best['name'] in full:
+            others = [stats for name, stats in index.candidates() if name not in full]
+            best = random.choice(others) if others else None
+        return best
+    return index, in_flight, pick
+
+
+def overload(args, limited):
+    backends = {f"NODE-{i}": Backend(args.capacity, args.service / 1000, args.thrash)
+                for i in range(args.backends)}
+    index, in_flight, pick = make_pool(args.backends)
+    admission = AdmissionController(in_flight, initial_limit=args.capacity * 4)
+    latencies, shed = [], [0]
+    end = time.time() + args.seconds
+
+    def client():
+        while time.time() < end:
+            start = time.perf_counter()
+            if limited:
+                try:
+                    target = admission.admit(pick, 1, admission.deadline(1))
+                except Overloaded:
+                    shed[0] += 1
+                    continue
+            else:
+                target = pick(())
+                in_flight.acquire(target['name'])
+            name = target['name']
+            sent = time.perf_counter()
+            backends[name].handle()
+            if limited:
+                admission.observe(name, time.perf_counter() - sent)
+                admission.release(name)
+            else:
+                in_flight.release(name)
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    label = "adaptive limit" if limited else "no limit"
+    print(f"{label:<15} {len(latencies) / args.seconds:>8.0f} req/s  p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms"
+          f"  p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms  shed {shed[0]}"
+          + (f"  limits {admission.snapshot()}" if limited else ""))
+
+
+def spike(args, queued):
+    backend = Backend(args.capacity, args.service / 1000, 0)
+    index, in_flight, pick = make_pool(1)
+    admission = AdmissionController(in_flight, initial_limit=args.capacity, timeouts=(10.0, 5.0, 0.2))
+    full = {"name": "NODE-0", "alive": True, "maintenance": False, "ping": 1.0, "load": 10,
+            "users": 100, "max": 100}
+    index.update("NODE-0", full)
+    results = {"served": 0, "503": 0, "shed low": 0}
+    lock = threading.Lock()
+
+    def request(priority):
+        try:
+            target = admission.admit(pick, priority, admission.deadline(priority) if queued else None)
+        except Overloaded as e:
+            with lock:
+                results["shed low" if priority == 2 else "503"] += 1
+            return
+        if target is None:
+            with lock:
+                results["503"] += 1
+            return
+        backend.handle()
+        admission.release(target['name'])
+        with lock:
+            results["served"] += 1
+
+    threads = []
+    start = time.time()
+    for i in range(args.spike_requests):
+        t = threading.Thread(target=request, args=(2 if i % 5 == 0 else 1,))
+        t.start()
+        threads.append(t)
+        time.sleep(args.spike / 1000 / args.spike_requests)
+    index.update("NODE-0", dict(full, users=0))
+    admission.wake()
+    for t in threads:
+        t.join()
+    label = "queue" if queued else "no queue"
+    print(f"{label:<15} {results}  ({time.time() - start:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--backends", type=int, default=2)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--service", type=float, default=10, help="ms per request at or below capacity")
+    parser.add_argument("--thrash", type=float, default=0.05, help="slowdown per request past capacity")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--spike", type=float, default=300, help="ms the backend stays full")
+    parser.add_argument("--spike-requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"overload: {args.clients} clients, {args.backends} backends x {args.capacity} slots, "
+          f"{args.service:g} ms service, thrash {args.thrash:g}")
+    overload(args, False)
+    overload(args, True)
+    print(f"spike: {args.spike_requests} requests (1 in 5 low priority) while the backend is full "
+          f"for {args.spike:g} ms")
+    spike(args, False)
+    spike(args, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Consistent-hash affinity (balancing.ConsistentHash): lookup cost, key
+spread against each node's weighted share, remap churn when a node joins,
+leaves or is reweighted, and how the load bound flattens a hot key.
+
+    python bench/affinity_bench.py --nodes 10 100 1000 --keys 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from balancing import ConsistentHash, InFlight
+from selector import NodeIndex
+
+
+def make_nodes(n, rng):
+    return {f"node-{i}": {"name": f"node-{i}", "alive": True, "ping": 10, "load": 0, "users": 0,
+                          "max": rng.choice([100, 200, 400]), "weight": rng.choice([0.5, 1.0, 1.0, 2.0])}
+            for i in range(n)}
+
+
+def build(nodes, balance=0.25):
+    index = NodeIndex()
+    for name, stats in nodes.items():
+        index.update(name, stats)
+    return index, ConsistentHash(index, InFlight(), balance=balance)
+
+
+def assignment(strategy, keys):
+    return {k: strategy.pick(k)["name"] for k in keys}
+
+
+def moved(before, after):
+    return sum(1 for k in before if before[k] != after[k]) / len(before)
+
+
+def share(nodes, names):
+    total = sum(nodes[n]["max"] * nodes[n]["weight"] for n in names)
+    return {n: nodes[n]["max"] * nodes[n]["weight"] / total for n in names}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    keys = [f"session-{rng.getrandbits(64):x}" for _ in range(args.keys)]
+
+    for n in args.nodes:
+        nodes = make_nodes(n, rng)
+        index, ch = build(nodes)
+
+        start = time.perf_counter()
+        ch.pick(keys[0])
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        before = assignment(ch, keys)
+        lookup_us = (time.perf_counter() - start) / len(keys) * 1e6
+
+        counts = Counter(before.values())
+        expected = share(nodes, nodes)
+        skew = max(counts.get(name, 0) / (len(keys) * expected[name]) for name in nodes)
+        print(f"n={n:<5} ring={len(ch.ring[0]):6d} points, build {build_ms:6.1f}ms, "
+              f"lookup {lookup_us:5.2f}us/key, max node load {skew:.2f}x its weighted share")
+
+        # Node leaves (goes unhealthy): only its keys should move
+        victim = f"node-{n // 2}"
+        down = dict(nodes[victim], alive=False)
+        index.update(victim, down)
+        after = assignment(ch, keys)
+        print(f"  node down : moved {moved(before, after):6.2%} of keys "
+              f"(ideal {share(nodes, nodes)[victim]:6.2%}), "
+              f"others moved {sum(1 for k in keys if before[k] != victim and after[k] != before[k])}")
+        index.update(victim, nodes[victim])
+        restored = assignment(ch, keys)
+        print(f"  node back : {moved(before, restored):6.2%} of keys differ from the original mapping")
+
+        # Node joins
+        new = {"name": "node-new", "alive": True, "ping": 10, "load": 0, "users": 0, "max": 200, "weight": 1.0}
+        index.update("node-new", new)
+        start = time.perf_counter()
+        ch.pick(keys[0])
+        rebuild_ms = (time.perf_counter() - start) * 1000
+        joined = assignment(ch, keys)
+        grown = dict(nodes, **{"node-new": new})
+        print(f"  node joins: moved {moved(before, joined):6.2%} of keys "
+              f"(ideal {share(grown, grown)['node-new']:6.2%}), ring rebuild {rebuild_ms:.1f}ms")
+        index.update("node-new", dict(new, alive=False))
+
+        # Reweight
+        heavy = f"node-{n // 3}"
+        index.update(heavy, dict(nodes[heavy], weight=nodes[heavy]["weight"] * 2))
+        reweighted = assignment(ch, keys)
+        print(f"  reweight  : doubling {heavy} moved {moved(joined, reweighted):6.2%} of keys")
+
+    # Bounded load: one hot key carries half the traffic with 64 requests outstanding
+    nodes = make_nodes(10, rng)
+    for balance in (100.0, 0.25):
+        index, ch = build(nodes, balance=balance)
+        window = deque()
+        peak = Counter()
+        for i in range(50_000):
+            key = "hot-user" if i % 2 == 0 else keys[i]
+            name = ch.pick(key)["name"]
+            ch.in_flight.acquire(name)
+            window.append(name)
+            peak[name] = max(peak[name], ch.in_flight.get(name))
+            if len(window) > 64:
+                ch.in_flight.release(window.popleft())
+        label = "unbounded" if balance > 10 else f"bounded (1+{balance})"
+        print(f"hot key, {label:17s}: busiest node peaked at {max(peak.values())} of 64 outstanding")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Discrete-event simulation of the balancing strategies in balancing.py.
+
+Heterogeneous backends (different speeds, worker counts and pings) are fed
+bursty on/off Poisson traffic. As in production, the health snapshot the
+index sees is only refreshed every --refresh seconds. The proxy's own
+in-flight counts are always current. Reports end-to-end latency percentiles
+per strategy for the same seeded arrival trace.
+
+    python bench/balance_sim.py --nodes 8 --seconds 120 --burst 1.1
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from balancing import STRATEGIES, InFlight, make_strategy
+from selector import NodeIndex
+
+
+class Backend:
+    def __init__(self, name, workers, service_ms, ping_ms):
+        self.name = name
+        self.workers = workers
+        self.service_ms = service_ms
+        self.ping_ms = ping_ms
+        self.busy = 0
+        self.queue = deque()
+
+    @property
+    def capacity(self):
+        """Requests per second at full utilisation"""
+        return self.workers * 1000 / self.service_ms
+
+
+def make_backends(count, rng):
+    backends = []
+    for i in range(count):
+        backends.append(Backend(
+            name=f"SIM-{i}",
+            workers=rng.choice([2, 4, 8]),
+            service_ms=rng.uniform(10, 40),
+            ping_ms=rng.uniform(2, 40),
+        ))
+    return backends
+
+
+def arrivals(rng, seconds, capacity, burst, quiet, period):
+    """Alternating bursty (burst x capacity) and quiet (quiet x capacity) periods."""
+    t = 0.0
+    while t < seconds:
+        on = int(t / period) % 2 == 0
+        rate = capacity * (burst if on else quiet)
+        t += rng.expovariate(rate)
+        yield t
+
+
+def simulate(strategy_name, backends, arrival_times, refresh, seed):
+    rng = random.Random(seed)
+    index = NodeIndex()
+    in_flight = InFlight()
+    strategy = make_strategy(strategy_name, index, in_flight)
+    by_name = {b.name: b for b in backends}
+    total_capacity = sum(b.capacity for b in backends)
+
+    for b in backends:
+        b.busy = 0
+        b.queue.clear()
+
+    def snapshot():
+        for b in backends:
+            index.update(b.name, {
+                "name": b.name,
+                "alive": True,
+                "ping": b.ping_ms,
+                "load": 100 * b.busy / b.workers,
+                "users": 0,
+                "max": 10 ** 9,
+                "weight": round(10 * b.capacity / total_capacity, 2),
+            })
+
+    events = []
+    seq = 0
+    for t in arrival_times:
+        events.append((t, seq, "arrive", None))
+        seq += 1
+    heapq.heapify(events)
+    heapq.heappush(events, (0.0, -1, "refresh", None))
+
+    latencies = []
+    worst_queue = 0
+
+    def start(b, now, arrived):
+        nonlocal seq
+        b.busy += 1
+        done = now + rng.expovariate(1000 / b.service_ms)
+        seq += 1
+        heapq.heappush(events, (done, seq, "done", (b.name, arrived)))
+
+    while events:
+        now, _, kind, data = heapq.heappop(events)
+
+        if kind == "refresh":
+            snapshot()
+            if events:
+                heapq.heappush(events, (now + refresh, -1, "refresh", None))
+        elif kind == "arrive":
+            stats = strategy.pick()
+            b = by_name[stats["name"]]
+            in_flight.acquire(b.name)
+            if b.busy < b.workers:
+                start(b, now, now)
+            else:
+                b.queue.append(now)
+                worst_queue = max(worst_queue, len(b.queue))
+        else:
+            name, arrived = data
+            b = by_name[name]
+            b.busy -= 1
+            in_flight.release(name)
+            latencies.append((now - arrived) * 1000 + 2 * b.ping_ms)
+            if b.queue:
+                start(b, now, b.queue.popleft())
+
+    return latencies, worst_queue
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--burst", type=float, default=1.1, help="offered load during bursts vs capacity")
+    parser.add_argument("--quiet", type=float, default=0.3, help="offered load between bursts vs capacity")
+    parser.add_argument("--period", type=float, default=2.0, help="burst on/off period (s)")
+    parser.add_argument("--refresh", type=float, default=3.0, help="health snapshot interval (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    backends = make_backends(args.nodes, rng)
+    capacity = sum(b.capacity for b in backends)
+    trace = list(arrivals(rng, args.seconds, capacity, args.burst, args.quiet, args.period))
+
+    print(f"{args.nodes} backends, {capacity:.0f} req/s capacity, {len(trace)} requests over {args.seconds:.0f}s")
+    print(f"{'strategy':>18} {'p50':>9} {'p99':>9} {'p99.9':>9} {'max':>9} {'max queue':>10}")
+    for name in STRATEGIES:
+        lat, worst_queue = simulate(name, backends, trace, args.refresh, args.seed)
+        lat.sort()
+        print(f"{name:>18} {pct(lat, 50):>7.1f}ms {pct(lat, 99):>7.1f}ms {pct(lat, 99.9):>7.1f}ms "
+              f"{lat[-1]:>7.1f}ms {worst_queue:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Response cache (cache.py) in front of the threaded master.py proxy.
+
+A stand-in backend serves three kinds of pages: /assets/N (max-age=60),
+/etag/N (ETag + no-cache, so every use revalidates) and /private/N
+(Cache-Control: private, never stored). Clients request them with a Zipf
+popularity skew; the run reports the backend requests that were actually
+made, the cache's hit ratio, bytes saved and evictions. A final burst of
+concurrent requests for one cold, slow page checks single-flight: the
+backend should see one fetch.
+
+    python bench/cache_bench.py --requests 5000 --keys 2000 --cache-mb 4
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+import master
+from cache import ResponseCache
+
+UPSTREAM = {"requests": 0, "not_modified": 0, "bytes": 0}
+
+
+class Backend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    page_size = 8192
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/status.php":
+            return self._send(200, b'{"cpu_load": 5, "current_users": 1, "max_users": 1000}', {})
+        UPSTREAM["requests"] += 1
+        kind, _, n = self.path.strip("/").partition("/")
+        body = (self.path.encode() * (self.page_size // len(self.path) + 1))[:self.page_size]
+        if kind == "slow":
+            time.sleep(0.3)
+            return self._send(200, body, {"Cache-Control": "max-age=60"})
+        if kind == "assets":
+            return self._send(200, body, {"Cache-Control": "max-age=60"})
+        if kind == "etag":
+            etag = f'"v1-{n}"'
+            if self.headers.get("If-None-Match") == etag:
+                UPSTREAM["not_modified"] += 1
+                return self._send(304, b"", {"ETag": etag, "Cache-Control": "no-cache"})
+            return self._send(200, body, {"ETag": etag, "Cache-Control": "no-cache"})
+        return self._send(200, body, {"Cache-Control": "private"})
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        UPSTREAM["bytes"] += len(body)
+
+
+def zipf_keys(n, count, s=1.1):
+    weights = [1 / (i + 1) ** s for i in range(n)]
+    return random.choices(range(n), weights=weights, k=count)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--cache-mb", type=float, default=4)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--admission", choices=["tinylfu", "lru"], default="tinylfu")
+    parser.add_argument("--disk-dir", default=None)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    backend = ThreadingHTTPServer(("127.0.0.1", 0), Backend)
+    backend.daemon_threads = True
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+
+    master.NODES[:] = [{"ip": "127.0.0.1", "port": backend.server_port, "name": "stand-in", "region": "LOCAL"}]
+    master.CACHE = ResponseCache(int(args.cache_mb * 2**20), admission=args.admission, disk_dir=args.disk_dir)
+    threading.Thread(target=master.check_health, daemon=True).start()
+    while len(master.NODE_INDEX) < 1:
+        time.sleep(0.05)
+    server = make_server("127.0.0.1", 0, master.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    kinds = random.choices(["assets", "etag", "private"], weights=[6, 3, 1], k=args.requests)
+    paths = [f"/{kind}/{key}" for kind, key in zip(kinds, zipf_keys(args.keys, args.requests))]
+    local = threading.local()
+
+    def one(path):
+        if not hasattr(local, "s"):
+            local.s = requests.Session()
+        r = local.s.get(base + path)
+        return r.status_code, r.headers.get("X-Cache", "-")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(one, paths))
+    elapsed = time.perf_counter() - start
+
+    labels = {}
+    for _, label in results:
+        labels[label] = labels.get(label, 0) + 1
+    stats = master.CACHE.stats()
+    print(f"{args.requests} requests over {args.keys} keys ({args.admission}, {args.cache_mb} MB) "
+          f"in {elapsed:.1f}s, {args.requests / elapsed:.0f} rps")
+    print(f"  client view: {labels}")
+    print(f"  backend: {UPSTREAM['requests']} requests ({UPSTREAM['not_modified']} were 304s), "
+          f"{UPSTREAM['bytes'] / 2**20:.1f} MB sent")
+    print(f"  cache: hit_ratio={stats['hit_ratio']} bytes_saved={stats['bytes_saved'] / 2**20:.1f}MB "
+          f"evictions={stats['evictions']} rejected={stats['admission_rejected']} "
+          f"entries={stats['entries']} used={stats['bytes'] / 2**20:.1f}MB")
+
+    before = UPSTREAM["requests"]
+    burst = 50
+    with ThreadPoolExecutor(burst) as pool:
+        statuses = list(pool.map(lambda _: requests.get(base + "/slow/cold").status_code, range(burst)))
+    print(f"single-flight: {burst} concurrent misses -> {UPSTREAM['requests'] - before} backend fetch(es), "
+          f"statuses {set(statuses)}, coalesced={master.CACHE.stats()['coalesced']}")
+
+    server.shutdown()
+    backend.shutdown()
+
+
+if __name__ == "__main__":
+    main()
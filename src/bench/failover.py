@@ -0,0 +1,174 @@
+"""
+Failover drill for the proxy's passive outlier detection (breaker.py).
+
+Three stand-in backends sit behind a threaded master.py proxy. Clients keep
+sending GETs while one backend is taken down, then made to answer 503s, then
+made slow, and finally brought back. For every phase it prints the errors
+clients saw, how long it took until the last error, the retries the proxy
+did and latency percentiles. The active health check runs every 5 s, so
+anything faster than that is the passive path.
+
+    python bench/failover.py --phase-seconds 4 --threads 8
+"""
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+import master
+
+
+class Backend:
+    """A stand-in node whose behaviour can be switched: ok, down, error or slow."""
+
+    def __init__(self, name):
+        self.name = name
+        self.mode = "ok"
+        self.hits = 0
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        self.port = s.getsockname()[1]
+        s.close()
+        self.server = None
+        self.connections = set()
+        self.start()
+
+    def start(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                backend.connections.add(self.connection)
+
+            def finish(self):
+                backend.connections.discard(self.connection)
+                super().finish()
+
+            def do_GET(self):
+                if self.path == "/status.php":
+                    body = b'{"cpu_load": 5, "current_users": 1, "max_users": 1000}'
+                    status = 200
+                else:
+                    backend.hits += 1
+                    if backend.mode == "slow":
+                        time.sleep(0.5)
+                    status = 503 if backend.mode == "error" else 200
+                    body = backend.name.encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        ThreadingHTTPServer.allow_reuse_address = True
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def down(self):
+        """Like a killed process: listener closed and keep-alive connections reset."""
+        self.server.shutdown()
+        self.server.server_close()
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.mode = "down"
+
+    def up(self):
+        if self.mode == "down":
+            self.start()
+        self.mode = "ok"
+
+
+def client(base, stop, log):
+    s = requests.Session()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            ok = s.get(base + "/page", timeout=10).status_code == 200
+        except requests.RequestException:
+            ok = False
+        now = time.perf_counter()
+        log.append((now, now - start, ok))
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000 if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phase-seconds", type=float, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    backends = [Backend(f"stand-in-{i}") for i in range(3)]
+    master.NODES[:] = [{"ip": "127.0.0.1", "port": b.port, "name": b.name, "region": "LOCAL"}
+                       for b in backends]
+    master.BREAKER.total = lambda: len(master.NODES)
+    threading.Thread(target=master.check_health, daemon=True).start()
+    while len(master.NODE_INDEX) < len(backends):
+        time.sleep(0.05)
+
+    server = make_server("127.0.0.1", 0, master.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    victim = backends[0]
+    phases = [
+        ("baseline", lambda: None),
+        ("backend down", victim.down),
+        ("backend back", victim.up),
+        ("backend 503s", lambda: setattr(victim, "mode", "error")),
+        ("backend ok", victim.up),
+        ("backend slow", lambda: setattr(victim, "mode", "slow")),
+        ("recovered", victim.up),
+    ]
+
+    for label, action in phases:
+        log = []
+        stop = threading.Event()
+        retries = master.PROXY_RETRIES.children[()].value
+        hits = victim.hits
+        action()
+        changed = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(base, stop, log)) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        time.sleep(args.phase_seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+
+        errors = [when for when, _, ok in log if not ok]
+        latencies = [lat for _, lat, _ in log]
+        last_error = f"{(max(errors) - changed) * 1000:.0f}ms" if errors else "-"
+        print(f"{label:13s} requests={len(log):5d} errors={len(errors):3d} last_error_after={last_error:>7s} "
+              f"retries={master.PROXY_RETRIES.children[()].value - retries:3d} "
+              f"victim_hits={victim.hits - hits:4d} p50={pct(latencies, 50):6.1f}ms p99={pct(latencies, 99):6.1f}ms "
+              f"breaker={master.BREAKER.states().get(victim.name, 'closed')}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
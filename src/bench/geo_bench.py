@@ -0,0 +1,115 @@
+"""
+Geo routing (geo.py, balancing.GeoNearest): prefix lookup cost, nearest
+node search against a brute-force scan, end-to-end pick cost, and the mean
+client -> node distance compared with p2c.
+
+Nodes and client prefixes are scattered around the globe; a tenth of the
+nodes are full (ineligible) so the search has to skip some.
+
+    python bench/geo_bench.py --nodes 10 100 1000 --prefixes 200000
+"""
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo
+from balancing import GeoNearest, PowerOfTwo
+from selector import NodeIndex
+
+REGIONS = ["NA-EAST", "NA-WEST", "EU", "ASIA", "OCE"]
+
+
+def random_point(rng):
+    return rng.uniform(-60, 70), rng.uniform(-180, 180)
+
+
+def make_prefixes(rng, count):
+    table = geo.PrefixTable()
+    clients = []
+    for _ in range(count):
+        length = rng.choice([12, 16, 20, 22, 24])
+        net = ipaddress.ip_network((rng.getrandbits(32), length), strict=False)
+        lat, lon = random_point(rng)
+        table.insert(str(net), (lat, lon, rng.choice(REGIONS), None))
+        clients.append((str(net.network_address + rng.randrange(net.num_addresses)), lat, lon))
+    return table, clients
+
+
+def make_nodes(rng, n):
+    nodes = {}
+    for i in range(n):
+        lat, lon = random_point(rng)
+        nodes[f"NODE-{i}"] = {"name": f"NODE-{i}", "alive": True, "ping": 10, "load": 10,
+                              "users": 100 if rng.random() < 0.1 else 0, "max": 100,
+                              "region": rng.choice(REGIONS), "location": {"lat": lat, "lon": lon}}
+    return nodes
+
+
+def per_call(fn, args_list, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for a in args_list:
+            fn(a)
+        best = min(best, (time.perf_counter() - start) / len(args_list))
+    return best * 1e6
+
+
+def distance(lat, lon, stats):
+    loc = stats["location"]
+    a, b = geo.unit_vector(lat, lon), geo.unit_vector(loc["lat"], loc["lon"])
+    return geo.chord_to_km(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--prefixes", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    table, clients = make_prefixes(rng, args.prefixes)
+    print(f"{args.prefixes} prefixes loaded in {time.perf_counter() - start:.1f}s")
+    sample = [rng.choice(clients) for _ in range(args.lookups)]
+    ips = [c[0] for c in sample]
+    print(f"prefix lookup: {per_call(table.lookup, ips):.2f} us")
+
+    print(f"{'nodes':>6} {'nearest us':>11} {'brute us':>9} {'pick us':>8} {'exact':>6} "
+          f"{'geo km':>8} {'p2c km':>8}")
+    for n in args.nodes:
+        nodes = make_nodes(rng, n)
+        index = NodeIndex()
+        for name, stats in nodes.items():
+            index.update(name, stats)
+        strategy = GeoNearest(index, prefixes=table)
+        strategy.pick(ips[0])   # builds the tree
+        live = strategy.live[1]
+        tree = strategy.tree
+        accept = live.__contains__
+
+        def brute(c):
+            return min((distance(c[1], c[2], s), name) for name, s in live.items())
+
+        points = sample[:2000]
+        nearest = per_call(lambda c: tree.nearest(c[1], c[2], accept, 2), points)
+        scan = per_call(brute, points[:200], repeat=1)
+        exact = sum(1 for c in points[:200] if tree.nearest(c[1], c[2], accept, 1)[0][1] == brute(c)[1])
+        pick = per_call(strategy.pick, ips[:5000])
+
+        p2c = PowerOfTwo(index)
+        geo_km = sum(distance(c[1], c[2], strategy.pick(c[0])) for c in points) / len(points)
+        p2c_km = sum(distance(c[1], c[2], p2c.pick()) for c in points) / len(points)
+        print(f"{n:>6} {nearest:>11.1f} {scan:>9.1f} {pick:>8.1f} {exact / 200:>6.0%} "
+              f"{geo_km:>8.0f} {p2c_km:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
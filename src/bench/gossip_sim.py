@@ -0,0 +1,124 @@
+"""
+Gossip membership drill (membership.py) on localhost.
+
+Starts --members participants in this process, all seeded with the first
+one, and measures:
+- join: time until every member knows every other one as alive
+- crash: --crash members stop without a word; time until every survivor
+  has them as dead
+- leave: one member leaves gracefully; time until everyone has it as left
+- forgery: an unsigned and a wrongly signed datagram announcing a "node"
+  must not make it into anyone's member list
+plus datagrams sent per member per second over the run.
+
+    python bench/gossip_sim.py --members 100 --crash 5 --period 0.5
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import membership
+from membership import ALIVE, DEAD, LEFT, Membership
+
+SENT = [0]
+SECRET = "bench-secret"
+
+
+def counting_send(original):
+    def send(self, addr, msg, piggyback=True):
+        SENT[0] += 1
+        return original(self, addr, msg, piggyback)
+    return send
+
+
+def wait_for(check, timeout, step=0.05):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if check():
+            return time.monotonic() - start
+        time.sleep(step)
+    return None
+
+
+def status_everywhere(members, name, statuses):
+    for m in members:
+        with m.lock:
+            other = m.members.get(name)
+            if other is None or other.status not in statuses:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--crash", type=int, default=5)
+    parser.add_argument("--period", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    Membership._send = counting_send(Membership._send)
+    started = time.monotonic()
+
+    seed = Membership("seed", 0, {"role": "controller"}, host="127.0.0.1", advertise="127.0.0.1", secret=SECRET,
+                      period=args.period, ack_timeout=args.period / 3)
+    seed.start()
+    members = [seed]
+    for i in range(args.members - 1):
+        m = Membership(f"NODE-{i}", 0, {"role": "node", "port": 5001}, seeds=[("127.0.0.1", seed.me.port)],
+                       host="127.0.0.1", secret=SECRET, period=args.period, ack_timeout=args.period / 3)
+        m.start()
+        members.append(m)
+
+    def converged():
+        return all(sum(1 for o in m.members.values() if o.status == ALIVE) == len(members) - 1
+                   for m in members)
+
+    joined = wait_for(converged, args.timeout)
+    print(f"{len(members)} members, period {args.period}s")
+    print(f"  join:  everyone knows everyone after {joined:.1f}s" if joined is not None
+          else "  join:  did not converge")
+
+    victims = random.sample(members[1:], args.crash)
+    survivors = [m for m in members if m not in victims]
+    for v in victims:
+        v.stop()
+    crash = wait_for(lambda: all(status_everywhere(survivors, v.me.name, (DEAD,)) for v in victims),
+                     args.timeout)
+    print(f"  crash: {args.crash} failures detected everywhere after {crash:.1f}s" if crash is not None
+          else f"  crash: not detected everywhere within {args.timeout}s")
+
+    leaver = survivors.pop()
+    leaver.leave()
+    left = wait_for(lambda: status_everywhere(survivors, leaver.me.name, (LEFT,)), args.timeout)
+    print(f"  leave: seen everywhere after {left:.1f}s" if left is not None
+          else f"  leave: not seen everywhere within {args.timeout}s")
+
+    record = {"n": "intruder", "h": "203.0.113.7", "p": 9, "i": 1, "s": ALIVE,
+              "m": {"role": "node", "web_port": 80}}
+    payload = json.dumps({"v": membership.VERSION, "t": "gossip", "me": record, "u": [record]}).encode()
+    forged = hmac.new(b"wrong-secret", payload, hashlib.sha256).digest() + payload
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for datagram in (payload, forged):
+            sock.sendto(datagram, ("127.0.0.1", seed.me.port))
+    time.sleep(args.period * 2)
+    accepted = sum(1 for m in survivors if "intruder" in m.members)
+    print(f"  forgery: unsigned/badly signed member accepted by {accepted} members")
+
+    elapsed = time.monotonic() - started
+    print(f"  {SENT[0] / len(members) / elapsed:.1f} datagrams per member per second "
+          f"(suspicion timeout {survivors[0].suspicion_timeout():.1f}s)")
+    for m in survivors:
+        m.stop()
+
+
+if __name__ == "__main__":
+    main()
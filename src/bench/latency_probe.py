@@ -0,0 +1,119 @@
+"""
+What "ping" measures (latency.py): the old /stats wall time against the
+UDP echo and TCP connect RTT, on localhost stand-ins.
+
+The stand-in agent answers /stats after --work ms (+/- a third, like
+psutil and JSON on a busy node) and echoes probes on the same port number
+over UDP. The network is the same for all three, so whatever the HTTP
+figure has on top of the RTT is agent overhead that used to steer routing.
+Then it times LatencyProber rounds over --targets nodes (all served by the
+one stand-in) and checks a silent node falls back from UDP to TCP.
+
+    python bench/latency_probe.py --samples 200 --work 15 --targets 1000
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latency import EchoResponder, LatencyProber, RttWindow
+
+
+def make_agent(work_ms):
+    class Agent(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(max(0.0, random.uniform(work_ms * 2 / 3, work_ms * 4 / 3)) / 1000)
+            body = json.dumps({"cpu_load": 10, "current_users": 0}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 4096    # the round connects to every target at once
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Agent)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(label, values):
+    w = RttWindow(len(values))
+    for v in values:
+        w.add(v)
+    s = w.summary()
+    print(f"{label:<14} p50 {s['p50']:>8.2f}  p95 {s['p95']:>8.2f}  jitter {s['jitter']:>7.2f}  "
+          f"stdev {statistics.pstdev(values):>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--work", type=float, default=15, help="simulated agent work per /stats, ms")
+    parser.add_argument("--targets", type=int, default=1000)
+    args = parser.parse_args()
+
+    server = make_agent(args.work)
+    port = server.server_address[1]
+    EchoResponder(port, host="127.0.0.1").start()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+
+    web, udp, tcp = [], [], []
+    udp_probe = LatencyProber(lambda: [("agent", "127.0.0.1", port)], mode="udp", window=args.samples)
+    tcp_probe = LatencyProber(lambda: [("agent", "127.0.0.1", port)], mode="tcp", window=args.samples,
+                              tcp_interval=0)
+    for _ in range(args.samples):
+        start = time.time()
+        conn.request("GET", "/stats")
+        json.loads(conn.getresponse().read())
+        web.append((time.time() - start) * 1000)
+        udp_probe.sweep()
+        tcp_probe.sweep()
+    for prober, out in ((udp_probe, udp), (tcp_probe, tcp)):
+        w = prober.windows["agent"]
+        out.extend(v for v in w.samples[:w.count] if v >= 0)
+
+    print(f"{args.samples} samples, agent work {args.work:g} ms (ms)")
+    summarize("HTTP /stats", web)
+    summarize("UDP echo", udp)
+    summarize("TCP connect", tcp)
+
+    targets = [(f"NODE-{i}", "127.0.0.1", port) for i in range(args.targets)]
+    for mode in ("udp", "tcp"):
+        prober = LatencyProber(lambda: targets, mode=mode, tcp_interval=0)
+        prober.sweep()
+        start = time.perf_counter()
+        rounds = 5
+        for _ in range(rounds):
+            prober.sweep()
+        took = (time.perf_counter() - start) / rounds
+        answered = sum(1 for name, *_ in targets if prober.stats(name))
+        print(f"{mode} round over {args.targets} nodes: {took * 1000:.1f} ms "
+              f"({took / args.targets * 1e6:.1f} us/node), {answered} answered")
+
+    # A node whose agent doesn't echo: UDP is given up after udp_attempts rounds
+    silent = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    threading.Thread(target=silent.serve_forever, daemon=True).start()
+    prober = LatencyProber(lambda: [("old-agent", "127.0.0.1", silent.server_address[1])], timeout=0.05)
+    for i in range(1, 6):
+        prober.sweep()
+        if prober.stats("old-agent"):
+            print(f"silent UDP agent: TCP fallback measured after {i} rounds, "
+                  f"p50 {prober.stats('old-agent')['p50']} ms")
+            break
+    else:
+        print("silent UDP agent: no fallback")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Per-event recording cost of metrics.py (must stay under 1µs to stay on in
+production), plus the cost of rendering a /metrics scrape.
+
+    python bench/metrics_overhead.py --events 1000000 --nodes 500
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Counter, Histogram, Registry
+
+
+def per_event(fn, events):
+    start = time.perf_counter()
+    for _ in range(events):
+        fn()
+    return (time.perf_counter() - start) / events * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--nodes", type=int, default=500)
+    args = parser.parse_args()
+
+    registry = Registry()
+    hist = Histogram("bench_seconds", "bench", registry=registry)
+    by_node = Histogram("bench_node_seconds", "bench", ["node"], registry=registry)
+    counter = Counter("bench_total", "bench", ["node"], registry=registry)
+    child = by_node.labels("node-1")
+
+    baseline = per_event(lambda: None, args.events)
+    results = {
+        "histogram.observe": per_event(lambda: hist.observe(0.003), args.events),
+        "child.observe (cached labels)": per_event(lambda: child.observe(0.003), args.events),
+        "labels(node).observe": per_event(lambda: by_node.labels("node-1").observe(0.003), args.events),
+        "labels(node).inc": per_event(lambda: counter.labels("node-1").inc(), args.events),
+        "with hist.time()": per_event(lambda: hist.time().__enter__().__exit__(), args.events),
+    }
+    print(f"call overhead baseline: {baseline:.0f}ns (subtracted below)")
+    for name, ns in results.items():
+        print(f"{name:32s} {ns - baseline:6.0f}ns/event")
+
+    for i in range(args.nodes):
+        by_node.labels(f"node-{i}").observe(0.01)
+        counter.labels(f"node-{i}").inc()
+    start = time.perf_counter()
+    body = registry.render()
+    print(f"scrape render, {args.nodes} nodes: {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{len(body) / 1024:.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
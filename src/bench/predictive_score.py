@@ -0,0 +1,115 @@
+"""
+Predictive scoring (scoring.ScoreEngine) vs the raw ping + load * 2 score.
+
+Two parts:
+- flapping: NODE-A and NODE-B have near-equal true scores plus sample
+  noise; counts how often "best" switches node over the run
+- reaction: NODE-A is best until its load ramps up linearly; counts the
+  sweeps until "best" leaves it after it stops being the better node
+Then times one engine sweep (annotate + index update) for large meshes.
+
+    python bench/predictive_score.py --sweeps 2000 --sizes 1000 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import ScoreEngine
+from selector import NodeIndex
+
+
+def stats(name, load, ping, users=20):
+    return {"name": name, "alive": True, "load": load, "ping": ping, "users": users, "max": 100}
+
+
+def run(samples, predictive, interval):
+    """samples: per sweep {name: (load, ping)}. Returns the best node name per sweep."""
+    engine = ScoreEngine()
+    index = NodeIndex(hysteresis=0.08 if predictive else 0.0)
+    picks = []
+    for i, sweep in enumerate(samples):
+        t = i * interval
+        for name, (load, ping) in sweep.items():
+            s = stats(name, load, ping)
+            if predictive:
+                engine.annotate(name, s, t)
+            index.update(name, s)
+        picks.append(index.best()["name"])
+    return picks
+
+
+def flapping(rng, sweeps, interval):
+    samples = [{
+        "NODE-A": (40 + rng.gauss(0, 4), 20 + rng.gauss(0, 3)),
+        "NODE-B": (41 + rng.gauss(0, 4), 20 + rng.gauss(0, 3)),
+    } for _ in range(sweeps)]
+    result = {}
+    for predictive in (False, True):
+        picks = run(samples, predictive, interval)
+        result[predictive] = sum(1 for a, b in zip(picks, picks[1:]) if a != b)
+    return result
+
+
+def reaction(rng, sweeps, interval, ramp):
+    samples = []
+    crossed = None
+    for i in range(sweeps):
+        load_a = 20 + max(0, i - sweeps // 4) * ramp
+        if crossed is None and load_a > 50:
+            crossed = i
+        samples.append({
+            "NODE-A": (min(100, load_a + rng.gauss(0, 2)), 20 + rng.gauss(0, 1)),
+            "NODE-B": (50 + rng.gauss(0, 2), 20 + rng.gauss(0, 1)),
+        })
+    result = {}
+    for predictive in (False, True):
+        picks = run(samples, predictive, interval)
+        left = next((i for i in range(sweeps // 4, sweeps) if picks[i] == "NODE-B"), sweeps)
+        result[predictive] = left - crossed
+    return result
+
+
+def sweep_cost(size, rounds):
+    engine = ScoreEngine()
+    index = NodeIndex(hysteresis=0.08)
+    names = [f"NODE-{i}" for i in range(size)]
+    elapsed = 0.0
+    for r in range(rounds):
+        sweep = [(name, stats(name, random.uniform(0, 100), random.uniform(1, 200))) for name in names]
+        start = time.perf_counter()
+        for name, s in sweep:
+            index.update(name, engine.annotate(name, s, r * 3.0))
+        index.best()
+        elapsed += time.perf_counter() - start
+    return elapsed / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sweeps", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=3.0, help="seconds between sweeps")
+    parser.add_argument("--ramp", type=float, default=0.5, help="NODE-A load added per sweep")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    flips = flapping(rng, args.sweeps, args.interval)
+    lag = reaction(rng, 200, args.interval, args.ramp)
+    print(f"{'score':>10} {'switches':>9} {'lag (sweeps)':>13}")
+    for predictive, label in ((False, "raw"), (True, "predictive")):
+        print(f"{label:>10} {flips[predictive]:>9} {lag[predictive]:>13}")
+
+    print()
+    print(f"{'nodes':>6} {'sweep ms':>9} {'us/node':>8}")
+    for size in args.sizes:
+        cost = sweep_cost(size, 5)
+        print(f"{size:>6} {cost * 1000:>9.1f} {cost * 1e6 / size:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Sweep latency benchmark for prober.MeshProber.
+
+Starts N fake node agents on localhost (one port each), some of them slow or
+dead, then times a full sweep for the concurrent prober and for a
+one-at-a-time baseline (concurrency=1, same as the old monitor_mesh loop).
+
+    python bench/probe_sweep.py --counts 10 100 500 --rtt 20 --dead 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from prober import MeshProber
+
+
+def free_ports(count):
+    socks, ports = [], []
+    for _ in range(count):
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        socks.append(s)
+        ports.append(s.getsockname()[1])
+    for s in socks:
+        s.close()
+    return ports
+
+
+def start_fake_agents(ports, rtt_ms):
+    """Runs one aiohttp site per port on a background event loop."""
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def stats(request):
+        await asyncio.sleep(rtt_ms / 1000)
+        return web.json_response({
+            "name": f"FAKE-{request.transport.get_extra_info('sockname')[1]}",
+            "current_users": random.randint(0, 50),
+            "max_users": 100,
+            "cpu_load": random.uniform(0, 100),
+            "status": "online",
+        })
+
+    async def boot():
+        app = web.Application()
+        app.router.add_get("/stats", stats)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        for port in ports:
+            await web.TCPSite(runner, "127.0.0.1", port, backlog=1024).start()
+        ready.set()
+
+    def main():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(boot())
+        loop.run_forever()
+
+    threading.Thread(target=main, daemon=True).start()
+    ready.wait()
+
+
+async def timed_sweep(prober, nodes):
+    sem = asyncio.Semaphore(prober.concurrency)
+    async with prober.session() as session:
+        # One warm-up sweep so both modes start with pooled connections
+        await prober.sweep(session, sem, nodes)
+        start = time.perf_counter()
+        results = await prober.sweep(session, sem, nodes)
+        elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if r[2] is None)
+    return elapsed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 50, 100, 250, 500])
+    parser.add_argument("--rtt", type=float, default=10, help="fake agent response delay (ms)")
+    parser.add_argument("--dead", type=float, default=0.0, help="fraction of nodes with nothing listening")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--sequential-max", type=int, default=100,
+                        help="skip the sequential baseline above this node count")
+    args = parser.parse_args()
+
+    max_nodes = max(args.counts)
+    ports = free_ports(max_nodes)
+    dead = set(random.sample(ports, int(max_nodes * args.dead)))
+    start_fake_agents([p for p in ports if p not in dead], args.rtt)
+
+    all_nodes = [
+        {"name": f"FAKE-{i}", "ip": "127.0.0.1", "agent_port": port, "web_port": 8000}
+        for i, port in enumerate(ports)
+    ]
+
+    print(f"{'nodes':>6} {'concurrent':>12} {'sequential':>12} {'failed':>7}")
+    for count in args.counts:
+        nodes = all_nodes[:count]
+        fast = MeshProber(nodes, timeout=args.timeout, deadline=args.timeout * 2,
+                          concurrency=args.concurrency)
+        c_time, failed = asyncio.run(timed_sweep(fast, nodes))
+
+        s_col = "skipped"
+        if count <= args.sequential_max:
+            slow = MeshProber(nodes, timeout=args.timeout, deadline=3600, concurrency=1)
+            s_time, _ = asyncio.run(timed_sweep(slow, nodes))
+            s_col = f"{s_time * 1000:.1f}ms"
+
+        print(f"{count:>6} {c_time * 1000:>10.1f}ms {s_col:>12} {failed:>7}")
+
+
+if __name__ == "__main__":
+    main()
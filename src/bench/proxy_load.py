@@ -0,0 +1,222 @@
+"""
+Local load test for the master.py reverse proxy.
+
+Runs a stand-in backend (serves /status.php, /blob?size=N and /sink) and the
+proxy in a child process pointed at it, then reports client-side p50/p99
+latency, time to first byte and the proxy's peak RSS for small and huge
+payloads in both directions.
+
+    python bench/proxy_load.py --small-requests 2000 --big-mb 500
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import psutil
+import requests
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 64 * 1024
+ZEROS = b"\0" * CHUNK
+
+
+class StandInBackend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, content_type="application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/status.php":
+            return self._reply(b'{"status": "online", "cpu_load": 5, "current_users": 1, "max_users": 1000}')
+
+        size = int(parse_qs(url.query).get("size", ["1024"])[0])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        while size > 0:
+            n = min(size, CHUNK)
+            self.wfile.write(ZEROS[:n])
+            size -= n
+
+    def do_POST(self):
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                n = int(self.rfile.readline().split(b";")[0], 16)
+                if n == 0:
+                    self.rfile.readline()
+                    break
+                while n > 0:
+                    got = len(self.rfile.read(min(n, CHUNK)))
+                    received += got
+                    n -= got
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining > 0:
+                got = len(self.rfile.read(min(remaining, CHUNK)))
+                if not got:
+                    break
+                received += got
+                remaining -= got
+        self._reply(f'{{"received": {received}}}'.encode())
+
+
+class ZeroStream:
+    """File-like upload body of a given size that never exists in memory."""
+
+    def __init__(self, size):
+        self.remaining = size
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def read(self, n=CHUNK):
+        n = min(n if n and n > 0 else CHUNK, self.remaining, CHUNK)
+        self.remaining -= n
+        return ZEROS[:n]
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.proc = psutil.Process(pid)
+        self.peak = 0
+        self.running = True
+
+    def reset(self):
+        self.peak = self.proc.memory_info().rss
+
+    def run(self):
+        while self.running:
+            try:
+                self.peak = max(self.peak, self.proc.memory_info().rss)
+            except psutil.Error:
+                return
+            time.sleep(0.01)
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def start_proxy(proxy_port, backend_port):
+    code = f"""
+import threading, master
+master.NODES[:] = [{{"ip": "127.0.0.1", "port": {backend_port}, "name": "stand-in", "region": "LOCAL"}}]
+threading.Thread(target=master.check_health, daemon=True).start()
+import logging; logging.getLogger('werkzeug').setLevel(logging.ERROR)
+master.app.run(host="127.0.0.1", port={proxy_port}, threaded=True)
+"""
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=SRC_DIR)
+    base = f"http://127.0.0.1:{proxy_port}"
+    for _ in range(100):
+        try:
+            if requests.get(base + "/blob?size=1", timeout=1).status_code == 200:
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("proxy did not come up")
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_small(base, total, concurrency, rss):
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, "s"):
+            local.s = requests.Session()
+        start = time.perf_counter()
+        r = local.s.get(base + "/blob?size=1024")
+        r.content
+        return (time.perf_counter() - start) * 1000
+
+    rss.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        lat = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    print(f"1 KB GET x{total} (c={concurrency}): p50={pct(lat, 50):.2f}ms p99={pct(lat, 99):.2f}ms "
+          f"rps={total / elapsed:.0f} peak_rss={rss.peak / 2**20:.1f}MB")
+
+
+def run_big_download(base, size, rss):
+    rss.reset()
+    start = time.perf_counter()
+    ttfb = None
+    got = 0
+    with requests.get(base + f"/blob?size={size}", stream=True) as r:
+        for chunk in r.iter_content(CHUNK):
+            if ttfb is None:
+                ttfb = (time.perf_counter() - start) * 1000
+            got += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{size / 2**20:.0f} MB GET: total={elapsed * 1000:.0f}ms ttfb={ttfb:.2f}ms "
+          f"{got / 2**20 / elapsed:.0f}MB/s peak_rss={rss.peak / 2**20:.1f}MB")
+
+
+def run_big_upload(base, size, rss):
+    rss.reset()
+    start = time.perf_counter()
+    r = requests.post(base + "/sink", data=ZeroStream(size))
+    elapsed = time.perf_counter() - start
+    print(f"{size / 2**20:.0f} MB POST: total={elapsed * 1000:.0f}ms status={r.status_code} "
+          f"{r.json().get('received', 0) / 2**20 / elapsed:.0f}MB/s peak_rss={rss.peak / 2**20:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--small-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--big-mb", type=int, default=500)
+    args = parser.parse_args()
+
+    backend_port = free_port()
+    backend = ThreadingHTTPServer(("127.0.0.1", backend_port), StandInBackend)
+    threading.Thread(target=backend.serve_forever, daemon=True).start()
+
+    proc, base = start_proxy(free_port(), backend_port)
+    rss = RssSampler(proc.pid)
+    rss.start()
+    try:
+        run_small(base, args.small_requests, args.concurrency, rss)
+        run_big_download(base, args.big_mb * 2**20, rss)
+        run_big_upload(base, args.big_mb * 2**20, rss)
+    finally:
+        rss.running = False
+        proc.terminate()
+        proc.wait()
+        backend.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Offline replay of health traces through the routing policies.
+
+Feeds a trace of (timestamp, node, cpu_load, ping, users) samples, either
+read from a mesh_history.db or generated, through the same pieces
+brain.api_get_best and master.get_best_node are built from: a NodeIndex fed
+per-node stats (annotated by a ScoreEngine for "+predict" policies) and a
+balancing strategy picking from it. Time is stepped, not waited on, so a
+day of trace takes seconds. Each step is one health sweep as far as the
+score engine is concerned (--sweep-interval apart), so its smoothing and
+trend work at the same scale as in production however coarse the step.
+
+Every step routes rps * step requests, sampled as --picks selections that
+each stand for an equal share. Routed requests become concurrent sessions
+(Little's law: rate * --session seconds) on top of the node's own users,
+and the index sees them on the next step, like a health probe would.
+Per policy it reports:
+- distribution: busiest node's share of requests and the spread of
+  utilisation across nodes (coefficient of variation)
+- overload: node-steps above max_users and the share of requests
+  routed into them, plus requests no node was eligible for
+- predicted latency: ping + service time / (1 - utilisation), M/M/1 style
+
+    python bench/replay.py --db mesh_history.db
+    python bench/replay.py --nodes 1000 --hours 24
+    python bench/replay.py --nodes 50 --rps 200 --step 900 --policies p2c least-outstanding weighted-rr
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from balancing import InFlight, make_strategy
+from scoring import ScoreEngine
+from selector import NodeIndex
+
+# least-outstanding scans every node per pick: fine for small meshes, minutes at 1k nodes
+POLICIES = ["best", "best+predict", "p2c", "p2c+predict", "consistent-hash"]
+HYSTERESIS = 0.08       # same as SCORE_HYSTERESIS in brain.py / master.py
+MAX_UTILISATION = 0.95  # latency model cap, past this a node is just "very slow"
+
+
+def db_trace(path, step, hours=None):
+    """
+    Steps of (t, {name: (load, ping, users)}) from a history database, raw
+    samples averaged per step. Reads the 'history' view (or a legacy table).
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        where, params = "", ()
+        if hours:
+            newest = conn.execute("SELECT max(timestamp) FROM history").fetchone()[0] or 0
+            where, params = "WHERE timestamp >= ?", (newest - hours * 3600,)
+        rows = conn.execute(
+            f"SELECT timestamp - timestamp % ?, node_name, avg(cpu_load), avg(ping), avg(users) "
+            f"FROM history {where} GROUP BY 1, 2 ORDER BY 1", (step, *params)).fetchall()
+    finally:
+        conn.close()
+
+    steps = []
+    for t, name, load, ping, users in rows:
+        if not steps or steps[-1][0] != t:
+            steps.append((t, {}))
+        steps[-1][1][name] = (load or 0, ping or 0, users or 0)
+    return steps
+
+
+def synthetic_trace(rng, nodes, hours, step):
+    """
+    A day-shaped trace: every node gets a base load and ping, a shared
+    diurnal swing, noise, the odd load spike and the odd outage.
+    """
+    profiles = []
+    for i in range(nodes):
+        profiles.append({
+            "name": f"NODE-{i}",
+            "load": rng.uniform(5, 40),
+            "swing": rng.uniform(10, 40),
+            "ping": rng.uniform(2, 80),
+            "users": rng.uniform(0.05, 0.4),
+            "spike": 0,
+            "down": 0,
+        })
+
+    steps = []
+    count = int(hours * 3600 / step)
+    for k in range(count):
+        t = k * step
+        day = 0.5 - 0.5 * math.cos(2 * math.pi * t / 86400)
+        samples = {}
+        for p in profiles:
+            if p["down"]:
+                p["down"] -= 1
+                continue
+            if rng.random() < 0.0005:
+                p["down"] = rng.randint(1, 10)
+                continue
+            if p["spike"]:
+                p["spike"] -= 1
+            elif rng.random() < 0.002:
+                p["spike"] = rng.randint(2, 20)
+            load = p["load"] + p["swing"] * day + rng.gauss(0, 3) + (40 if p["spike"] else 0)
+            samples[p["name"]] = (min(100.0, max(0.0, load)),
+                                  p["ping"] + rng.expovariate(0.5),
+                                  p["users"] * day)
+        steps.append((t, samples))
+    return steps
+
+
+def replay(policy, steps, args, rng):
+    strategy_name, _, scoring = policy.partition("+")
+    predictive = scoring == "predict"
+    index = NodeIndex(hysteresis=HYSTERESIS if predictive else 0.0)
+    engine = ScoreEngine() if predictive else None
+    in_flight = InFlight()
+    strategy = make_strategy(strategy_name, index, in_flight)
+    keys = [f"session-{i}" for i in range(args.keys)] if strategy.uses_key else None
+
+    per_pick = args.rps * args.step / args.picks   # requests each pick stands for
+    per_pick_sessions = args.rps * args.session / args.picks
+    routed = {}        # name -> concurrent sessions from the previous step
+    live = set()
+    requests = {}      # name -> requests routed over the run
+    utilisation = {}   # name -> summed utilisation over the steps it was up
+    latency = []       # (ms, requests) per node-step
+    overloaded_steps = overloaded_requests = dropped = 0
+
+    for k, (t, samples) in enumerate(steps):
+        for name in live - samples.keys():
+            index.remove(name)
+        live = set(samples)
+
+        for name, (load, ping, users) in samples.items():
+            stats = {
+                "name": name,
+                "alive": True,
+                "ping": ping,
+                "load": load,
+                "users": users * args.max_users + routed.get(name, 0),
+                "max": args.max_users,
+                "weight": 1.0,
+            }
+            if engine is not None:
+                engine.annotate(name, stats, k * args.sweep_interval)
+            index.update(name, stats)
+
+        picks = {}
+        for _ in range(args.picks):
+            stats = strategy.pick(rng.choice(keys) if keys else None)
+            if stats is None:
+                dropped += per_pick
+                continue
+            name = stats["name"]
+            in_flight.acquire(name)
+            picks[name] = picks.get(name, 0) + 1
+        for name, n in picks.items():
+            for _ in range(n):
+                in_flight.release(name)
+
+        routed = {name: n * per_pick_sessions for name, n in picks.items()}
+        for name, (load, ping, users) in samples.items():
+            u = (users * args.max_users + routed.get(name, 0)) / args.max_users
+            utilisation[name] = utilisation.get(name, 0.0) + u
+            n = picks.get(name, 0) * per_pick
+            if u > 1:
+                overloaded_steps += 1
+                overloaded_requests += n
+            if n:
+                requests[name] = requests.get(name, 0) + n
+                service = args.service_ms * (1 + load / 100)
+                latency.append((ping + service / (1 - min(u, MAX_UTILISATION)), n))
+
+    total = sum(requests.values()) + dropped
+    util = [u / len(steps) for u in utilisation.values()]
+    mean = sum(util) / len(util) if util else 0
+    spread = math.sqrt(sum((u - mean) ** 2 for u in util) / len(util)) / mean if mean else 0
+    return {
+        "top_share": max(requests.values()) / total if requests else 0,
+        "spread": spread,
+        "overloaded_steps": overloaded_steps,
+        "overloaded": overloaded_requests / total if total else 0,
+        "dropped": dropped / total if total else 0,
+        "latency": weighted_percentiles(latency, (50, 99)),
+    }
+
+
+def weighted_percentiles(pairs, ps):
+    pairs = sorted(pairs)
+    total = sum(w for _, w in pairs)
+    out = []
+    for p in ps:
+        target = total * p / 100
+        acc = 0
+        value = pairs[-1][0] if pairs else 0
+        for v, w in pairs:
+            acc += w
+            if acc >= target:
+                value = v
+                break
+        out.append(value)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="replay this mesh_history.db instead of a synthetic trace")
+    parser.add_argument("--nodes", type=int, default=1000, help="synthetic trace size")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--step", type=int, default=300, help="seconds of trace per step")
+    parser.add_argument("--sweep-interval", type=float, default=3, help="probe interval each step stands for")
+    parser.add_argument("--rps", type=float, default=1000, help="offered requests per second")
+    parser.add_argument("--session", type=float, default=20, help="seconds a request occupies its node")
+    parser.add_argument("--max-users", type=int, default=200, help="per node (not in the history schema)")
+    parser.add_argument("--service-ms", type=float, default=20, help="idle service time per request")
+    parser.add_argument("--picks", type=int, default=1000, help="selections sampled per step")
+    parser.add_argument("--keys", type=int, default=10000, help="affinity keys for consistent-hash")
+    parser.add_argument("--policies", nargs="+", default=POLICIES,
+                        help="strategy names from balancing.py, '+predict' adds scoring.ScoreEngine")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.db:
+        steps = db_trace(args.db, args.step, args.hours)
+        source = args.db
+    else:
+        steps = synthetic_trace(random.Random(args.seed), args.nodes, args.hours, args.step)
+        source = "synthetic"
+    if not steps:
+        sys.exit("trace is empty")
+    nodes = len({name for _, samples in steps for name in samples})
+    print(f"{source}: {len(steps)} steps of {args.step}s, {nodes} nodes, "
+          f"loaded in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'policy':>20} {'top share':>10} {'util cv':>8} {'overloads':>10} {'overloaded':>11} "
+          f"{'dropped':>8} {'p50':>9} {'p99':>9} {'time':>6}")
+    for policy in args.policies:
+        started = time.perf_counter()
+        r = replay(policy, steps, args, random.Random(args.seed))
+        p50, p99 = r["latency"]
+        print(f"{policy:>20} {r['top_share']:>9.2%} {r['spread']:>8.2f} {r['overloaded_steps']:>10} "
+              f"{r['overloaded']:>10.2%} {r['dropped']:>7.2%} {p50:>7.1f}ms {p99:>7.1f}ms "
+              f"{time.perf_counter() - started:>5.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Best-node selection microbenchmark: the old linear scan vs selector.NodeIndex.
+
+Each round mixes many selections with a few stats updates, roughly what the
+proxy sees between two health sweeps.
+
+    python bench/select_nodes.py --sizes 10 1000 10000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selector import NodeIndex, is_eligible, node_score
+
+
+def make_stats(i):
+    return {
+        "name": f"NODE-{i}",
+        "ip": "127.0.0.1",
+        "alive": random.random() > 0.05,
+        "maintenance": random.random() < 0.02,
+        "ping": random.uniform(1, 200),
+        "load": random.uniform(0, 100),
+        "users": random.randint(0, 100),
+        "max": 100,
+    }
+
+
+def linear_best(status):
+    best = None
+    min_score = float('inf')
+    for name, stats in status.items():
+        if not is_eligible(stats):
+            continue
+        score = node_score(stats)
+        if score < min_score:
+            min_score = score
+            best = stats
+    return best
+
+
+def bench(fn, duration):
+    calls = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        for _ in range(100):
+            fn()
+        calls += 100
+    return calls / duration
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--duration", type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>6} {'linear sel/s':>14} {'index sel/s':>14} {'index upd/s':>14} {'speedup':>8}")
+    for size in args.sizes:
+        status = {f"NODE-{i}": make_stats(i) for i in range(size)}
+        index = NodeIndex()
+        for name, stats in status.items():
+            index.update(name, stats)
+
+        assert linear_best(status) is index.best()
+
+        names = list(status)
+
+        def update():
+            name = random.choice(names)
+            stats = make_stats(0)
+            status[name] = stats
+            index.update(name, stats)
+
+        linear = bench(lambda: linear_best(status), args.duration)
+        indexed = bench(index.best, args.duration)
+        updates = bench(update, args.duration)
+        print(f"{size:>6} {linear:>14,.0f} {indexed:>14,.0f} {updates:>14,.0f} {indexed / linear:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
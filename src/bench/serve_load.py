@@ -0,0 +1,152 @@
+"""
+Threaded (Flask) vs async (uvicorn/ASGI) serving mode for master.py.
+
+Starts an aiohttp stand-in backend (/status.php and /payload?size=N) in its
+own process, then for each mode runs the proxy in a child process and drives
+it with many concurrent keep-alive aiohttp clients. Reports throughput, tail
+latency and errors per concurrency level.
+
+    python bench/serve_load.py --concurrency 100 1000 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+import requests
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKEND = """
+import sys
+from aiohttp import web
+
+STATUS = b'{"status": "online", "cpu_load": 5, "current_users": 1, "max_users": 100000}'
+
+async def status(request):
+    return web.Response(body=STATUS, content_type="application/json")
+
+async def payload(request):
+    return web.Response(body=b"x" * int(request.query.get("size", 1024)))
+
+app = web.Application()
+app.router.add_get("/status.php", status)
+app.router.add_get("/payload", payload)
+web.run_app(app, host="127.0.0.1", port=int(sys.argv[1]), print=None, access_log=None)
+"""
+
+PROXY = """
+import logging, threading, master
+master.NODES[:] = [{{"ip": "127.0.0.1", "port": {backend_port}, "name": "stand-in", "region": "LOCAL"}}]
+threading.Thread(target=master.check_health, daemon=True).start()
+if {async_mode}:
+    import uvicorn
+    uvicorn.run(master.make_asgi_app(), host="127.0.0.1", port={port}, log_level="error", backlog=4096)
+else:
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    master.app.run(host="127.0.0.1", port={port}, threaded=True)
+"""
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_up(url, proc):
+    for _ in range(150):
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.kill()
+    raise SystemExit(f"{url} did not come up")
+
+
+def pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float("nan")
+
+
+async def drive(url, concurrency, seconds):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def client():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                            continue
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                    errors += 1
+                    await asyncio.sleep(0.05)
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, errors
+
+
+def run_mode(async_mode, backend_port, args):
+    port = free_port()
+    code = PROXY.format(backend_port=backend_port, port=port, async_mode=async_mode)
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=SRC_DIR)
+    url = f"http://127.0.0.1:{port}/payload?size={args.size}"
+    try:
+        wait_up(url, proc)
+        label = "async   " if async_mode else "threaded"
+        for c in args.concurrency:
+            rps, lat, errors = asyncio.run(drive(url, c, args.seconds))
+            print(f"{label} c={c:<5} rps={rps:7.0f} p50={pct(lat, 50):7.2f}ms p99={pct(lat, 99):8.2f}ms "
+                  f"p99.9={pct(lat, 99.9):8.2f}ms errors={errors}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--mode", choices=["both", "threaded", "async"], default="both")
+    args = parser.parse_args()
+
+    backend_port = free_port()
+    backend = subprocess.Popen([sys.executable, "-c", BACKEND, str(backend_port)])
+    try:
+        wait_up(f"http://127.0.0.1:{backend_port}/status.php", backend)
+        if args.mode in ("both", "threaded"):
+            run_mode(False, backend_port, args)
+        if args.mode in ("both", "async"):
+            run_mode(True, backend_port, args)
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+if __name__ == "__main__":
+    main()
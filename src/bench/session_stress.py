@@ -0,0 +1,116 @@
+"""
+Concurrency stress test for node session admission (sessions.SessionTable).
+
+Hammers a real threaded node agent over HTTP with concurrent connect /
+disconnect / batch calls and clients that "crash" (never disconnect), then
+checks that the admitted count never went above capacity and that crashed
+leases were reclaimed after their TTL. Exits non-zero on a violation.
+
+    python bench/session_stress.py --capacity 50 --threads 64 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from werkzeug.serving import make_server
+
+import node
+
+
+def worker(base, stop, ttl, tallies):
+    s = requests.Session()
+    held = []
+    while not stop.is_set():
+        r = random.random()
+        if r < 0.45:
+            resp = s.post(base + "/connect", json={"ttl": ttl})
+            if resp.status_code == 200:
+                held.append(resp.json()["lease"])
+                tallies["ok"] += 1
+            else:
+                tallies["full"] += 1
+        elif r < 0.55:
+            resp = s.post(base + "/connect/batch", json={"count": random.randint(2, 5), "ttl": ttl})
+            if resp.status_code == 200:
+                held.extend(resp.json()["leases"])
+                tallies["ok"] += 1
+            else:
+                tallies["full"] += 1
+        elif r < 0.60 and held:
+            held.pop()  # crashed client: lease is never released
+            tallies["leaked"] += 1
+        elif held:
+            k = random.randint(1, min(3, len(held)))
+            batch, held[:] = held[:k], held[k:]
+            s.post(base + "/disconnect/batch", json={"leases": batch})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--ttl", type=float, default=1.0)
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    node.config.update({"server_name": "STRESS", "region": "LOCAL",
+                        "max_users": args.capacity, "location": {}})
+    node.sessions.capacity = args.capacity
+    node.sessions.start_reaper(0.1)
+
+    server = make_server("127.0.0.1", 0, node.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    violations = []
+
+    def watch():
+        while not stop.is_set():
+            if node.sessions.count > args.capacity:
+                violations.append(node.sessions.count)
+            time.sleep(0.0005)
+
+    stop = threading.Event()
+    # One tally per worker, summed after the join (no shared counters to race on)
+    per_thread = [{"ok": 0, "full": 0, "leaked": 0} for _ in range(args.threads)]
+    threads = [threading.Thread(target=worker, args=(base, stop, args.ttl, tallies))
+               for tallies in per_thread]
+    threading.Thread(target=watch, daemon=True).start()
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    tallies = {k: sum(t[k] for t in per_thread) for k in per_thread[0]}
+
+    time.sleep(args.ttl + 0.5)
+    stats = requests.get(base + "/sessions").json()
+    server.shutdown()
+
+    print(f"admitted={tallies['ok']} rejected={tallies['full']} crashed={tallies['leaked']}")
+    print(f"peak={stats['peak']} capacity={stats['capacity']} expired={stats['expired']} "
+          f"left_after_ttl={stats['current']} admission_us={stats.get('admission_us')}")
+
+    failed = False
+    if stats["peak"] > args.capacity or violations:
+        print(f"FAIL: overbooked (peak {stats['peak']}, observed {violations[:5]})")
+        failed = True
+    if stats["current"] != 0:
+        print(f"FAIL: {stats['current']} leases survived their TTL")
+        failed = True
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Cost of sharing node status between processes (shared.py, --workers N).
+
+- put:            writer publishing one node's status dict
+- changes (all):  a worker syncing after every row changed
+- changes (few):  a worker syncing after --dirty rows changed
+- changes (none): the idle poll every SHARED_SYNC_INTERVAL
+- settings():     panic/maintenance lookup per request, unchanged document
+
+Then a forked writer rewrites one row as fast as it can while this process
+reads it back, checking no read mixes two writes (each write sets every
+numeric field to the same counter). Last, --procs reader processes each pick
+nodes from their own NodeIndex fed from the table; picks/s scale with cores
+(os.cpu_count() is printed, on one core the total stays flat).
+
+    python bench/shared_status.py --nodes 10000 --dirty 50 --procs 4
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selector import NodeIndex
+from shared import SharedStatus
+
+
+def make_status(rng, i):
+    return {
+        "ip": f"10.0.{i // 256}.{i % 256}", "web_port": 8000, "alive": True,
+        "ping": round(rng.uniform(1, 80), 2), "probe_ms": round(rng.uniform(5, 120), 2),
+        "users": rng.randint(0, 100), "max": 100, "load": round(rng.uniform(0, 100), 1),
+        "temp": 50.0, "watts": 120.0, "region": "EU",
+        "location": {"lat": 45.5, "lon": -73.6, "city": "Montreal"},
+        "maintenance": False, "weight": 1.0, "score": round(rng.uniform(1, 200), 2),
+    }
+
+
+def per_call(fn, count):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def torn_check(path, seconds):
+    writer = SharedStatus.open(path)
+    writer.rows = {"NODE-0": 0}
+    writer.put("NODE-0", {"users": 0, "max": 0, "load": 0, "ping": 0, "score": 0, "alive": True})
+    pid = os.fork()
+    if pid == 0:
+        i, end = 0, time.time() + seconds
+        while time.time() < end:
+            i += 1
+            writer.put("NODE-0", {"users": i, "max": i, "load": i, "ping": i, "score": i, "alive": True})
+        os._exit(0)
+    reader = SharedStatus.open(path)
+    reads = torn = 0
+    while not os.waitpid(pid, os.WNOHANG)[0]:
+        r = reader.read(0)
+        reads += 1
+        if not r["users"] == r["max"] == r["load"] == r["ping"] == r["score"]:
+            torn += 1
+    return reads, torn
+
+
+def picker(path, seconds, out):
+    table = SharedStatus.open(path)
+    index = NodeIndex()
+    for name, record in table.changes():
+        index.update(name, {"alive": record["alive"], "maintenance": record["maintenance"],
+                            "load": record["load"], "ping": record["ping"], "users": record["users"],
+                            "max": record["max"], "score": record["score"], "ip": record["ip"]})
+    picks, end = 0, time.time() + seconds
+    while time.time() < end:
+        for _ in range(1000):
+            if table.settings().get("panic", {}).get("enabled"):
+                continue
+            index.best()
+        picks += 1000
+        table.changes()
+    os.write(out, f"{picks}\n".encode())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--dirty", type=int, default=50, help="rows changed between two syncs")
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=2)
+    args = parser.parse_args()
+    rng = random.Random(5)
+
+    path = os.path.join(tempfile.gettempdir() if not os.path.isdir("/dev/shm") else "/dev/shm",
+                        f"mesh-bench-{os.getpid()}.status")
+    writer = SharedStatus.create(path, args.nodes)
+    try:
+        writer.update_settings(lambda doc: doc.update(panic={"enabled": False, "url": "https://google.com"},
+                                                      nodes={}))
+        statuses = [make_status(rng, i) for i in range(args.nodes)]
+        names = [f"NODE-{i}" for i in range(args.nodes)]
+        reader = SharedStatus.open(path)
+
+        print(f"{args.nodes} nodes, record {writer.stride} B, file {os.path.getsize(path) / 2**20:.1f} MiB")
+        print(f"put              {per_call(lambda: [writer.put(n, s) for n, s in zip(names, statuses)], args.nodes):>7.2f} us/node")
+        print(f"changes (all)    {per_call(reader.changes, args.nodes):>7.2f} us/node")
+        for i in rng.sample(range(args.nodes), args.dirty):
+            writer.put(names[i], statuses[i])
+        print(f"changes ({args.dirty:>3})    {per_call(reader.changes, 1) / 1000:>7.2f} ms/sync")
+        print(f"changes (none)   {per_call(lambda: [reader.changes() for _ in range(10000)], 10000):>7.2f} us/sync")
+        print(f"settings()       {per_call(lambda: [reader.settings() for _ in range(100000)], 100000):>7.2f} us/call")
+
+        reads, torn = torn_check(path, args.seconds)
+        print(f"seqlock: {reads} reads against a concurrent writer, {torn} torn")
+
+        for i in range(args.nodes):
+            writer.put(names[i], statuses[i])
+        print(f"cpu_count {os.cpu_count()}")
+        for procs in sorted({1, args.procs}):
+            pipes, pids = [], []
+            for _ in range(procs):
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(r)
+                    picker(path, args.seconds, w)
+                    os._exit(0)
+                os.close(w)
+                pipes.append(r)
+                pids.append(pid)
+            total = 0
+            for r, pid in zip(pipes, pids):
+                os.waitpid(pid, 0)
+                total += int(os.read(r, 64) or b"0")
+                os.close(r)
+            print(f"{procs} reader process(es): {total / args.seconds:,.0f} picks/s")
+    finally:
+        writer.unlink()
+
+
+if __name__ == "__main__":
+    main()
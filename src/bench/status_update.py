@@ -0,0 +1,158 @@
+"""
+Controller cost of taking in one sweep of /stats answers, per 10k nodes:
+
+- json + dicts:  json.loads, then a fresh status dict per node (the old update_status)
+- json + table:  json.loads into StatusTable columns (agents that only speak JSON)
+- binary + table: statwire record straight into StatusTable columns
+
+Each path also scores the node (ScoreEngine) and updates NodeIndex, like
+brain.py; every sweep moves each node's load a little. json + table is
+the one path slower than the old dicts (JSON-only agents pay for the
+columns with nothing to parse faster); binary + table is the fast path. StatusBroadcaster
+is left out, it gets a plain dict either way. Parse-only costs are shown
+separately. Retained memory is the status
+store after the sweep (tracemalloc).
+
+    python bench/status_update.py --nodes 10000 --rounds 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import statwire
+from scoring import ScoreEngine
+from selector import NodeIndex
+from statustable import StatusTable
+
+
+def make_stats(rng, i):
+    return {
+        "name": f"NODE-{i}",
+        "region": rng.choice(["NA-EAST", "EU", "ASIA"]),
+        "max_users": 100,
+        "current_users": rng.randint(0, 100),
+        "cpu_load": round(rng.uniform(0, 100), 1),
+        "ram_usage": round(rng.uniform(10, 90), 1),
+        "temp": round(rng.uniform(35, 80), 1) if rng.random() < 0.8 else None,
+        "watts": round(rng.uniform(60, 300), 2),
+        "location": {"lat": rng.uniform(-60, 70), "lon": rng.uniform(-180, 180), "city": "Somewhere"},
+        "status": "online",
+    }
+
+
+def dict_sweep(nodes, bodies, status, scorer, index, now):
+    for node, body in zip(nodes, bodies):
+        data = json.loads(body)
+        name = node['name']
+        status[name] = scorer.annotate(name, {
+            "ip": node['ip'],
+            "web_port": node['web_port'],
+            "alive": True,
+            "ping": 3.0,
+            "probe_ms": 3.0,
+            "users": data.get('current_users', 0),
+            "max": data.get('max_users', 100),
+            "load": data.get('cpu_load', 0),
+            "temp": data.get('temp'),
+            "watts": data.get('watts', 0),
+            "location": data.get('location', {}),
+            "region": data.get('region'),
+            "maintenance": False,
+            "weight": 1.0,
+        }, now)
+        index.update(name, status[name])
+
+
+def table_sweep(nodes, payloads, table, scorer, index, now, binary):
+    for node, payload in zip(nodes, payloads):
+        name = node['name']
+        row = table.row(name)
+        if binary:
+            table.load_packed(row, payload)
+        else:
+            table.load_stats(row, json.loads(payload))
+        table.set_up(row, node['ip'], node['web_port'], 3.0, False, 1.0, now)
+        index.update_scored(name, table.annotate(row, scorer, now), *table.routing(row))
+
+
+def timed(fn, rounds):
+    best = float("inf")
+    for r in range(rounds):
+        start = time.perf_counter()
+        fn(r)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def retained(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del store
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(3)
+
+    nodes = [{"name": f"NODE-{i}", "ip": f"10.0.{i // 256}.{i % 256}", "web_port": 8000}
+             for i in range(args.nodes)]
+    stats = [make_stats(rng, i) for i in range(args.nodes)]
+    bodies = [json.dumps(s, separators=(",", ":")).encode() for s in stats]
+    records = [statwire.encode(s) for s in stats]
+    # A second generation with new load/users, sweeps alternate so every update changes something
+    for s in stats:
+        s["cpu_load"] = round(min(100.0, s["cpu_load"] + rng.uniform(1, 5)), 1)
+        s["current_users"] = min(100, s["current_users"] + 1)
+    bodies = (bodies, [json.dumps(s, separators=(",", ":")).encode() for s in stats])
+    records = (records, [statwire.encode(s) for s in stats])
+    per = 10000 / args.nodes
+
+    print(f"{args.nodes} nodes: JSON body {sum(map(len, bodies[0])) / args.nodes:.0f} B, "
+          f"statwire record {sum(map(len, records[0])) / args.nodes:.0f} B")
+    print(f"{'path':<16} {'ms/10k':>8} {'us/node':>8}")
+
+    def row(label, seconds):
+        print(f"{label:<16} {seconds * 1000 * per:>8.1f} {seconds / args.nodes * 1e6:>8.2f}")
+
+    row("parse json", timed(lambda r: [json.loads(b) for b in bodies[r % 2]], args.rounds))
+    row("parse binary", timed(lambda r: [statwire.unpack(p) for p in records[r % 2]], args.rounds))
+
+    status, scorer, index = {}, ScoreEngine(), NodeIndex()
+    row("json + dicts", timed(lambda r: dict_sweep(nodes, bodies[r % 2], status, scorer, index,
+                                                   1000.0 + r * 3), args.rounds))
+    table, scorer, index = StatusTable(), ScoreEngine(), NodeIndex()
+    row("json + table", timed(lambda r: table_sweep(nodes, bodies[r % 2], table, scorer, index,
+                                                    1000.0 + r * 3, False), args.rounds))
+    table, scorer, index = StatusTable(), ScoreEngine(), NodeIndex()
+    row("binary + table", timed(lambda r: table_sweep(nodes, records[r % 2], table, scorer, index,
+                                                      1000.0 + r * 3, True), args.rounds))
+
+    def build_dicts():
+        store = {}
+        dict_sweep(nodes, bodies[0], store, ScoreEngine(), NodeIndex(), 0.0)
+        return store
+
+    def build_table():
+        store = StatusTable()
+        table_sweep(nodes, records[0], store, ScoreEngine(), NodeIndex(), 0.0, True)
+        return store
+
+    print(f"retained: dicts {retained(build_dicts) / 2**20:.1f} MiB, "
+          f"table {retained(build_table) / 2**20:.1f} MiB (incl. scorer and index)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,32 @@
-import requests
 import time
 import threading
-import sqlite3
-import json
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, render_template, request
+import argparse
+import os
+import socket
+from flask import Flask, Response, jsonify, render_template, request
 from flask_cors import CORS 
+from prober import MeshProber
+from selector import NodeIndex
+from scoring import ScoreEngine
+from latency import LatencyProber
+from balancing import affinity_key, make_strategy
+from history import HistoryStore
+from telemetry import TelemetryReceiver
+from stream import StatusBroadcaster
+from statustable import StatusTable
+from shared import SharedStatus, default_path, fork_workers, wait_workers
+from membership import ALIVE, SUSPECT, Membership
+import metrics
 
 app = Flask(__name__, static_folder='static') 
 
 DB_FILE = "mesh_history.db"
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS history 
-                 (timestamp INTEGER, node_name TEXT, cpu_load REAL, ping REAL, users INTEGER)''')
-    conn.commit()
-    conn.close()
+# History: 24h retention in 1h partitions (see history.py)
+HISTORY_RETENTION = 86400
+HISTORY_PARTITION = 3600
 
-init_db()
+HISTORY = HistoryStore(DB_FILE, retention=HISTORY_RETENTION, partition=HISTORY_PARTITION)
 
 
 
@@ -52,60 +59,355 @@ NODES = [
     }
 ]
 
-SERVER_STATUS = {}
+# Predictive scoring (see scoring.py): smoothed, trend-projected ping + load
+SCORE_HALF_LIFE = 10        # seconds for a sample's weight to halve
+SCORE_HORIZON = 30          # seconds ahead the score is projected
+SCORE_HYSTERESIS = 0.08    # "best" only switches node for an 8% better score
+SCORE_SEED_SAMPLES = 100    # history rows per node replayed at startup
+SCORER = ScoreEngine(half_life=SCORE_HALF_LIFE, horizon=SCORE_HORIZON)
+
+# Node status, one column per field (see statustable.py); SERVER_STATUS[name] is a live row view
+SERVER_STATUS = StatusTable()
+STATUS_INDEX = NodeIndex(hysteresis=SCORE_HYSTERESIS)
+BROADCAST = StatusBroadcaster()
+# Balancing: "best", "p2c", "least-outstanding", "weighted-rr" (uses NODE_SETTINGS weight)
+# or "consistent-hash" (sticky per AFFINITY key, weighted by weight * max users)
+# or "geo" (nearest node to the client, located through GEOIP_DB, see geo.py).
+# The brain only hands out addresses and never sees a request finish, so its
+# in-flight counts stay at zero and "p2c"/"least-outstanding" pick by score
+# among random pairs / everyone; "best" is the right default here.
+BALANCING = "best"
+AFFINITY = ("cookie:PHPSESSID", "ip")   # first source present is the key, see balancing.affinity_key
+GEOIP_DB = "geoip.csv"                  # offline IP-prefix database: network,lat,lon,region,city
+GEO_KEY = ("header:X-Forwarded-For", "ip")
+KEY_SPEC = GEO_KEY if BALANCING == "geo" else AFFINITY
+BALANCER = make_strategy(BALANCING, STATUS_INDEX, geoip=GEOIP_DB)
 NODE_SETTINGS = {} 
 PANIC_MODE = {"enabled": False, "url": "https://google.com"} 
+BROADCAST.publish_panic(PANIC_MODE)
 
-def monitor_mesh():
+# Multi-process serving (python brain.py --workers N, see shared.py): this
+# process probes and writes every row to SHARED; N forked workers serve HTTP
+# on the same port and mirror the rows every SHARED_SYNC_INTERVAL. Panic mode
+# and per-node maintenance/weight live in SHARED's settings document, so a
+# control request handled by any worker applies to all of them. Gossip and
+# metrics are published to SHARED's slots every SHARED_PUBLISH_INTERVAL, so
+# /api/members and /metrics on a worker lag this process by up to that much.
+SHARED = None
+IS_WORKER = False
+SHARED_SLOT = 0             # this process's slot in SHARED: 0 here, i + 1 in worker i
+SHARED_CAPACITY = 4096      # max nodes in the shared table
+SHARED_SYNC_INTERVAL = 0.05
+SHARED_PUBLISH_INTERVAL = 1.0
+APPLIED_SETTINGS = None
+
+# Probe engine tuning (see prober.py)
+PROBE_INTERVAL = 3          # seconds between probes of the same node
+PROBE_JITTER = 0.2          # +/- fraction of the interval, per node
+PROBE_TIMEOUT = 2           # per-request timeout
+PROBE_DEADLINE = 2.5        # hard cap on a whole sweep
+PROBE_CONCURRENCY = 100     # max probes in flight
+PROBE_BINARY = True         # ask agents for the compact statwire record (older agents answer JSON)
+
+# Push telemetry (see telemetry.py). Nodes with "push_to" in their config.yaml
+# stream stats over UDP; they are only polled every PUSH_PROBE_INTERVAL for ping.
+# Off by default like gossip: pushes move routing state, so they are only accepted
+# when signed with PUSH_SECRET, the HMAC key shared with the nodes.
+PUSH_ENABLED = False
+PUSH_PORT = 5005
+PUSH_STALE_AFTER = 3        # seconds without a datagram before a node is stale
+PUSH_PROBE_INTERVAL = 30
+PUSH_HISTORY_INTERVAL = PROBE_INTERVAL
+PUSH_SECRET = os.environ.get("MESH_PUSH_SECRET")    # same value in every node's config.yaml push_secret
+
+NODE_BY_ADDR = {(n['ip'], n['agent_port']): n for n in NODES}
+LAST_PUSH_ROW = {}
+
+# Network latency (see latency.py): a UDP echo to each node agent every
+# LATENCY_INTERVAL (TCP connect timing, once per PROBE_INTERVAL, for agents
+# that don't answer). Its
+# rolling p50 is the "ping" used for routing; the /stats round trip, which
+# includes HTTP and the agent's own work, is kept as probe_ms.
+LATENCY_ENABLED = True
+LATENCY_INTERVAL = 1        # seconds between rounds
+LATENCY_TIMEOUT = 1         # a probe not answered within this counts as lost
+LATENCY_WINDOW = 64         # samples per node in the percentile window
+LATENCY = LatencyProber(
+    lambda: [(n['name'], n['ip'], n['agent_port']) for n in NODES],
+    mode="udp",
+    interval=LATENCY_INTERVAL,
+    timeout=LATENCY_TIMEOUT,
+    window=LATENCY_WINDOW,
+    tcp_interval=PROBE_INTERVAL,
+) if LATENCY_ENABLED else None
+
+# Instrumentation (scraped from /metrics, see metrics.py)
+SELECT_SECONDS = metrics.Histogram("mesh_select_seconds", "Time to choose a node for /api/get-best")
+PUSH_UPDATES = metrics.Counter("mesh_push_updates_total", "Telemetry pushes applied", ["node"])
+metrics.Gauge("mesh_nodes_alive", "Nodes currently marked alive").set_function(
+    SERVER_STATUS.alive_count)
+metrics.Gauge("mesh_node_score", "Predicted routing score per node (lower is better)", ["node"]).collect_from(
+    SCORER.snapshot)
+metrics.Gauge("mesh_history_queue_batches", "Batches waiting for the history writer").set_function(
+    lambda: HISTORY.queue.qsize())
+metrics.Gauge("mesh_history_dropped_rows", "History rows dropped because the writer queue was full").set_function(
+    lambda: HISTORY.dropped)
+metrics.Gauge("mesh_rtt_p50_ms", "Rolling median network RTT per node (latency.py)", ["node"]).collect_from(
+    lambda: {name: s['p50'] for name, s in LATENCY.snapshot().items()} if LATENCY is not None else {})
+
+def set_status(name, status):
+    """Publishes a SERVER_STATUS row after it changed: keeps the index and /api/stream in sync."""
+    STATUS_INDEX.update_scored(name, status, *SERVER_STATUS.routing(status.row))
+    snapshot = SERVER_STATUS.snapshot(status.row)
+    BROADCAST.publish(name, snapshot)
+    if SHARED is not None and not IS_WORKER:
+        SHARED.put(name, snapshot)
+
+def current_panic():
+    """Panic mode as every process sees it (one integer read when nothing changed)."""
+    return SHARED.settings().get('panic', PANIC_MODE) if SHARED is not None else PANIC_MODE
+
+def apply_node_settings(name, settings):
+    NODE_SETTINGS.setdefault(name, {"maintenance": False, "weight": 1.0}).update(settings)
+    if name in SERVER_STATUS and SERVER_STATUS[name].get('alive'):
+        SERVER_STATUS[name].update(**settings)
+        set_status(name, SERVER_STATUS[name])
+
+def apply_settings(doc):
+    """Brings PANIC_MODE and NODE_SETTINGS up to a shared settings document."""
+    global APPLIED_SETTINGS
+    if doc is APPLIED_SETTINGS:
+        return
+    APPLIED_SETTINGS = doc
+    panic = doc.get('panic')
+    if panic is not None and panic != PANIC_MODE:
+        PANIC_MODE.update(panic)
+        BROADCAST.publish_panic(PANIC_MODE)
+    for name, settings in doc.get('nodes', {}).items():
+        if NODE_SETTINGS.get(name) != settings:
+            apply_node_settings(name, settings)
+
+def change_node_settings(name, **changes):
+    if SHARED is None:
+        apply_node_settings(name, changes)
+        return
+    def change(doc):
+        nodes = doc.setdefault('nodes', {})
+        nodes[name] = dict(NODE_SETTINGS.get(name, {"maintenance": False, "weight": 1.0}), **nodes.get(name, {}))
+        nodes[name].update(changes)
+    apply_settings(SHARED.update_settings(change))
+
+def change_panic(**changes):
+    if SHARED is None:
+        PANIC_MODE.update(changes)
+        BROADCAST.publish_panic(PANIC_MODE)
+        return
+    apply_settings(SHARED.update_settings(lambda doc: doc.setdefault('panic', dict(PANIC_MODE)).update(changes)))
+
+def follow_shared():
+    """
+    --workers: workers mirror the writer's rows into their own SERVER_STATUS
+    and index; every process (the writer too) follows the settings document.
+    """
+    while True:
+        try:
+            if IS_WORKER:
+                for name, record in SHARED.changes():
+                    if record is not None:
+                        row = SERVER_STATUS.row(name)
+                        SERVER_STATUS.load_record(row, record)
+                        if record['alive'] and name in NODE_SETTINGS:
+                            # The writer may not have applied a settings change yet
+                            SERVER_STATUS[name].update(**NODE_SETTINGS[name])
+                        set_status(name, SERVER_STATUS[name])
+                    elif name in SERVER_STATUS:
+                        forget_node(name)
+            apply_settings(SHARED.settings())
+        except Exception as e:
+            print(f"Shared status sync failed: {e}")
+        time.sleep(SHARED_SYNC_INTERVAL)
+
+def publish_shared():
+    """--workers: every process publishes its metrics to its SHARED slot, this one its gossip view too."""
     while True:
-        timestamp = int(time.time())
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        try:
+            doc = {"metrics": metrics.REGISTRY.collect()}
+            if not IS_WORKER:
+                doc["members"] = MEMBERSHIP.snapshot() if MEMBERSHIP is not None else []
+            SHARED.publish(SHARED_SLOT, doc)
+        except Exception as e:
+            print(f"Shared publish failed: {e}")
+        time.sleep(SHARED_PUBLISH_INTERVAL)
+
+def update_status(node, latency, data):
+    """data is the /stats JSON dict or a statwire record (bytes); returns the row view."""
+    name = node['name']
 
-        for node in NODES:
-            name = node['name']
-            
-            if name not in NODE_SETTINGS:
-                NODE_SETTINGS[name] = {"maintenance": False, "weight": 1.0}
+    if name not in NODE_SETTINGS:
+        NODE_SETTINGS[name] = {"maintenance": False, "weight": 1.0}
 
+    row = SERVER_STATUS.row(name)
+    if isinstance(data, bytes):
+        SERVER_STATUS.load_packed(row, data)
+    else:
+        SERVER_STATUS.load_stats(row, data)
+    now = time.time()
+    settings = NODE_SETTINGS[name]
+    SERVER_STATUS.set_up(row, node['ip'], node['web_port'], latency, settings['maintenance'], settings['weight'], now)
+    status = SERVER_STATUS[name]
+    rtt = LATENCY.stats(name) if LATENCY is not None else None
+    if rtt is not None:
+        status.update(ping=rtt['p50'], rtt_p95=rtt['p95'], jitter=rtt['jitter'], loss=rtt['loss'])
+    else:
+        status.update(rtt_p95=None, jitter=None, loss=None)
+    set_status(name, SERVER_STATUS.annotate(row, SCORER, now))
+    return status
+
+def forget_node(name):
+    """The node left the mesh: drop its row, index entry, ring/tree place, shared slot and dashboard card."""
+    SERVER_STATUS.remove(name)
+    STATUS_INDEX.remove(name)
+    BALANCER.forget(name)
+    LAST_PUSH_ROW.pop(name, None)
+    BROADCAST.remove(name)
+    if SHARED is not None and not IS_WORKER:
+        SHARED.remove(name)
+
+def mark_down(node, error):
+    name = node['name']
+    if name not in NODE_SETTINGS:
+        NODE_SETTINGS[name] = {"maintenance": False, "weight": 1.0}
+    SERVER_STATUS.set_down(SERVER_STATUS.row(name), error)
+    set_status(name, SERVER_STATUS[name])
+
+def record_sweep(results):
+    timestamp = int(time.time())
+    rows = []
+
+    for node, latency, data, error in results:
+        if NODE_BY_ADDR.get((node['ip'], node['agent_port'])) is not node:
+            continue    # left the mesh while this sweep was running
+        if data is not None:
             try:
-                start = time.time()
-                r = requests.get(f"http://{node['ip']}:{node['agent_port']}/stats", timeout=2)
-                latency = round((time.time() - start) * 1000, 2)
-                
-                if r.status_code == 200:
-                    data = r.json()
-                    
-                    SERVER_STATUS[name] = {
-                        "ip": node['ip'],
-                        "web_port": node['web_port'],
-                        "alive": True,
-                        "ping": latency,
-                        "users": data.get('current_users', 0),
-                        "max": data.get('max_users', 100),
-                        "load": data.get('cpu_load', 0),
-                        "temp": data.get('temp'),
-                        "watts": data.get('watts', 0),
-                        "location": data.get('location', {}),
-                        "maintenance": NODE_SETTINGS[name]['maintenance']
-                    }
-
-                    cursor.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?)", 
-                                   (timestamp, name, data.get('cpu_load',0), latency, data.get('current_users',0)))
-                else:
-                    raise Exception("Bad Status")
-            except Exception as e:
-                SERVER_STATUS[name] = {"alive": False, "ping": 9999, "error": str(e), "maintenance": False}
-
-        conn.commit()
-        conn.close()
-        
-        if timestamp % 3600 == 0:
-             with sqlite3.connect(DB_FILE) as clean_conn:
-                 cutoff = timestamp - 86400
-                 clean_conn.execute("DELETE FROM history WHERE timestamp < ?", (cutoff,))
-
-        time.sleep(3) 
+                status = update_status(node, latency, data)
+            except (ValueError, TypeError, OverflowError) as e:     # malformed record
+                mark_down(node, str(e))
+                continue
+            rows.append((timestamp, node['name'], status['load'], status['ping'], status['users']))
+        else:
+            mark_down(node, error)
+
+    if rows:
+        HISTORY.submit(rows)
+
+def on_push(key, sender_name, data):
+    node = NODE_BY_ADDR.get(key)
+    if node is None:
+        return  # not a node we manage
+    name = node['name']
+
+    # Ping comes from the latency prober (or the slow /stats probe); until the first probe lands, wait for it
+    previous = SERVER_STATUS.get(name, {})
+    if not previous.get('alive'):
+        PROBER.poke(name)
+        return
+    status = update_status(node, previous.get('probe_ms', previous['ping']), data)
+    PUSH_UPDATES.labels(name).inc()
+
+    now = time.time()
+    if now - LAST_PUSH_ROW.get(name, 0) >= PUSH_HISTORY_INTERVAL:
+        LAST_PUSH_ROW[name] = now
+        HISTORY.submit([(int(now), name, status['load'], status['ping'], status['users'])])
+
+def on_push_stale(key):
+    node = NODE_BY_ADDR.get(key)
+    if node is None:
+        return
+    mark_down(node, "Telemetry stale")
+    PROBER.poke(node['name'])
+
+def probe_interval(node):
+    if TELEMETRY is not None and TELEMETRY.is_fresh((node['ip'], node['agent_port'])):
+        return PUSH_PROBE_INTERVAL
+    return PROBE_INTERVAL
+
+TELEMETRY = TelemetryReceiver(PUSH_PORT, on_push, on_push_stale, PUSH_SECRET,
+                              stale_after=PUSH_STALE_AFTER) if PUSH_ENABLED else None
+
+PROBER = MeshProber(
+    NODES,
+    interval=PROBE_INTERVAL,
+    jitter=PROBE_JITTER,
+    timeout=PROBE_TIMEOUT,
+    deadline=PROBE_DEADLINE,
+    concurrency=PROBE_CONCURRENCY,
+    interval_for=probe_interval,
+    binary=PROBE_BINARY,
+)
+
+def monitor_mesh():
+    PROBER.run_forever(record_sweep)
+
+# Membership (see membership.py): node agents with "seeds" in their config.yaml
+# join over gossip and are added at runtime, NODES above is only the bootstrap list.
+# Gossip also takes over failure detection for them: a dead member is marked
+# down and dropped from the prober until it rejoins.
+# Off by default: gossip decides where traffic goes, so it is only enabled together
+# with GOSSIP_SECRET, the shared HMAC key every member signs its datagrams with.
+GOSSIP_ENABLED = False
+GOSSIP_PORT = 7946
+GOSSIP_SEEDS = []           # other controllers, "host:port"; nodes use us as their seed
+GOSSIP_SECRET = os.environ.get("MESH_GOSSIP_SECRET")    # same value in every node's config.yaml gossip_secret
+NODES_LOCK = threading.Lock()
+
+def set_nodes(nodes):
+    """Copy-on-write swap of the node list the prober and push handler read."""
+    global NODES, NODE_BY_ADDR
+    names = {n['name'] for n in nodes}
+    removed = [n['name'] for n in NODES if n['name'] not in names]
+    NODE_BY_ADDR = {(n['ip'], n['agent_port']): n for n in nodes}
+    NODES = nodes
+    PROBER.nodes = nodes
+    for name in removed:
+        forget_node(name)
+
+def on_member(member):
+    if member.meta.get('role') != 'node' or not member.host:
+        return
+    name = member.name
+    with NODES_LOCK:
+        current = next((n for n in NODES if n['name'] == name), None)
+        others = [n for n in NODES if n['name'] != name]
+        if member.status in (ALIVE, SUSPECT):
+            node = {
+                "name": name,
+                "ip": member.host,
+                "agent_port": member.meta.get('port', 5001),
+                "web_port": member.meta.get('web_port', 8000),
+                "gossip": True,
+            }
+            if current == node:
+                return
+            set_nodes(others + [node])
+        elif current is not None and current.get('gossip'):
+            set_nodes(others)
+        else:
+            return
+
+    if member.status in (ALIVE, SUSPECT):
+        print(f"Membership: {name} joined from {member.host}")
+        PROBER.poke(name)
+    else:
+        print(f"Membership: {name} {member.status}")
+
+MEMBERSHIP = Membership(
+    f"controller-{socket.gethostname()}",
+    GOSSIP_PORT,
+    {"role": "controller", "service": "brain"},
+    seeds=GOSSIP_SEEDS,
+    secret=GOSSIP_SECRET,
+    on_change=on_member,
+) if GOSSIP_ENABLED else None
 
 
 
@@ -116,66 +418,231 @@ def view_dashboard():
 @app.route('/api/stats')
 def api_stats():
     return jsonify({
-        "nodes": SERVER_STATUS,
-        "panic": PANIC_MODE
+        "nodes": SERVER_STATUS.as_dict(),
+        "panic": current_panic()
     })
 
+@app.route('/api/members')
+def api_members():
+    """Gossip membership as this controller sees it."""
+    if IS_WORKER:
+        return jsonify((SHARED.published(0) or {}).get("members", []))
+    return jsonify(MEMBERSHIP.snapshot() if MEMBERSHIP is not None else [])
+
+@app.route('/api/stream')
+def api_stream():
+    """SSE: one "snapshot" event, then "node"/"panic" events as things change."""
+    return Response(BROADCAST.events(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+RESOLUTIONS = {"raw": 0, "1m": 60, "10m": 600, "1h": 3600}
+
 @app.route('/api/history/<node_name>')
 def api_history(node_name):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT timestamp, cpu_load, ping FROM history WHERE node_name=? ORDER BY timestamp DESC LIMIT 50", (node_name,))
-    rows = c.fetchall()
-    conn.close()
-    
-    data = [{"time": r[0], "load": r[1], "ping": r[2]} for r in rows][::-1]
-    return jsonify(data)
+    """
+    Without parameters: the last 50 raw samples.
+    ?from=&to= (unix seconds, 'to' defaults to now) returns the range, served
+    from the coarsest tier that fits; ?resolution=raw|1m|10m|1h|<seconds>
+    caps how coarse that tier may be.
+    """
+    if 'from' not in request.args and 'resolution' not in request.args:
+        rows = HISTORY.recent(node_name, 50)
+        data = [{"time": r[0], "load": r[1], "ping": r[2]} for r in rows]
+        return jsonify(data)
+
+    now = int(time.time())
+    try:
+        end = int(request.args.get('to', now))
+        start = int(request.args.get('from', end - 3600))
+        resolution = request.args.get('resolution')
+        if resolution is not None:
+            resolution = RESOLUTIONS[resolution] if resolution in RESOLUTIONS else int(resolution)
+    except (KeyError, ValueError):
+        return jsonify({"error": "from/to must be unix seconds, resolution raw|1m|10m|1h|<seconds>"}), 400
+    if start > end:
+        return jsonify({"error": "'from' is after 'to'"}), 400
+
+    width, rows = HISTORY.query(node_name, start, end, resolution)
+    if width == 0:
+        points = [{"time": r[0], "load": r[1], "ping": r[2], "users": r[3]} for r in rows]
+    else:
+        points = [{
+            "time": r[0], "samples": r[1],
+            "load": r[4], "load_min": r[2], "load_max": r[3],
+            "ping": r[7], "ping_min": r[5], "ping_max": r[6],
+            "users": r[10], "users_min": r[8], "users_max": r[9],
+        } for r in rows]
+    return jsonify({"node": node_name, "from": start, "to": end, "resolution": width, "points": points})
 
 @app.route('/api/control/maintenance', methods=['POST'])
 def toggle_maintenance():
     data = request.json
     name = data.get('node')
     enabled = data.get('enabled')
-    if name in NODE_SETTINGS:
-        NODE_SETTINGS[name]['maintenance'] = enabled
+    if name in SERVER_STATUS:
+        change_node_settings(name, maintenance=enabled)
+        return jsonify({"success": True})
+    return jsonify({"error": "Node not found"}), 404
+
+@app.route('/api/control/weight', methods=['POST'])
+def set_weight():
+    data = request.json
+    name = data.get('node')
+    try:
+        weight = float(data.get('weight'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "weight must be a number"}), 400
+    if weight < 0:
+        return jsonify({"error": "weight must be >= 0"}), 400
+    if name in SERVER_STATUS:
+        change_node_settings(name, weight=weight)
         return jsonify({"success": True})
     return jsonify({"error": "Node not found"}), 404
 
 @app.route('/api/control/panic', methods=['POST'])
 def toggle_panic():
     data = request.json
-    PANIC_MODE['enabled'] = data.get('enabled', False)
+    changes = {"enabled": data.get('enabled', False)}
     if 'url' in data:
-        PANIC_MODE['url'] = data['url']
-    return jsonify({"success": True, "state": PANIC_MODE})
+        changes['url'] = data['url']
+    change_panic(**changes)
+    return jsonify({"success": True, "state": current_panic()})
+
+@app.route('/metrics')
+def view_metrics():
+    if IS_WORKER:
+        return metrics.flask_response(metrics.merge(
+            SHARED.gather("metrics", SHARED_SLOT, metrics.REGISTRY.collect())))
+    return metrics.flask_response()
+
+def best_target(key=None):
+    """(payload, status) for /api/get-best, shared by the Flask and ASGI handlers."""
+    panic = current_panic()
+    if panic['enabled']:
+        return {"panic": True, "redirect_url": panic['url']}, 200
+
+    start = time.perf_counter()
+    best = BALANCER.pick(key)
+    SELECT_SECONDS.observe(time.perf_counter() - start)
+
+    if best:
+        return {"ip": best['ip'], "port": best['web_port']}, 200
+
+    return {"error": "No servers available"}, 503
 
 @app.route('/api/get-best')
 def api_get_best():
-    if PANIC_MODE['enabled']:
-        return jsonify({"panic": True, "redirect_url": PANIC_MODE['url']})
+    key = affinity_key(KEY_SPEC, request.headers.get, request.remote_addr) if BALANCER.uses_key else None
+    payload, status = best_target(key)
+    return jsonify(payload), status
 
-    best = None
-    lowest_score = float('inf')
-    
-    for name, s in SERVER_STATUS.items():
-        if s.get('alive') and not s.get('maintenance') and s.get('users', 0) < s.get('max', 100):
-            score = s['ping'] + (s.get('load', 0) * 2)
-            if score < lowest_score:
-                lowest_score = score
-                best = s
-                
-    if best:
-        return jsonify({"ip": best['ip'], "port": best['web_port']})
-        
-    return jsonify({"error": "No servers available"}), 503
+# ASYNC SERVING MODE (python brain.py --async)
+def make_asgi_app():
+    """
+    The client-facing hot paths (/api/get-best, /api/stats, /api/stream) run
+    natively on the event loop, so open dashboards no longer each hold a
+    thread; the rest of the API and the dashboard page go through Flask.
+    """
+    from asgi import Router, header, send_json
+
+    router = Router(app)
+
+    @router.route('/api/get-best')
+    async def get_best_async(scope, receive, send):
+        key = None
+        if BALANCER.uses_key:
+            client = scope.get("client")
+            key = affinity_key(KEY_SPEC, lambda n: header(scope, n), client[0] if client else None)
+        payload, status = best_target(key)
+        await send_json(send, payload, status)
+
+    @router.route('/api/stats')
+    async def stats_async(scope, receive, send):
+        await send_json(send, {"nodes": SERVER_STATUS.as_dict(), "panic": current_panic()})
+
+    @router.route('/api/stream')
+    async def stream_async(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        events = BROADCAST.aevents()
+        try:
+            async for message in events:
+                await send({"type": "http.response.body", "body": message, "more_body": True})
+        except OSError:
+            pass  # client went away
+        finally:
+            await events.aclose()
+
+    return router
+
+def serve(async_mode, port, sock=None):
+    """Runs the HTTP server; with sock, on that already-bound listener (a --workers child)."""
+    if async_mode:
+        import uvicorn
+        if sock is not None:
+            uvicorn.run(make_asgi_app(), fd=sock.fileno(), log_level="warning")
+        else:
+            uvicorn.run(make_asgi_app(), host="0.0.0.0", port=port, log_level="warning")
+    elif sock is not None:
+        from werkzeug.serving import make_server
+        make_server("0.0.0.0", port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        app.run(host="0.0.0.0", port=port)
+
+def run_worker(async_mode, port, index, sock):
+    global IS_WORKER, SHARED, SHARED_SLOT
+    IS_WORKER = True
+    SHARED_SLOT = index + 1
+    SHARED = SharedStatus.open(SHARED.path)     # own reader state, own settings lock descriptor
+    threading.Thread(target=follow_shared, daemon=True).start()
+    threading.Thread(target=publish_shared, daemon=True).start()
+    serve(async_mode, port, sock)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh controller")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="serve with uvicorn (ASGI) instead of the Flask server")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="HTTP worker processes sharing the port (POSIX only, see shared.py)")
+    args = parser.parse_args()
+
+    workers = []
+    if args.workers > 1:
+        # Fork before any thread starts: the children only serve and follow SHARED
+        SHARED = SharedStatus.create(default_path("brain", args.port), SHARED_CAPACITY, slots=args.workers + 1)
+        SHARED.update_settings(lambda doc: doc.update(panic=dict(PANIC_MODE), nodes={}))
+        workers = fork_workers(args.workers, args.port,
+                               lambda i, sock: run_worker(args.async_mode, args.port, i, sock))
+
+    seeded = SCORER.seed({n['name']: HISTORY.recent(n['name'], SCORE_SEED_SAMPLES) for n in NODES})
+    print(f"Scoring: seeded {seeded} nodes from history")
+    HISTORY.start()
+    if TELEMETRY is not None:
+        TELEMETRY.start()
+    if MEMBERSHIP is not None:
+        MEMBERSHIP.start()
+    if LATENCY is not None:
+        LATENCY.start()
+
     t = threading.Thread(target=monitor_mesh)
     t.daemon = True
     t.start()
     
     print("------------------------------------------------")
-    print(" MESH CONTROLLER RUNNING ON PORT 5000")
+    print(f" MESH CONTROLLER RUNNING ON PORT {args.port}" + (" (async)" if args.async_mode else "")
+          + (f" ({len(workers)} workers)" if workers else ""))
     print("------------------------------------------------")
     
-    app.run(host="0.0.0.0", port=5000)
\ No newline at end of file
+    if workers:
+        threading.Thread(target=follow_shared, daemon=True).start()
+        threading.Thread(target=publish_shared, daemon=True).start()
+        try:
+            wait_workers(workers)
+        finally:
+            SHARED.unlink()
+    else:
+        serve(args.async_mode, args.port)
@@ -0,0 +1,174 @@
+import threading
+import time
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class _Backend:
+    __slots__ = ("state", "failures", "slow", "baseline", "open_until", "streak",
+                 "closed_at", "trial_started")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0       # consecutive failed requests
+        self.slow = 0           # consecutive latency spikes
+        self.baseline = None    # EWMA of normal time-to-headers, seconds
+        self.open_until = 0.0
+        self.streak = 0         # ejections in a row, drives the backoff
+        self.closed_at = 0.0
+        self.trial_started = 0.0
+
+
+class OutlierDetector:
+    """
+    Passive health checking on live proxy traffic (a per-backend circuit
+    breaker).
+
+    The proxy reports every upstream attempt with record(). A backend is
+    ejected after `consecutive_failures` errors in a row, or after
+    `spike_consecutive` responses slower than spike_factor x its own latency
+    baseline. It stays out for base_ejection * 2^(streak-1) seconds (capped
+    at max_ejection), then goes half-open: take_trial() hands out a single
+    trial request, and its outcome either closes the breaker or re-opens it
+    with a doubled timeout (release_trial() hands back a trial that was never
+    sent). The streak resets once a backend has stayed healthy for
+    max_ejection seconds.
+
+    on_eject(name) / on_restore(name) are how the rest of the proxy learns
+    about it (master.py removes and re-adds the node in its NodeIndex, so
+    every balancing strategy skips ejected backends for free). At most
+    max_ejected_fraction of `total()` backends are ejected at once, so a
+    fault on the client side cannot empty the pool.
+    """
+
+    def __init__(self, consecutive_failures=3, spike_factor=5.0, spike_floor=0.25,
+                 spike_consecutive=3, base_ejection=1.0, max_ejection=60.0,
+                 max_ejected_fraction=0.5, trial_timeout=10.0, alpha=0.2,
+                 total=None, on_eject=None, on_restore=None):
+        self.consecutive_failures = consecutive_failures
+        self.spike_factor = spike_factor
+        self.spike_floor = spike_floor
+        self.spike_consecutive = spike_consecutive
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        self.max_ejected_fraction = max_ejected_fraction
+        self.trial_timeout = trial_timeout
+        self.alpha = alpha
+        self.total = total
+        self.on_eject = on_eject
+        self.on_restore = on_restore
+        self.lock = threading.Lock()
+        self.backends = {}
+        self.next_trial = float("inf")   # earliest open_until, so take_trial() is O(1) when idle
+
+    def _get(self, name):
+        b = self.backends.get(name)
+        if b is None:
+            b = self.backends[name] = _Backend()
+        return b
+
+    def is_ejected(self, name):
+        b = self.backends.get(name)
+        return b is not None and b.state != CLOSED
+
+    def ejected(self):
+        return [name for name, b in list(self.backends.items()) if b.state != CLOSED]
+
+    def _can_eject(self):
+        if self.total is None:
+            return True
+        out = sum(1 for b in self.backends.values() if b.state != CLOSED)
+        return out + 1 <= max(1, int(self.total() * self.max_ejected_fraction))
+
+    def _open(self, name, b, now):
+        if b.state == CLOSED and now - b.closed_at > self.max_ejection:
+            b.streak = 0
+        b.streak += 1
+        b.state = OPEN
+        b.failures = b.slow = 0
+        b.open_until = now + min(self.max_ejection, self.base_ejection * 2 ** (b.streak - 1))
+        self.next_trial = min(self.next_trial, b.open_until)
+
+    def record(self, name, ok, latency=None):
+        """
+        Reports one upstream attempt. ok=False for connection errors and
+        gateway failures; latency (seconds to response headers) feeds the
+        spike detector. Returns True if this report ejected the backend.
+        """
+        now = time.monotonic()
+        eject = restore = False
+        with self.lock:
+            b = self._get(name)
+
+            if ok and latency is not None:
+                limit = max(self.spike_floor, self.spike_factor * b.baseline) if b.baseline else None
+                if limit is not None and latency > limit:
+                    b.slow += 1
+                    ok = b.state == CLOSED and b.slow < self.spike_consecutive
+                else:
+                    b.slow = 0
+                    b.baseline = latency if b.baseline is None else \
+                        b.baseline + self.alpha * (latency - b.baseline)
+
+            if b.state == HALF_OPEN:
+                if ok:
+                    b.state = CLOSED
+                    b.closed_at = now
+                    b.failures = 0
+                    restore = True
+                else:
+                    self._open(name, b, now)
+                    eject = True
+            elif b.state == OPEN:
+                # Picked from a stale index entry: make sure it's out again
+                eject = not ok
+            elif ok:
+                b.failures = 0
+            else:
+                b.failures += 1
+                if (b.failures >= self.consecutive_failures or b.slow >= self.spike_consecutive) \
+                        and self._can_eject():
+                    self._open(name, b, now)
+                    eject = True
+
+        if eject and self.on_eject:
+            self.on_eject(name)
+        if restore and self.on_restore:
+            self.on_restore(name)
+        return eject
+
+    def take_trial(self):
+        """Name of an ejected backend due for its half-open trial (claimed by the caller), or None."""
+        now = time.monotonic()
+        if now < self.next_trial:
+            return None
+        with self.lock:
+            due = None
+            self.next_trial = float("inf")
+            for name, b in self.backends.items():
+                if b.state == HALF_OPEN and now - b.trial_started > self.trial_timeout:
+                    b.state = OPEN    # trial never reported back, let another one go
+                if b.state != OPEN:
+                    continue
+                if b.open_until <= now and due is None:
+                    b.state = HALF_OPEN
+                    b.trial_started = now
+                    due = name
+                else:
+                    self.next_trial = min(self.next_trial, max(b.open_until, now + 0.05))
+            for b in self.backends.values():
+                if b.state == HALF_OPEN:
+                    self.next_trial = min(self.next_trial, b.trial_started + self.trial_timeout)
+            return due
+
+    def release_trial(self, name):
+        """Gives back a take_trial() claim that was not used: no penalty, the backend stays due."""
+        with self.lock:
+            b = self.backends.get(name)
+            if b is None or b.state != HALF_OPEN:
+                return
+            b.state = OPEN
+            self.next_trial = min(self.next_trial, b.open_until)
+
+    def states(self):
+        return {name: b.state for name, b in list(self.backends.items())}
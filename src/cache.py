@@ -0,0 +1,479 @@
+"""
+Response cache for the master.py proxy.
+
+HTTP semantics kept deliberately small and conservative:
+- only GET responses with status 200/203/204/300/301/308/404/410 are stored,
+  never with Set-Cookie, Cache-Control no-store/private or Vary: *, and a
+  request carrying Authorization only shares a response marked public or
+  s-maxage
+- freshness comes from s-maxage, max-age or Expires (minus Age); a response
+  without any but with a validator (ETag/Last-Modified) is stored as
+  immediately stale, so every use is a cheap conditional request upstream
+- Vary is honoured by keying variants on the request's values for the
+  listed headers
+- request no-store skips the cache, no-cache / max-age=0 forces revalidation
+
+Memory is bounded in bytes: LRU order with a TinyLFU admission filter (a
+small count-min sketch of recent key popularity), so a burst of one-off
+URLs can't flush out the hot set. Evicted entries can spill to an optional
+disk tier. Concurrent misses for one key are coalesced: the first request
+fetches, the rest wait for its result (single-flight).
+"""
+
+import calendar
+import email.utils
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+
+from metrics import Counter
+
+HITS = Counter("mesh_cache_hits_total", "Requests answered from the response cache", ["tier"])
+MISSES = Counter("mesh_cache_misses_total", "Cacheable requests that went upstream")
+REVALIDATED = Counter("mesh_cache_revalidated_total", "Stale entries refreshed by an upstream 304")
+COALESCED = Counter("mesh_cache_coalesced_total", "Misses that waited for another request's fetch")
+BYTES_SAVED = Counter("mesh_cache_bytes_saved_total", "Body bytes served without an upstream transfer")
+EVICTIONS = Counter("mesh_cache_evictions_total", "Entries evicted", ["tier"])
+REJECTED = Counter("mesh_cache_admission_rejected_total", "Responses TinyLFU declined to cache")
+
+CACHEABLE_STATUSES = {200, 203, 204, 300, 301, 308, 404, 410}
+NOT_MODIFIED_HEADERS = {"cache-control", "content-location", "date", "etag", "expires", "vary", "age"}
+_HALVE = bytes(i >> 1 for i in range(256))
+ENTRY_OVERHEAD = 256   # rough per-entry bookkeeping bytes counted against the budget
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"')
+    return directives
+
+
+def _seconds(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison, as If-None-Match uses."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    weak = lambda tag: tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()
+    return weak(etag) in {weak(t) for t in if_none_match.split(",")}
+
+
+def _http_date(value):
+    parsed = email.utils.parsedate(value) if value else None
+    return calendar.timegm(parsed) if parsed else None
+
+
+class Entry:
+    __slots__ = ("status", "headers", "body", "stored_at", "expires_at", "age",
+                 "etag", "last_modified", "size")
+
+    def __init__(self, status, headers, body, lifetime, age):
+        now = time.time()
+        self.status = status
+        self.headers = [(k, v) for k, v in headers if k.lower() != "age"]
+        self.body = body
+        self.stored_at = now
+        self.age = age
+        self.expires_at = now + lifetime - age
+        lowered = {k.lower(): v for k, v in headers}
+        self.etag = lowered.get("etag")
+        self.last_modified = lowered.get("last-modified")
+        self.size = len(body) + sum(len(k) + len(v) for k, v in self.headers) + ENTRY_OVERHEAD
+
+    def fresh(self, now=None):
+        return (now or time.time()) < self.expires_at
+
+    def response_headers(self):
+        """Stored headers plus a current Age."""
+        age = int(self.age + time.time() - self.stored_at)
+        return self.headers + [("Age", str(age))]
+
+
+class FrequencySketch:
+    """
+    TinyLFU popularity estimate: 4-row count-min sketch of 4-bit-ish
+    counters (saturating at 15), all halved every `sample` increments so old
+    popularity fades.
+    """
+
+    def __init__(self, width=4096, sample=None):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.mask = self.width - 1
+        self.rows = [bytearray(self.width) for _ in range(4)]
+        self.sample = sample or self.width * 10
+        self.additions = 0
+
+    def _slots(self, key):
+        h = hash(key)
+        return [((h >> (i * 16)) ^ (h * (i + 1))) & self.mask for i in range(4)]
+
+    def add(self, key):
+        for row, slot in zip(self.rows, self._slots(key)):
+            if row[slot] < 15:
+                row[slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample:
+            self.additions //= 2
+            for row in self.rows:
+                row[:] = row.translate(_HALVE)
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(key)))
+
+
+class _Flight:
+    __slots__ = ("event", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.waiters = []   # (loop, future) of asyncio followers
+
+
+class DiskTier:
+    """Spill-over for entries evicted from memory, one pickle per entry, LRU by bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = OrderedDict()   # full key -> (path, size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):   # the index is in memory only, start clean
+            if name.endswith(".cache"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def _path(self, full_key):
+        return os.path.join(self.directory, blake2b(repr(full_key).encode(), digest_size=12).hexdigest() + ".cache")
+
+    def put(self, full_key, entry):
+        if entry.size > self.max_bytes:
+            return
+        path = self._path(full_key)
+        try:
+            with open(path, "wb") as f:
+                pickle.dump({s: getattr(entry, s) for s in Entry.__slots__}, f, pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            return
+        evicted = []
+        with self.lock:
+            old = self.index.pop(full_key, None)
+            if old:
+                self.bytes -= old[1]
+            self.index[full_key] = (path, entry.size)
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes and self.index:
+                _, (old_path, size) = self.index.popitem(last=False)
+                self.bytes -= size
+                evicted.append(old_path)
+        for old_path in evicted:
+            EVICTIONS.labels("disk").inc()
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def take(self, full_key):
+        """Removes and returns the entry (it is promoted back to memory), or None."""
+        with self.lock:
+            item = self.index.pop(full_key, None)
+            if item is None:
+                return None
+            self.bytes -= item[1]
+        path = item[0]
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            os.remove(path)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+        entry = Entry.__new__(Entry)
+        for slot, value in state.items():
+            setattr(entry, slot, value)
+        return entry
+
+
+class ResponseCache:
+    """
+    lookup()/store()/refresh() are the HTTP side; begin()/end() (and
+    wait()/wait_async() for followers) implement single-flight. All of it is
+    thread-safe, and the async proxy uses the same instance.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, max_entry_bytes=2 * 2**20, admission="tinylfu",
+                 disk_dir=None, disk_max_bytes=512 * 2**20, max_variants=8):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_variants = max_variants
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # (key, vary values) -> Entry, LRU first
+        self.vary = {}                 # key -> tuple of lowercased Vary header names
+        self.variants = {}             # key -> [full keys], oldest first
+        self.bytes = 0
+        self.sketch = FrequencySketch(max(1024, max_bytes // 16384)) if admission == "tinylfu" else None
+        self.disk = DiskTier(disk_dir, disk_max_bytes) if disk_dir else None
+        self.flights = {}
+
+    # --- keys and policy ---
+
+    @staticmethod
+    def key(path_and_query):
+        return path_and_query
+
+    def _full_key(self, key, request_headers):
+        names = self.vary.get(key, ())
+        return key, tuple(request_headers.get(n) for n in names)
+
+    @staticmethod
+    def request_directives(request_headers):
+        """(skip cache entirely, must revalidate) for a request."""
+        cc = parse_cache_control(request_headers.get("cache-control"))
+        if "no-store" in cc:
+            return True, True
+        revalidate = ("no-cache" in cc or cc.get("max-age") == "0"
+                      or "no-cache" in request_headers.get("pragma", "").lower())
+        return False, revalidate
+
+    def lifetime(self, response_headers, request_headers=None):
+        """
+        Freshness lifetime in seconds if the response may be stored, else
+        None. 0 means "store, but revalidate before every use".
+        """
+        lowered = {k.lower(): v for k, v in response_headers}
+        cc = parse_cache_control(lowered.get("cache-control"))
+        if "no-store" in cc or "private" in cc or "set-cookie" in lowered:
+            return None
+        if lowered.get("vary", "").strip() == "*":
+            return None
+        if request_headers and "authorization" in request_headers and \
+                "public" not in cc and "s-maxage" not in cc:
+            return None
+
+        if "no-cache" in cc:
+            lifetime = 0
+        elif _seconds(cc.get("s-maxage")) is not None:
+            lifetime = _seconds(cc["s-maxage"])
+        elif _seconds(cc.get("max-age")) is not None:
+            lifetime = _seconds(cc["max-age"])
+        elif lowered.get("expires") is not None:
+            expires = _http_date(lowered["expires"])
+            date = _http_date(lowered.get("date")) or time.time()
+            lifetime = max(0, int(expires - date)) if expires else 0
+        else:
+            lifetime = 0
+
+        if lifetime == 0 and "etag" not in lowered and "last-modified" not in lowered:
+            return None   # nothing to revalidate with, storing it would never pay off
+        return lifetime
+
+    def cacheable(self, status, response_headers, request_headers=None, length=None):
+        if status not in CACHEABLE_STATUSES:
+            return None
+        if length is None or length > self.max_entry_bytes:
+            return None
+        return self.lifetime(response_headers, request_headers)
+
+    # --- lookups ---
+
+    def lookup(self, key, request_headers):
+        """
+        (entry, tier) for this request, fresh or stale, or (None, None).
+        Every lookup counts towards the key's popularity.
+        """
+        if self.sketch is not None:
+            self.sketch.add(key)
+        with self.lock:
+            full_key = self._full_key(key, request_headers)
+            entry = self.entries.get(full_key)
+            if entry is not None:
+                self.entries.move_to_end(full_key)
+                return entry, "memory"
+        if self.disk is not None:
+            entry = self.disk.take(full_key)
+            if entry is not None:
+                self._insert(full_key, entry, admit=True)
+                return entry, "disk"
+        return None, None
+
+    def serve(self, entry, tier, request_headers):
+        """
+        Counts a hit and returns (status, headers, body) for it: a 304 if the
+        client already holds this version, the stored response otherwise.
+        """
+        HITS.labels(tier).inc()
+        BYTES_SAVED.inc(len(entry.body))
+        headers = entry.response_headers()
+        if entry.etag and etag_matches(request_headers.get("if-none-match"), entry.etag):
+            return 304, [(k, v) for k, v in headers if k.lower() in NOT_MODIFIED_HEADERS], b""
+        return entry.status, headers, entry.body
+
+    @staticmethod
+    def validators(entry):
+        """Conditional request headers for revalidating a stale entry."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def miss(self):
+        MISSES.inc()
+
+    # --- storing ---
+
+    def store(self, key, request_headers, status, headers, body, lifetime):
+        lowered = {k.lower(): v for k, v in headers}
+        age = _seconds(lowered.get("age")) or 0
+        entry = Entry(status, headers, body, lifetime, age)
+        if entry.size > self.max_entry_bytes:
+            return None
+
+        names = tuple(sorted(n.strip().lower() for n in lowered.get("vary", "").split(",") if n.strip()))
+        with self.lock:
+            if self.vary.get(key, ()) != names:
+                self.vary[key] = names
+        full_key = self._full_key(key, request_headers)
+        self._insert(full_key, entry, admit=False)
+        return entry
+
+    def refresh(self, key, request_headers, entry, not_modified_headers):
+        """Upstream said 304: merge its headers and restart the freshness clock."""
+        merged = {k.lower(): (k, v) for k, v in entry.headers}
+        for k, v in not_modified_headers:
+            if k.lower() not in ("content-length", "transfer-encoding", "age"):
+                merged[k.lower()] = (k, v)
+        headers = list(merged.values())
+        lifetime = self.lifetime(headers, request_headers)
+        REVALIDATED.inc()
+        if lifetime is None:
+            return entry
+        return self.store(key, request_headers, entry.status, headers, entry.body, lifetime) or entry
+
+    def _drop(self, full_key):
+        """Removes one entry; caller holds the lock."""
+        entry = self.entries.pop(full_key)
+        self.bytes -= entry.size
+        keys = self.variants.get(full_key[0])
+        if keys is not None:
+            keys.remove(full_key)
+            if not keys:
+                del self.variants[full_key[0]]
+                if self.disk is None:   # the disk tier still needs it to find spilled variants
+                    self.vary.pop(full_key[0], None)
+        return entry
+
+    def _insert(self, full_key, entry, admit):
+        spilled = []
+        with self.lock:
+            if full_key in self.entries:
+                self._drop(full_key)
+
+            if not admit and self.sketch is not None and self.bytes + entry.size > self.max_bytes:
+                # TinyLFU: only displace entries that are less popular than the newcomer
+                need = self.bytes + entry.size - self.max_bytes
+                candidate = self.sketch.estimate(full_key[0])
+                freed = 0
+                for victim_key, victim in self.entries.items():
+                    if freed >= need:
+                        break
+                    if self.sketch.estimate(victim_key[0]) > candidate:
+                        REJECTED.inc()
+                        return
+                    freed += victim.size
+
+            self.entries[full_key] = entry
+            self.bytes += entry.size
+            keys = self.variants.setdefault(full_key[0], [])
+            keys.append(full_key)
+            if len(keys) > self.max_variants:
+                self._drop(keys[0])
+
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                victim_key = next(iter(self.entries))
+                spilled.append((victim_key, self._drop(victim_key)))
+                EVICTIONS.labels("memory").inc()
+
+        if self.disk is not None:
+            for victim_key, victim in spilled:
+                self.disk.put(victim_key, victim)
+
+    # --- single-flight ---
+
+    def begin(self, key):
+        """(True, flight) for the request that should fetch, (False, flight) for followers."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                COALESCED.inc()
+                return False, flight
+            flight = self.flights[key] = _Flight()
+            return True, flight
+
+    def end(self, key, flight):
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            flight.event.set()
+            waiters = flight.waiters
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    def wait(self, flight, timeout):
+        return flight.event.wait(timeout)
+
+    async def wait_async(self, flight, timeout):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.lock:
+            if flight.event.is_set():
+                return True
+            flight.waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # --- reporting ---
+
+    def stats(self):
+        hits = sum(c.value for c in HITS.children.values())
+        misses = MISSES.children[()].value
+        with self.lock:
+            entries, used = len(self.entries), self.bytes
+        stats = {
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+            "revalidated": REVALIDATED.children[()].value,
+            "coalesced": COALESCED.children[()].value,
+            "bytes_saved": BYTES_SAVED.children[()].value,
+            "evictions": {tier: c.value for (tier,), c in EVICTIONS.children.items()},
+            "admission_rejected": REJECTED.children[()].value,
+        }
+        if self.disk is not None:
+            stats["disk"] = {"entries": len(self.disk.index), "bytes": self.disk.bytes,
+                             "max_bytes": self.disk.max_bytes}
+        return stats
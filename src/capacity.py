@@ -0,0 +1,306 @@
+"""
+Capacity probe for node agents (how many users this machine can hold).
+
+RAM, disk and network are measured in parallel, then the CPU on its own
+(the disk write and the speedtest's packet handling would otherwise eat
+into the cores being measured). Each phase has a hard timeout and every
+probe a fallback value; the results are combined with a bottleneck model
+(RAM and network are hard caps, CPU is a soft cap). The CPU probe's worker
+processes are started before anything is timed, so its timeout only covers
+the spinning, not a spawn (which re-imports this module on Windows); if the
+pool itself does not come up within the mode's pool_timeout, one core is
+spun in-process instead and scaled by the core count.
+Results are cached next to the config together with a hardware
+fingerprint, so a restart on the same machine skips the whole thing.
+"""
+
+import hashlib
+import os
+import platform
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+import yaml
+
+CACHE_PATH = "capacity_cache.yaml"
+CACHE_VERSION = 2   # bump when probes change so old results are re-measured
+CACHE_MAX_AGE = 30 * 86400
+
+# timeout covers the I/O probes together, cpu_timeout the CPU probe after them,
+# pool_timeout the CPU probe's worker processes coming up before either
+FULL = {"cpu_seconds": 1.5, "disk_mb": 50, "network": True, "timeout": 25, "cpu_timeout": 5,
+        "pool_timeout": 30}
+QUICK = {"cpu_seconds": 0.2, "disk_mb": 8, "network": False, "timeout": 0.8, "cpu_timeout": 0.8,
+         "pool_timeout": 1.0}
+POOL_TIMEOUT = FULL["pool_timeout"]
+
+# Used when a probe fails or runs out of time
+FALLBACK = {"cpu_capacity": 100, "ram_capacity": 100, "network_capacity": 100, "io_capacity": 100}
+
+
+def hardware_fingerprint():
+    vm = psutil.virtual_memory()
+    parts = [
+        platform.node(),
+        platform.machine(),
+        platform.processor(),
+        str(psutil.cpu_count(logical=True)),
+        str(psutil.cpu_count(logical=False)),
+        str(round(vm.total / (1024 ** 3))),
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+
+def run_parallel(tasks, timeout):
+    """
+    Runs {name: fn} on daemon threads under one shared deadline and returns
+    {name: (result, error)}. A probe that hangs is abandoned, not waited on.
+    """
+    results = {}
+
+    def runner(name, fn):
+        try:
+            results[name] = (fn(), None)
+        except Exception as e:
+            results[name] = (None, e)
+
+    threads = [threading.Thread(target=runner, args=(name, fn), daemon=True)
+               for name, fn in tasks.items()]
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(max(0.0, deadline - time.monotonic()))
+
+    return {name: results.get(name, (None, TimeoutError(f"timed out after {timeout}s")))
+            for name in tasks}
+
+
+# --- sub-probes, each returns a dict of metrics ---
+
+def _spin(seconds):
+    """One core's worth of work: float multiplies until the clock runs out."""
+    end = time.perf_counter() + seconds
+    x = 1.000001
+    ops = 0
+    while time.perf_counter() < end:
+        x *= 1.0000001
+        ops += 1
+    return ops / seconds
+
+
+def _ready(seconds):
+    time.sleep(seconds)
+
+
+def start_pool(cores, timeout=POOL_TIMEOUT):
+    """
+    A ProcessPoolExecutor with all `cores` workers already running: each is
+    handed a short sleep, so every submit spawns a process. Raises
+    TimeoutError (after shutting the pool down) if they don't come up in time.
+    """
+    executor = ProcessPoolExecutor(max_workers=cores)
+    try:
+        for future in [executor.submit(_ready, 0.05) for _ in range(cores)]:
+            future.result(timeout)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    return executor
+
+
+def probe_cpu(seconds, executor=None):
+    """
+    One spinning process per logical core (threads would serialize on the
+    GIL and measure a single core). Scores are ops/second. `executor` is a
+    start_pool() result; without one a pool is started (and timed) here.
+    """
+    cpu_cores = psutil.cpu_count(logical=True) or 2
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=cpu_cores) as executor:
+            per_core = list(executor.map(_spin, [seconds] * cpu_cores))
+    else:
+        per_core = list(executor.map(_spin, [seconds] * cpu_cores))
+
+    aggregate = sum(per_core)
+    # Scale tuned on ops per core per 1.5 s / 250k
+    return {
+        "cpu_capacity": max(10, int(aggregate * 1.5 / 250_000)),
+        "cpu_cores": cpu_cores,
+        "cpu_per_core": [int(x) for x in per_core],
+        "cpu_aggregate": int(aggregate),
+    }
+
+
+def probe_cpu_single(seconds):
+    """probe_cpu() without worker processes: one core spun here, scaled by the core count."""
+    cpu_cores = psutil.cpu_count(logical=True) or 2
+    one = _spin(seconds)
+    return {
+        "cpu_capacity": max(10, int(one * cpu_cores * 1.5 / 250_000)),
+        "cpu_cores": cpu_cores,
+        "cpu_per_core": [int(one)],
+        "cpu_aggregate": int(one * cpu_cores),
+        "cpu_estimated": True,
+    }
+
+
+def probe_ram():
+    ram_gb = psutil.virtual_memory().total / (1024 ** 3)
+    return {"ram_capacity": max(10, int((ram_gb - 2) * 40))}
+
+
+def probe_disk(size_mb, directory=None):
+    fd, path = tempfile.mkstemp(prefix="io_bench_", suffix=".tmp", dir=directory)
+    try:
+        block = b"\0" * (1024 * 1024)
+        start = time.time()
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(size_mb):
+                f.write(block)
+        write_mbps = size_mb / max(0.01, time.time() - start)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return {"io_capacity": max(10, int((write_mbps * 1024) / 20))}
+
+
+def probe_network():
+    import speedtest
+
+    st = speedtest.Speedtest(timeout=5)
+    st.get_best_server()
+
+    download_mbps = st.download() / 1_000_000
+    upload_mbps = st.upload() / 1_000_000
+
+    download_kbps = download_mbps * 125
+    upload_kbps = upload_mbps * 125
+
+    user_bw_kbps = 3
+    net_capacity = int(((upload_kbps * 5 + download_kbps) / 6) / user_bw_kbps * 0.8)
+
+    return {
+        "network_capacity": max(10, net_capacity),
+        "download_mbps": round(download_mbps, 1),
+        "upload_mbps": round(upload_mbps, 1),
+    }
+
+
+def combine(metrics):
+    """Bottleneck model: RAM and network are hard caps, CPU is a soft cap."""
+    cpu = metrics["cpu_capacity"]
+    ram = metrics["ram_capacity"]
+    net = metrics["network_capacity"]
+    io = metrics["io_capacity"]
+
+    io = min(io, ram * 3)
+    net = min(net, ram * 2)
+
+    hard_cap = min(ram, net)
+
+    cpu_soft = cpu * 2.5
+
+    weighted_capacity = int(
+        1 / (
+            (0.45 / cpu_soft) +
+            (0.30 / ram) +
+            (0.20 / net) +
+            (0.05 / io)
+        )
+    )
+
+    return max(10, min(weighted_capacity, hard_cap))
+
+
+def measure(quick=False, on_pool_ready=None):
+    """
+    Runs the I/O sub-probes in parallel, then the CPU probe alone. Returns the
+    metrics dict. on_pool_ready() is called once the CPU pool is up (or has
+    given up), so callers can start their own threads without racing the fork.
+    """
+    mode = QUICK if quick else FULL
+    probes = {
+        "ram": probe_ram,
+        "disk": lambda: probe_disk(mode["disk_mb"]),
+    }
+    if mode["network"]:
+        probes["network"] = probe_network
+
+    print(f"Benchmarking {', '.join(probes)} then cpu ({'quick' if quick else 'full'}, "
+          f"{mode['timeout']}s + {mode['cpu_timeout']}s max)...")
+    try:
+        executor = start_pool(psutil.cpu_count(logical=True) or 2, mode["pool_timeout"])
+        cpu = lambda: probe_cpu(mode["cpu_seconds"], executor)
+    except Exception as e:
+        print(f"  cpu pool did not start ({e or 'timed out'}), probing one core in-process")
+        executor = None
+        cpu = lambda: probe_cpu_single(mode["cpu_seconds"])
+    if on_pool_ready is not None:
+        on_pool_ready()
+    results = run_parallel(probes, mode["timeout"])
+    try:
+        results.update(run_parallel({"cpu": cpu}, mode["cpu_timeout"]))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    metrics = dict(FALLBACK)
+    for name, (result, error) in results.items():
+        if error is not None:
+            print(f"  {name} probe failed, using fallback: {error}")
+            continue
+        metrics.update(result)
+
+    metrics["overall_capacity"] = combine(metrics)
+    metrics["quick"] = quick
+    print("Benchmark results:", metrics)
+    return metrics
+
+
+def load_cached(path=CACHE_PATH, allow_quick=True):
+    try:
+        with open(path, "r") as f:
+            cached = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        return None
+    if cached.get("version") != CACHE_VERSION or cached.get("fingerprint") != hardware_fingerprint():
+        return None
+    if time.time() - cached.get("measured_at", 0) > CACHE_MAX_AGE:
+        return None
+    metrics = cached.get("metrics") or {}
+    if metrics.get("quick") and not allow_quick:
+        return None
+    return metrics or None
+
+
+def save_cached(metrics, path=CACHE_PATH):
+    try:
+        with open(path, "w") as f:
+            yaml.dump({"version": CACHE_VERSION,
+                       "fingerprint": hardware_fingerprint(),
+                       "measured_at": int(time.time()),
+                       "metrics": metrics}, f)
+    except OSError as e:
+        print("Could not cache benchmark:", e)
+
+
+def benchmark(quick=False, use_cache=True, on_pool_ready=None):
+    """Cached measure(): a quick result never stands in for a full one."""
+    if use_cache:
+        cached = load_cached(allow_quick=quick)
+        if cached:
+            print("Using cached benchmark for this hardware:", cached)
+            if on_pool_ready is not None:
+                on_pool_ready()
+            return cached
+    metrics = measure(quick=quick, on_pool_ready=on_pool_ready)
+    if use_cache:
+        save_cached(metrics)
+    return metrics
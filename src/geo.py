@@ -0,0 +1,176 @@
+"""
+Geo lookups for the "geo" balancing strategy (balancing.GeoNearest).
+
+- PrefixTable: longest-prefix match of a client IP against an offline
+  IP-prefix database, as a multibit trie with 8-bit strides, so a lookup
+  is at most 4 (IPv4) or 16 (IPv6) list indexings
+- NodeTree: nearest nodes to a point by great-circle distance, as a k-d
+  tree over unit vectors (chord length orders points the same way as arc
+  length), built once per change in node locations
+
+The database is a CSV with a header; the columns used are network (CIDR),
+lat/latitude, lon/longitude, and optionally region and city, e.g.
+    network,lat,lon,region,city
+    203.0.113.0/24,45.50,-73.57,NA-EAST,Montréal
+GeoLite2-City-Blocks CSVs load as-is (without region/city).
+"""
+
+import bisect
+import csv
+import ipaddress
+import math
+import os
+import socket
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class PrefixTable:
+    """
+    IP prefix -> value (here (lat, lon, region, city)). Each trie level
+    covers one address byte; a prefix that ends inside a byte is expanded
+    over the slots it covers, keeping the longest prefix per slot.
+    """
+
+    def __init__(self):
+        self.roots = {4: self._node(), 16: self._node()}   # by packed address length
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _node():
+        return [[None] * 256, [-1] * 256, [None] * 256]   # values, their prefix lengths, children
+
+    def insert(self, network, value):
+        net = ipaddress.ip_network(network, strict=False)
+        raw = net.network_address.packed
+        length = net.prefixlen
+        node = self.roots[len(raw)]
+        depth = 0
+        while length - depth * 8 > 8:
+            child = node[2][raw[depth]]
+            if child is None:
+                child = node[2][raw[depth]] = self._node()
+            node = child
+            depth += 1
+
+        span = 8 - (length - depth * 8)
+        start = raw[depth] >> span << span
+        values, lengths = node[0], node[1]
+        for b in range(start, start + (1 << span)):
+            if lengths[b] <= length:
+                values[b] = value
+                lengths[b] = length
+        self.size += 1
+
+    def lookup(self, ip):
+        """Value of the longest matching prefix, or None (also for malformed addresses)."""
+        try:
+            raw = socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip)
+        except (OSError, TypeError, ValueError):
+            return None
+        node = self.roots[len(raw)]
+        found = None
+        for b in raw:
+            value = node[0][b]
+            if value is not None:
+                found = value
+            node = node[2][b]
+            if node is None:
+                break
+        return found
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_prefixes(path):
+    """PrefixTable from a CSV prefix database; empty if the file is missing."""
+    table = PrefixTable()
+    if not path or not os.path.exists(path):
+        print(f"Geo: no prefix database at {path}, clients can't be located")
+        return table
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            network = row.get("network")
+            if not network:
+                continue
+            lat = _float(row.get("lat", row.get("latitude")))
+            lon = _float(row.get("lon", row.get("longitude")))
+            region = row.get("region") or None
+            if (lat is None or lon is None) and region is None:
+                continue
+            try:
+                table.insert(network, (lat, lon, region, row.get("city") or None))
+            except ValueError:
+                continue
+    print(f"Geo: loaded {len(table)} prefixes from {path}")
+    return table
+
+
+def unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    c = math.cos(lat)
+    return (c * math.cos(lon), c * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(d2):
+    """Great-circle distance for a squared chord length between unit vectors."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(d2) / 2))
+
+
+def location_of(stats):
+    """(lat, lon) from a node's stats, None when unknown (agents report 0, 0 when geolocation failed)."""
+    loc = stats.get('location') or {}
+    lat, lon = _float(loc.get('lat')), _float(loc.get('lon'))
+    if lat is None or lon is None or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+class NodeTree:
+    """k-d tree over node locations; entries are (point, name, axis, left, right)."""
+
+    def __init__(self, located):
+        """located: {name: (lat, lon)}"""
+        self.size = len(located)
+        self.root = self._build([(unit_vector(*loc), name) for name, loc in located.items()], 0)
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        point, name = points[mid]
+        return (point, name, axis,
+                self._build(points[:mid], depth + 1),
+                self._build(points[mid + 1:], depth + 1))
+
+    def nearest(self, lat, lon, accept, k=1):
+        """Up to k (distance_km, name) pairs, nearest first, among names accept(name) is true for."""
+        q = unit_vector(lat, lon)
+        qx, qy, qz = q
+        best = []       # (squared chord, name), sorted
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or (len(best) == k and bound >= best[-1][0]):
+                continue
+            point, name, axis, left, right = node
+            dx, dy, dz = point[0] - qx, point[1] - qy, point[2] - qz
+            d2 = dx * dx + dy * dy + dz * dz
+            if (len(best) < k or d2 < best[-1][0]) and accept(name):
+                bisect.insort(best, (d2, name))
+                del best[k:]
+            diff = q[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, diff * diff))
+            stack.append((near, bound))
+        return [(chord_to_km(d2), name) for d2, name in best]
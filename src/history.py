@@ -0,0 +1,358 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import Counter, Histogram
+
+WRITE_SECONDS = Histogram("mesh_history_write_seconds", "SQLite batch write (partitions + rollups) latency")
+ROWS_WRITTEN = Counter("mesh_history_rows_total", "History rows written")
+WRITE_ERRORS = Counter("mesh_history_write_errors_total", "History batches that failed to write")
+
+COLUMNS = "timestamp INTEGER, node_name TEXT, cpu_load REAL, ping REAL, users INTEGER"
+
+# Rollup tiers: bucket width (s) -> retention (s)
+ROLLUPS = {
+    60: 2 * 86400,
+    600: 14 * 86400,
+    3600: 90 * 86400,
+}
+METRICS = ("load", "ping", "users")   # raw columns 2, 3, 4
+MAX_POINTS = 500                      # target points for an automatic resolution
+MIN_POINTS = MAX_POINTS // 4          # fewest an automatic resolution may give (24 h: 10m, not 1h)
+
+
+def _recent(conn, node_name, limit):
+    rows = []
+    for start in HistoryStore.partitions(conn):
+        try:
+            rows.extend(conn.execute(
+                f"SELECT timestamp, cpu_load, ping, users FROM history_{start} "
+                f"WHERE node_name=? ORDER BY timestamp DESC LIMIT ?",
+                (node_name, limit - len(rows))).fetchall())
+        except sqlite3.OperationalError:
+            continue  # expired while we were reading
+        if len(rows) >= limit:
+            break
+    return rows[::-1]
+
+
+def read_recent(path, names, limit=50):
+    """
+    {name: newest `limit` samples, oldest first} straight from a history
+    database, opened read-only so processes that don't own it (master.py)
+    can use it. {} if it doesn't exist or can't be read.
+    """
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    except sqlite3.Error:
+        return {}
+    try:
+        return {name: _recent(conn, name, limit) for name in names}
+    except sqlite3.Error:
+        return {}
+    finally:
+        conn.close()
+
+
+class HistoryStore:
+    """
+    Time-series store for mesh_history.db:
+    - One long-lived writer connection in WAL mode, fed through a queue and
+      flushed with executemany, so the probe loop never waits on disk
+    - Rows land in fixed-width time partitions (history_<start>), each with a
+      (node_name, timestamp) index
+    - Retention drops whole partitions once they age out
+    - "history" stays available as a UNION ALL view over the partitions
+    - 1m / 10m / 1h rollups (min/max/avg per metric) are folded in as each
+      batch is written, so long ranges are served from a coarse tier. Each
+      metric keeps its own sample count: a missing (NULL) ping or load is
+      left out of its min/max/avg rather than counted as 0
+    """
+
+    def __init__(self, path, retention=86400, partition=3600,
+                 batch_size=500, flush_interval=1.0, max_queue=100_000):
+        self.path = path
+        self.retention = retention
+        self.partition = partition
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.local = threading.local()
+        self.thread = None
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate(conn)
+        conn.close()
+
+    # --- connections ---
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reader(self):
+        """Per-thread read connection (WAL readers never block the writer)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    # --- partitions ---
+
+    def bucket(self, timestamp):
+        return int(timestamp) - int(timestamp) % self.partition
+
+    @staticmethod
+    def partitions(conn):
+        """Partition start times, newest first."""
+        rows = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB 'history_[0-9]*'"
+        ).fetchall()
+        return sorted((int(r[0].split("_")[1]) for r in rows), reverse=True)
+
+    def _create_partition(self, conn, start):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS history_{start} ({COLUMNS})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS history_{start}_node_ts "
+                     f"ON history_{start} (node_name, timestamp)")
+
+    def _rebuild_view(self, conn, starts):
+        conn.execute("DROP VIEW IF EXISTS history")
+        if not starts:
+            conn.execute(f"CREATE VIEW history AS SELECT * FROM (SELECT "
+                         f"NULL AS timestamp, NULL AS node_name, NULL AS cpu_load, "
+                         f"NULL AS ping, NULL AS users) WHERE 0")
+            return
+        union = " UNION ALL ".join(f"SELECT * FROM history_{s}" for s in sorted(starts))
+        conn.execute(f"CREATE VIEW history AS {union}")
+
+    def _migrate(self, conn):
+        """
+        Creates the rollup tables, and moves a pre-partitioning 'history'
+        table into partitions (the last `retention` seconds) and the rollups
+        (as far back as each tier keeps) before dropping it.
+        """
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name='history'").fetchone()
+        with conn:
+            for width in ROLLUPS:
+                stats = ", ".join(f"{m}_min REAL, {m}_max REAL, {m}_sum REAL, {m}_n INTEGER" for m in METRICS)
+                conn.execute(f"CREATE TABLE IF NOT EXISTS rollup_{width} "
+                             f"(node_name TEXT, bucket INTEGER, n INTEGER, {stats}, "
+                             f"PRIMARY KEY (node_name, bucket)) WITHOUT ROWID")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS rollup_{width}_bucket ON rollup_{width} (bucket)")
+                columns = {r[1] for r in conn.execute(f"PRAGMA table_info(rollup_{width})")}
+                for m in METRICS:
+                    if f"{m}_n" not in columns:
+                        # Rollups from before per-metric counts folded NULLs in as 0: every row counted
+                        conn.execute(f"ALTER TABLE rollup_{width} ADD COLUMN {m}_n INTEGER")
+                        conn.execute(f"UPDATE rollup_{width} SET {m}_n = n")
+
+            if kind and kind[0] == "table":
+                now = int(time.time())
+                cutoff = now - self.retention
+                starts = conn.execute(
+                    "SELECT DISTINCT timestamp - timestamp % ? FROM history WHERE timestamp >= ?",
+                    (self.partition, cutoff)).fetchall()
+                for (start,) in starts:
+                    self._create_partition(conn, start)
+                    conn.execute(f"INSERT INTO history_{start} SELECT * FROM history "
+                                 f"WHERE timestamp >= ? AND timestamp < ?",
+                                 (start, start + self.partition))
+                rolled = self._backfill(conn, now)
+                conn.execute("DROP TABLE history")
+                print(f"History: migrated legacy table into {len(starts)} partitions, "
+                      f"{rolled} older rows into rollups")
+            self._rebuild_view(conn, self.partitions(conn))
+
+    def _backfill(self, conn, now, chunk=50_000):
+        """Folds the legacy table into every tier it still has buckets in; returns the rows read."""
+        oldest = now - max(ROLLUPS.values())
+        cursor = conn.execute("SELECT timestamp, node_name, cpu_load, ping, users FROM history "
+                              "WHERE timestamp >= ? ORDER BY timestamp", (oldest,))
+        total = 0
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                return total
+            total += len(rows)
+            for width, keep in ROLLUPS.items():
+                kept = [r for r in rows if r[0] >= now - keep] if rows[0][0] < now - keep else rows
+                if kept:
+                    self._rollup(conn, width, kept)
+
+    def _expire(self, conn, now):
+        cutoff = now - self.retention
+        starts = self.partitions(conn)
+        expired = [s for s in starts if s + self.partition <= cutoff]
+        if expired:
+            for s in expired:
+                conn.execute(f"DROP TABLE IF EXISTS history_{s}")
+            self._rebuild_view(conn, [s for s in starts if s not in expired])
+        for width, keep in ROLLUPS.items():
+            conn.execute(f"DELETE FROM rollup_{width} WHERE bucket < ?", (now - keep,))
+
+    # --- writing ---
+
+    def submit(self, rows):
+        """Queue (timestamp, node_name, cpu_load, ping, users) rows. Never blocks."""
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self.dropped += len(rows)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self.thread.start()
+
+    def _drain(self, first):
+        pending = list(first)
+        deadline = time.monotonic() + self.flush_interval
+        while len(pending) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending.extend(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return pending
+
+    def _write(self, conn, rows, known):
+        by_bucket = {}
+        for row in rows:
+            by_bucket.setdefault(self.bucket(row[0]), []).append(row)
+
+        with conn:
+            new = [b for b in by_bucket if b not in known]
+            for b in new:
+                self._create_partition(conn, b)
+                known.add(b)
+            if new:
+                self._rebuild_view(conn, known)
+            for b, chunk in by_bucket.items():
+                conn.executemany(f"INSERT INTO history_{b} VALUES (?, ?, ?, ?, ?)", chunk)
+            for width in ROLLUPS:
+                self._rollup(conn, width, rows)
+
+    def _rollup(self, conn, width, rows):
+        """Fold a batch into one tier: aggregate in memory, then merge-upsert."""
+        acc = {}
+        for row in rows:
+            key = (row[1], int(row[0]) - int(row[0]) % width)
+            a = acc.get(key)
+            if a is None:
+                a = acc[key] = [0] + [None, None, 0.0, 0] * len(METRICS)
+            a[0] += 1
+            for i, v in enumerate((row[2], row[3], row[4])):
+                if v is None:
+                    continue
+                j = 1 + i * 4
+                a[j] = v if a[j] is None else min(a[j], v)
+                a[j + 1] = v if a[j + 1] is None else max(a[j + 1], v)
+                a[j + 2] += v
+                a[j + 3] += 1
+
+        # min()/max() with a NULL argument are NULL in SQLite: a metric with no samples yet is NULL
+        columns = ", ".join(f"{m}_min, {m}_max, {m}_sum, {m}_n" for m in METRICS)
+        merge = ", ".join(
+            f"{m}_min = coalesce(min({m}_min, excluded.{m}_min), {m}_min, excluded.{m}_min), "
+            f"{m}_max = coalesce(max({m}_max, excluded.{m}_max), {m}_max, excluded.{m}_max), "
+            f"{m}_sum = {m}_sum + excluded.{m}_sum, "
+            f"{m}_n = {m}_n + excluded.{m}_n" for m in METRICS)
+        marks = ", ".join("?" * (3 + 4 * len(METRICS)))
+        conn.executemany(
+            f"INSERT INTO rollup_{width} (node_name, bucket, n, {columns}) VALUES ({marks}) "
+            f"ON CONFLICT (node_name, bucket) DO UPDATE SET n = n + excluded.n, {merge}",
+            [(name, bucket, *a) for (name, bucket), a in acc.items()])
+
+    def _run(self):
+        conn = self._connect()
+        known = set(self.partitions(conn))
+        last_expire = 0
+
+        while True:
+            try:
+                now = int(time.time())
+                if now - last_expire >= min(self.partition, 300):
+                    with conn:
+                        self._expire(conn, now)
+                    known = set(self.partitions(conn))
+                    last_expire = now
+            except sqlite3.Error as e:
+                print("History retention error:", e)
+
+            try:
+                first = self.queue.get(timeout=60)
+            except queue.Empty:
+                continue
+
+            rows = self._drain(first)
+            try:
+                with WRITE_SECONDS.time():
+                    self._write(conn, rows, known)
+                ROWS_WRITTEN.inc(len(rows))
+            except sqlite3.Error as e:
+                WRITE_ERRORS.inc()
+                print("History write error:", e)
+
+    # --- reading ---
+
+    def recent(self, node_name, limit=50):
+        """Newest `limit` samples for a node, oldest first. Walks partitions newest-first."""
+        return _recent(self.reader(), node_name, limit)
+
+    def pick_resolution(self, start, end, resolution=None):
+        """
+        0 (raw) or a rollup width, among the tiers that still cover `start`.
+        With a resolution: the coarsest tier at least as fine as asked for.
+        Without: the coarsest one that still gives MIN_POINTS points over the
+        range (raw if none does), so a day is 144 10-minute buckets rather
+        than 24 hours or 1440 minutes.
+        """
+        now = int(time.time())
+        tiers = [0] + sorted(ROLLUPS)
+        retention = {0: self.retention, **ROLLUPS}
+        covering = [w for w in tiers if start >= now - retention[w]]
+        if not covering:
+            return tiers[-1]
+
+        if resolution is None:
+            fits = [w for w in covering if w == 0 or (end - start) / w >= MIN_POINTS]
+        else:
+            fits = [w for w in covering if w <= resolution]
+        # Nothing fine enough still covers the range: fall back to the finest that does
+        return fits[-1] if fits else covering[0]
+
+    def query(self, node_name, start, end, resolution=None):
+        """
+        Samples in [start, end] as (resolution, rows). Raw rows are
+        (timestamp, load, ping, users). Rollup rows are (bucket, n, then
+        min, max and avg for load, ping and users; None where a metric had
+        no samples in the bucket).
+        """
+        width = self.pick_resolution(start, end, resolution)
+        conn = self.reader()
+
+        if width == 0:
+            rows = []
+            for p in sorted(self.partitions(conn)):
+                if p + self.partition <= start or p > end:
+                    continue
+                try:
+                    rows.extend(conn.execute(
+                        f"SELECT timestamp, cpu_load, ping, users FROM history_{p} "
+                        f"WHERE node_name=? AND timestamp BETWEEN ? AND ? ORDER BY timestamp",
+                        (node_name, start, end)).fetchall())
+                except sqlite3.OperationalError:
+                    continue
+            return 0, rows
+
+        cols = ", ".join(f"{m}_min, {m}_max, {m}_sum / nullif({m}_n, 0)" for m in METRICS)
+        rows = conn.execute(
+            f"SELECT bucket, n, {cols} FROM rollup_{width} "
+            f"WHERE node_name=? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+            (node_name, start - start % width, end)).fetchall()
+        return width, rows
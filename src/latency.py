@@ -0,0 +1,246 @@
+"""
+Network latency probing, kept apart from the /stats health probe.
+
+The /stats round trip includes the HTTP stack, JSON and psutil on the node,
+so it says little about the network. LatencyProber measures RTT on its own:
+- "udp": a 12-byte datagram to the node agent's echo responder
+  (EchoResponder, on the agent port), timed until the echo comes back.
+  Agents that never answer (older agents, firewalled UDP) fall back to
+  TCP timing after `udp_attempts` rounds.
+- "tcp": time for the TCP handshake to the target port to complete. A
+  refused connection counts as lost: nothing listens there, so the node is
+  not one to route to however fast the RST came back. A target is connected
+  to at most every `tcp_interval` seconds, whatever the round interval.
+One thread and one selector probe every target per round, so a round
+costs a datagram or a SYN per node, not a request.
+
+Each node keeps its last `window` results in an RttWindow ring buffer;
+stats(name) gives p50/p95 (ms), smoothed jitter (RFC 3550 style) and loss.
+"""
+
+import errno
+import selectors
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from metrics import Histogram
+
+RTT_SECONDS = Histogram("mesh_rtt_seconds", "Network round trip per node (latency.py)", ["node"])
+
+MAGIC = b"MESH"
+PACKET = struct.Struct("!4sII")     # magic, round, target index
+RECV_BUFFER = 1 << 20
+
+
+class RttWindow:
+    """Last `size` results as doubles: RTT in ms, or -1.0 for a lost probe."""
+
+    __slots__ = ("samples", "pos", "count", "jitter", "last")
+
+    def __init__(self, size=64):
+        self.samples = array("d", [0.0]) * size
+        self.pos = 0
+        self.count = 0
+        self.jitter = 0.0
+        self.last = None
+
+    def add(self, rtt):
+        self.samples[self.pos] = rtt
+        self.pos = (self.pos + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+        if rtt >= 0:
+            if self.last is not None:
+                self.jitter += (abs(rtt - self.last) - self.jitter) / 16
+            self.last = rtt
+
+    def summary(self):
+        """{"p50", "p95", "jitter", "loss"} or None before the first answered probe."""
+        window = self.samples[:self.count]
+        values = sorted(v for v in window if v >= 0)
+        if not values:
+            return None
+        n = len(values)
+        return {
+            "p50": round(values[(n - 1) // 2], 2),
+            "p95": round(values[min(n - 1, int(n * 0.95))], 2),
+            "jitter": round(self.jitter, 2),
+            "loss": round(1 - n / self.count, 3),
+        }
+
+
+class LatencyProber:
+    """
+    targets() returns [(name, host, port)] and is called every round, so the
+    node list can change underneath. stats(name) is safe from any thread.
+    tcp_interval defaults to interval.
+    """
+
+    def __init__(self, targets, mode="udp", interval=1.0, timeout=1.0, window=64, udp_attempts=3,
+                 tcp_interval=None):
+        self.targets = targets
+        self.mode = mode
+        self.interval = interval
+        self.tcp_interval = interval if tcp_interval is None else tcp_interval
+        self.timeout = timeout
+        self.window = window
+        self.udp_attempts = udp_attempts
+        self.lock = threading.Lock()
+        self.windows = {}       # name -> RttWindow
+        self.summaries = {}     # name -> summary after the last round
+        self.udp_ok = set()     # nodes that have answered an echo
+        self.udp_misses = {}    # name -> unanswered echoes before the first answer
+        self.tcp_due = {}       # name -> time.monotonic() of its next TCP probe
+        self.round = 0
+
+    def stats(self, name):
+        return self.summaries.get(name)
+
+    def snapshot(self):
+        return dict(self.summaries)
+
+    def _record(self, name, rtt):
+        w = self.windows.get(name)
+        if w is None:
+            w = self.windows[name] = RttWindow(self.window)
+        w.add(rtt * 1000 if rtt is not None else -1.0)
+        if rtt is not None:
+            RTT_SECONDS.labels(name).observe(rtt)
+
+    def _uses_udp(self, name):
+        return self.mode == "udp" and (name in self.udp_ok or self.udp_misses.get(name, 0) < self.udp_attempts)
+
+    def sweep(self):
+        targets = list(self.targets())
+        self.round = (self.round + 1) & 0xFFFFFFFF
+        sel = selectors.DefaultSelector()
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)   # every echo of a round lands at once
+        udp.setblocking(False)
+        sel.register(udp, selectors.EVENT_READ)
+        pending = {}    # (kind, index) -> (name, sent, socket or None)
+        round_start = time.monotonic()
+
+        try:
+            for i, (name, host, port) in enumerate(targets):
+                if self._uses_udp(name):
+                    try:
+                        sent = time.perf_counter()
+                        udp.sendto(PACKET.pack(MAGIC, self.round, i), (host, port))
+                        pending[("u", i)] = (name, sent, None)
+                    except OSError:
+                        self._record(name, None)
+                    continue
+                if self.tcp_due.get(name, 0.0) > round_start:
+                    continue
+                self.tcp_due[name] = round_start + self.tcp_interval
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setblocking(False)
+                sent = time.perf_counter()
+                err = s.connect_ex((host, port))
+                if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    s.close()
+                    self._record(name, None)
+                    continue
+                if err == 0:
+                    s.close()
+                    self._record(name, time.perf_counter() - sent)
+                    continue
+                sel.register(s, selectors.EVENT_WRITE, i)
+                pending[("t", i)] = (name, sent, s)
+
+            deadline = time.perf_counter() + self.timeout
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                for key, _ in sel.select(remaining):
+                    now = time.perf_counter()
+                    if key.fileobj is udp:
+                        self._drain(udp, pending, now)
+                        continue
+                    entry = pending.pop(("t", key.data), None)
+                    sel.unregister(key.fileobj)
+                    err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    key.fileobj.close()
+                    if entry is not None:
+                        self._record(entry[0], now - entry[1] if err == 0 else None)
+
+            for (kind, _), (name, _, s) in pending.items():
+                if s is not None:
+                    s.close()
+                if kind == "u" and name not in self.udp_ok:
+                    self.udp_misses[name] = self.udp_misses.get(name, 0) + 1
+                else:
+                    self._record(name, None)
+        finally:
+            sel.close()
+            udp.close()
+
+        live = {t[0] for t in targets}
+        with self.lock:
+            self.windows = {k: v for k, v in self.windows.items() if k in live}
+            self.tcp_due = {k: v for k, v in self.tcp_due.items() if k in live}
+            summaries = {}
+            for name, w in self.windows.items():
+                s = w.summary()
+                if s is not None:
+                    summaries[name] = s
+            self.summaries = summaries
+
+    def _drain(self, udp, pending, now):
+        while True:
+            try:
+                data = udp.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue    # ICMP unreachable from an earlier send, keep draining
+            if len(data) != PACKET.size:
+                continue
+            magic, rnd, i = PACKET.unpack(data)
+            if magic != MAGIC or rnd != self.round:
+                continue
+            entry = pending.pop(("u", i), None)
+            if entry is not None:
+                self.udp_ok.add(entry[0])
+                self._record(entry[0], now - entry[1])
+
+    def run(self):
+        while True:
+            start = time.monotonic()
+            try:
+                self.sweep()
+            except Exception as e:
+                print("Latency sweep failed:", e)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def start(self):
+        threading.Thread(target=self.run, name="latency-prober", daemon=True).start()
+
+
+class EchoResponder:
+    """Node side: echoes latency probes back to the sender, on UDP `port`."""
+
+    def __init__(self, port, host="0.0.0.0"):
+        self.port = port
+        self.host = host
+        self.sock = None
+
+    def run(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(64)
+                if data[:4] == MAGIC:
+                    self.sock.sendto(data, addr)
+            except OSError:
+                continue
+
+    def start(self):
+        """Binds now (raising OSError if the port is taken) and answers from a daemon thread."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        self.sock.bind((self.host, self.port))
+        threading.Thread(target=self.run, name="latency-echo", daemon=True).start()
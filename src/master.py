@@ -1,6 +1,23 @@
 import requests
 import time
 import threading
+import argparse
+import os
+import random
+import socket
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from selector import NodeIndex, is_eligible
+from scoring import ScoreEngine
+from history import read_recent
+from latency import LatencyProber
+from balancing import InFlight, affinity_key, make_strategy
+from admission import AdmissionController, Overloaded
+from breaker import OutlierDetector
+from cache import ResponseCache
+from membership import ALIVE, SUSPECT, Membership
+from shared import SharedStatus, default_path, fork_workers, wait_workers
+import metrics
 from flask import Flask, request, Response, render_template_string, jsonify
 
 app = Flask(__name__)
@@ -11,10 +28,204 @@ NODES = [
     {"ip": "192.168.1.12", "port": 80, "name": "XAMPP-Node-2", "region": "EU"},
 ]
 
+# Predictive scoring (see scoring.py), seeded from the controller's history if it is next to us
+HISTORY_DB = "mesh_history.db"
+SCORE_HALF_LIFE = 15        # seconds for a sample's weight to halve (health checks are every 5 s)
+SCORE_HORIZON = 30          # seconds ahead the score is projected
+SCORE_HYSTERESIS = 0.08    # "best" only switches node for an 8% better score
+SCORE_SEED_SAMPLES = 100
+SCORER = ScoreEngine(half_life=SCORE_HALF_LIFE, horizon=SCORE_HORIZON)
+
 NODE_STATS = {}
+ALIVE_NODES = set()      # names in NODE_STATS that passed their last health check
+NODE_INDEX = NodeIndex(hysteresis=SCORE_HYSTERESIS)
+
+# Network latency (see latency.py): TCP connect timing against each web port,
+# once per LATENCY_TCP_INTERVAL (as often as the health check, so a backend
+# sees no extra connections per second). Its rolling p50 replaces the
+# /status.php wall time as "ping" (kept as probe_ms), so routing isn't
+# steered by PHP.
+LATENCY_ENABLED = True
+LATENCY_INTERVAL = 1
+LATENCY_TIMEOUT = 1
+LATENCY_TCP_INTERVAL = 5
+LATENCY = LatencyProber(
+    lambda: [(n['name'], n['ip'], n['port']) for n in NODES],
+    mode="tcp",
+    interval=LATENCY_INTERVAL,
+    timeout=LATENCY_TIMEOUT,
+    tcp_interval=LATENCY_TCP_INTERVAL,
+) if LATENCY_ENABLED else None
+
+# Balancing: "best", "p2c", "least-outstanding", "weighted-rr" (uses each node's "weight")
+# or "consistent-hash" (sticky per AFFINITY key, weighted by weight * max users)
+# or "geo" (nearest node to the client, located through GEOIP_DB, see geo.py)
+BALANCING = "p2c"
+AFFINITY = ("cookie:PHPSESSID", "ip")   # first source present is the key, see balancing.affinity_key
+GEOIP_DB = "geoip.csv"                  # offline IP-prefix database: network,lat,lon,region,city
+GEO_KEY = ("header:X-Forwarded-For", "ip")
+KEY_SPEC = GEO_KEY if BALANCING == "geo" else AFFINITY
+IN_FLIGHT = InFlight()
+BALANCER = make_strategy(BALANCING, NODE_INDEX, IN_FLIGHT, geoip=GEOIP_DB)
+
+# Upstream connection pooling / streaming
+POOL_SIZE = 50          # keep-alive connections kept per backend
+CHUNK_SIZE = 64 * 1024  # bytes per streamed chunk, both directions
+
+# Failover: connect fast, retry bodiless idempotent requests on another node
+UPSTREAM_TIMEOUT = (1.0, 60)    # (connect, max idle gap between upstream bytes) seconds
+MAX_ATTEMPTS = 3
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+FAILURE_STATUSES = {502, 503, 504}   # count against the backend (and are retried)
+
+# Response cache for GET/HEAD (see cache.py). 0 MB disables it, a directory enables the disk tier.
+CACHE_MAX_MB = 64
+CACHE_DISK_DIR = None
+CACHE_DISK_MB = 512
+CACHE_WAIT = 5.0        # seconds a coalesced miss waits for the request fetching its key
+CACHE = ResponseCache(CACHE_MAX_MB * 2**20) if CACHE_MAX_MB else None
+
+# Multi-process serving (--workers N, see shared.py): this process runs the
+# health checks and writes NODE_STATS to SHARED; N forked workers proxy on
+# the same port and mirror it every SHARED_SYNC_INTERVAL. The cache, the
+# breaker and in-flight counts stay per worker. Gossip and metrics are
+# published to SHARED's slots every SHARED_PUBLISH_INTERVAL, so any worker
+# answers /admin/members and /metrics for every process.
+SHARED = None
+IS_WORKER = False
+SHARED_SLOT = 0             # this process's slot in SHARED: 0 here, i + 1 in worker i
+SHARED_CAPACITY = 4096
+SHARED_SYNC_INTERVAL = 0.05
+SHARED_PUBLISH_INTERVAL = 1.0
+
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+              'te', 'trailers', 'transfer-encoding', 'upgrade'}
+
+SESSIONS = {}
+SESSIONS_LOCK = threading.Lock()
+
+# Instrumentation (scraped from /metrics, see metrics.py)
+SELECT_SECONDS = metrics.Histogram("mesh_proxy_select_seconds", "Time to choose a backend")
+UPSTREAM_SECONDS = metrics.Histogram("mesh_proxy_upstream_seconds",
+                                     "Upstream time to response headers per node", ["node"])
+PROXY_ERRORS = metrics.Counter("mesh_proxy_errors_total", "Requests that failed upstream per node", ["node"])
+PROXY_UNAVAILABLE = metrics.Counter("mesh_proxy_unavailable_total", "Requests answered 503 (no eligible node)")
+HEALTH_SECONDS = metrics.Histogram("mesh_health_check_seconds", "Wall time of one health check pass")
+HEALTH_FAILURES = metrics.Counter("mesh_health_check_failures_total", "Failed health checks per node", ["node"])
+PROXY_RETRIES = metrics.Counter("mesh_proxy_retries_total", "Requests retried on another node")
+PROXY_EJECTIONS = metrics.Counter("mesh_proxy_ejections_total", "Outlier ejections per node", ["node"])
+metrics.Gauge("mesh_proxy_ejected", "1 while a node is ejected (open or half-open)", ["node"]).collect_from(
+    lambda: {name: int(state != "closed") for name, state in BREAKER.states().items()})
+metrics.Gauge("mesh_node_score", "Predicted routing score per node (lower is better)", ["node"]).collect_from(
+    SCORER.snapshot)
+metrics.Gauge("mesh_proxy_in_flight", "Requests currently outstanding per node", ["node"]).collect_from(
+    lambda: dict(IN_FLIGHT.counts))
+PROXY_SHED = metrics.Counter("mesh_proxy_shed_total", "Requests shed by admission control (503 + Retry-After)",
+                             ["priority"])
+QUEUE_SECONDS = metrics.Histogram("mesh_proxy_queue_seconds", "Time admitted requests waited for a backend slot")
+
+# Admission control (see admission.py): each backend gets a concurrency limit
+# that adapts to its latency, and requests that find every backend busy or
+# full wait in a priority queue instead of getting an immediate 503. Clients
+# choose their class with PRIORITY_HEADER: high, normal (default) or low.
+ADMISSION_INITIAL_LIMIT = 20    # concurrent requests per backend before the limit has adapted
+ADMISSION_MAX_LIMIT = 200
+QUEUE_SIZE = 256
+QUEUE_TIMEOUTS = (10.0, 5.0, 1.0)   # seconds a high / normal / low request may wait
+QUEUE_SHARES = (1.0, 0.8, 0.4)      # fraction of QUEUE_SIZE each class may fill
+PRIORITY_HEADER = "X-Mesh-Priority"
+ADMISSION = AdmissionController(
+    IN_FLIGHT,
+    initial_limit=ADMISSION_INITIAL_LIMIT,
+    max_limit=ADMISSION_MAX_LIMIT,
+    queue_size=QUEUE_SIZE,
+    timeouts=QUEUE_TIMEOUTS,
+    shares=QUEUE_SHARES,
+    on_shed=lambda priority, reason: PROXY_SHED.labels(priority).inc(),
+    on_wait=QUEUE_SECONDS.observe,
+    on_discard=lambda target: BREAKER.release_trial(target['name']),
+)
+metrics.Gauge("mesh_proxy_concurrency_limit", "Adaptive concurrency limit per node", ["node"]).collect_from(
+    ADMISSION.snapshot)
+metrics.Gauge("mesh_proxy_queue_depth", "Requests waiting for a backend slot").set_function(
+    lambda: sum(ADMISSION.queued))
+
+def set_node_stats(name, stats):
+    NODE_STATS[name] = stats
+    if stats['alive']:
+        ALIVE_NODES.add(name)
+    else:
+        ALIVE_NODES.discard(name)
+    # Ejected backends come back through a half-open trial, not the next health pass
+    if not stats['alive'] or not BREAKER.is_ejected(name):
+        NODE_INDEX.update(name, stats)
+        ADMISSION.wake()
+    if SHARED is not None and not IS_WORKER:
+        SHARED.put(name, stats)
+
+def remove_node_stats(name):
+    NODE_INDEX.remove(name)
+    NODE_STATS.pop(name, None)
+    ALIVE_NODES.discard(name)
+    ADMISSION.forget(name)
+    BALANCER.forget(name)
+    if SHARED is not None and not IS_WORKER:
+        SHARED.remove(name)
+
+def stats_from_record(name, record):
+    """A NODE_STATS entry back from a shared.SharedStatus record."""
+    stats = {
+        "name": name,
+        "ip": record['ip'],
+        "port": record['port'],
+        "alive": record['alive'],
+        "ping": record['ping'],
+        "load": record['load'] or 0,
+        "users": record['users'],
+        "max": record['max'],
+    }
+    if record['alive']:
+        stats.update(probe_ms=record['probe_ms'], weight=record['weight'], region=record['region'],
+                     location={"lat": record['lat'], "lon": record['lon'], "city": record['city']}
+                     if record['lat'] is not None else None)
+        for key in ("score", "rtt_p95", "jitter", "loss"):
+            if record[key] is not None:
+                stats[key] = record[key]
+    return stats
+
+def follow_shared():
+    """--workers: a worker's NODES, NODE_STATS and NODE_INDEX follow the health checker's."""
+    global NODES
+    while True:
+        try:
+            changes = SHARED.changes()
+            for name, record in changes:
+                if record is None:
+                    remove_node_stats(name)
+                else:
+                    set_node_stats(name, stats_from_record(name, record))
+            if changes:
+                NODES = [{"ip": s['ip'], "port": s['port'], "name": name, "region": s.get('region')}
+                         for name, s in list(NODE_STATS.items())]
+        except Exception as e:
+            print(f"Shared status sync failed: {e}")
+        time.sleep(SHARED_SYNC_INTERVAL)
+
+def publish_shared():
+    """--workers: every process publishes its metrics to its SHARED slot, the health checker its gossip view too."""
+    while True:
+        try:
+            doc = {"metrics": metrics.REGISTRY.collect()}
+            if not IS_WORKER:
+                doc["members"] = MEMBERSHIP.snapshot() if MEMBERSHIP is not None else []
+            SHARED.publish(SHARED_SLOT, doc)
+        except Exception as e:
+            print(f"Shared publish failed: {e}")
+        time.sleep(SHARED_PUBLISH_INTERVAL)
 
 def check_health():
     while True:
+        sweep_start = time.perf_counter()
         for node in NODES:
             url = f"http://{node['ip']}:{node['port']}/status.php"
             try:
@@ -24,44 +235,182 @@ def check_health():
                 
                 if resp.status_code == 200:
                     data = resp.json()
-                    NODE_STATS[node['name']] = {
+                    stats = {
+                        "name": node['name'],
                         "ip": node['ip'],
+                        "port": node['port'],
                         "alive": True,
                         "ping": round(latency, 2),
+                        "probe_ms": round(latency, 2),
                         "load": data.get('cpu_load', 0),
                         "users": data.get('current_users', 0),
-                        "max": data.get('max_users', 100)
+                        "max": data.get('max_users', 100),
+                        "weight": node.get('weight', 1.0),
+                        "region": data.get('region', node.get('region')),
+                        "location": data.get('location') or node.get('location'),
                     }
+                    rtt = LATENCY.stats(node['name']) if LATENCY is not None else None
+                    if rtt is not None:
+                        stats.update(ping=rtt['p50'], rtt_p95=rtt['p95'], jitter=rtt['jitter'], loss=rtt['loss'])
+                    stats = SCORER.annotate(node['name'], stats, time.time())
                 else:
                     raise Exception("Status 500")
             except:
-                NODE_STATS[node['name']] = {
+                HEALTH_FAILURES.labels(node['name']).inc()
+                stats = {
+                    "name": node['name'],
                     "ip": node['ip'],
+                    "port": node['port'],
                     "alive": False,
                     "ping": 9999,
                     "load": 0,
                     "users": 0,
                     "max": 0
                 }
+            set_node_stats(node['name'], stats)
+        HEALTH_SECONDS.observe(time.perf_counter() - sweep_start)
         time.sleep(5)
 
-def get_best_node():
-    best = None
-    min_score = float('inf') 
-    
-    for name, stats in NODE_STATS.items():
-        if not stats['alive']: continue
-        if stats['users'] >= stats['max']: continue
-        
-        # Score based on Ping + Load (Lower is better)
-        score = stats['ping'] + (stats['load'] * 2)
-        
-        if score < min_score:
-            min_score = score
-            best = stats
-            
+# Membership (see membership.py): nodes that join the gossip mesh are added to
+# NODES at runtime (routed to on their web_port) and dropped once they are dead or left.
+# Off by default: gossip decides where traffic goes, so it is only enabled together
+# with GOSSIP_SECRET, the shared HMAC key every member signs its datagrams with.
+GOSSIP_ENABLED = False
+GOSSIP_PORT = 7948
+GOSSIP_SEEDS = ["127.0.0.1:7946"]   # the brain.py controller
+GOSSIP_SECRET = os.environ.get("MESH_GOSSIP_SECRET")    # same value in every node's config.yaml gossip_secret
+NODES_LOCK = threading.Lock()
+
+def on_member(member):
+    global NODES
+    if member.meta.get('role') != 'node' or not member.host:
+        return
+    name = member.name
+    with NODES_LOCK:
+        current = next((n for n in NODES if n['name'] == name), None)
+        others = [n for n in NODES if n['name'] != name]
+        if member.status in (ALIVE, SUSPECT):
+            node = {
+                "ip": member.host,
+                "port": member.meta.get('web_port', 8000),
+                "name": name,
+                "region": member.meta.get('region'),
+                "location": member.meta.get('location'),
+                "gossip": True,
+            }
+            if current == node:
+                return
+            NODES = others + [node]
+        elif current is not None and current.get('gossip'):
+            NODES = others
+        else:
+            return
+
+    if member.status in (ALIVE, SUSPECT):
+        print(f"Membership: {name} joined from {member.host}")
+    else:
+        remove_node_stats(name)
+        print(f"Membership: {name} {member.status}, removed from rotation")
+
+MEMBERSHIP = Membership(
+    f"proxy-{socket.gethostname()}",
+    GOSSIP_PORT,
+    {"role": "controller", "service": "master"},
+    seeds=GOSSIP_SEEDS,
+    secret=GOSSIP_SECRET,
+    on_change=on_member,
+) if GOSSIP_ENABLED else None
+
+def eject_node(name):
+    NODE_INDEX.remove(name)
+    PROXY_EJECTIONS.labels(name).inc()
+    print(f"Ejected {name} from rotation (passive health check)")
+
+def restore_node(name):
+    stats = NODE_STATS.get(name)
+    if stats:
+        NODE_INDEX.update(name, stats)
+        ADMISSION.wake()
+    print(f"Restored {name} to rotation")
+
+BREAKER = OutlierDetector(total=lambda: len(NODES), on_eject=eject_node, on_restore=restore_node)
+
+def get_best_node(exclude=(), key=None):
+    """
+    Balancer pick, except that an ejected backend due for its half-open trial
+    gets this request. `exclude` holds backends this request already failed
+    on, `key` is the request's affinity key for consistent-hash balancing.
+    """
+    start = time.perf_counter()
+    trial = BREAKER.take_trial()
+    if trial is not None:
+        stats = NODE_STATS.get(trial)
+        if stats and trial not in exclude and is_eligible(stats):
+            SELECT_SECONDS.observe(time.perf_counter() - start)
+            return stats
+        BREAKER.release_trial(trial)
+
+    best = BALANCER.pick(key, exclude)
+    if best and best['name'] in exclude:
+        others = [stats for name, stats in NODE_INDEX.candidates() if name not in exclude]
+        best = random.choice(others) if others else None
+    SELECT_SECONDS.observe(time.perf_counter() - start)
     return best
 
+def can_fail_over(tried):
+    return any(name not in tried for name, _ in NODE_INDEX.candidates())
+
+def get_session(name):
+    """One pooled keep-alive session per backend node."""
+    session = SESSIONS.get(name)
+    if session is None:
+        with SESSIONS_LOCK:
+            session = SESSIONS.get(name)
+            if session is None:
+                session = requests.Session()
+                session.trust_env = False
+                session.headers.clear()  # forward the client's headers, not requests' defaults
+                # Never let one client's Set-Cookie leak into another client's request
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount("http://", adapter)
+                SESSIONS[name] = session
+    return session
+
+def iter_request_body(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+def finish_upstream(name, resp):
+    """Runs once the client response is closed, streamed or not."""
+    def close():
+        resp.close()
+        ADMISSION.release(name)
+    return close
+
+class UpstreamBody:
+    """
+    Streamed upstream body. With direct_passthrough werkzeug hands this to
+    the WSGI server as-is (Response.call_on_close callbacks never run), and
+    the server calls close() when the client response is done, read to the
+    end or not, so that is where the admission slot is released.
+    """
+
+    def __init__(self, name, resp):
+        self.resp = resp
+        self.finish = finish_upstream(name, resp)
+
+    def __iter__(self):
+        return self.resp.raw.stream(CHUNK_SIZE, decode_content=False)
+
+    def close(self):
+        finish, self.finish = self.finish, None
+        if finish is not None:
+            finish()
+
 @app.route('/admin/dashboard')
 def dashboard():
     html = """
@@ -101,40 +450,503 @@ def dashboard():
     """
     return render_template_string(html, nodes=NODE_STATS)
 
+@app.route('/metrics')
+def view_metrics():
+    if IS_WORKER:
+        return metrics.flask_response(metrics.merge(
+            SHARED.gather("metrics", SHARED_SLOT, metrics.REGISTRY.collect())))
+    return metrics.flask_response()
+
+@app.route('/admin/members')
+def members():
+    if IS_WORKER:
+        return jsonify((SHARED.published(0) or {}).get("members", []))
+    return jsonify(MEMBERSHIP.snapshot() if MEMBERSHIP is not None else [])
+
+@app.route('/admin/cache')
+def cache_stats():
+    if CACHE is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(CACHE.stats(), enabled=True))
+
 # REVERSE PROXY LOGIC
-@app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE'])
-@app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def proxy(path):
-    target = get_best_node()
-    
-    if not target:
-        return "No servers available", 503
+PROXY_METHODS = ['GET', 'POST', 'PUT', 'DELETE']
+
+class UpstreamAttempts:
+    """
+    Failover and retry policy for one proxied request, shared by the
+    threaded proxy (fetch_upstream) and the ASGI one (make_asgi_app's fetch):
+    which backend to try next, whether to queue for it, and what each
+    outcome does to the breaker, the admission limits and the metrics.
+    The callers only do the transport.
+    """
+
+    def __init__(self, method, has_body, key, priority):
+        # A streamed body can only be sent once, so only bodiless idempotent requests are retried
+        self.attempts = MAX_ATTEMPTS if method in RETRY_METHODS and not has_body else 1
+        self.key = key
+        self.priority = priority
+        self.deadline = ADMISSION.deadline(priority)
+        self.tried = []
+        self.attempt = 0
+        self.error = None
+
+    def __iter__(self):
+        for self.attempt in range(self.attempts):
+            yield self.attempt
+
+    def admission(self):
+        """Arguments for ADMISSION.admit()/admit_async() on this attempt."""
+        tried = self.tried
+        # Only the first attempt queues, and only while some node is up; a retry
+        # goes to a free node now or not at all
+        queue = not self.attempt and ALIVE_NODES
+        key = self.key
+        return (lambda full: get_best_node(tried + full, key)), self.priority, (self.deadline if queue else None)
+
+    def start(self, target):
+        name = target['name']
+        self.tried.append(name)
+        if self.attempt:
+            PROXY_RETRIES.inc()
+        return name
+
+    def failed(self, name, error):
+        """The request never got a response from `name`."""
+        ADMISSION.observe(name, None, False)
+        ADMISSION.release(name)
+        PROXY_ERRORS.labels(name).inc()
+        BREAKER.record(name, False)
+        self.error = error
+
+    def answered(self, name, status, elapsed):
+        """`name` answered after `elapsed` seconds; True if the caller should drop it and try another node."""
+        UPSTREAM_SECONDS.labels(name).observe(elapsed)
+        failed = status in FAILURE_STATUSES
+        BREAKER.record(name, not failed, elapsed)
+        ADMISSION.observe(name, elapsed, not failed)
+        return failed and self.attempt + 1 < self.attempts and can_fail_over(self.tried)
+
+def fetch_upstream(method, path, query, headers, body):
+    """
+    Sends one client request upstream, failing over to another node where
+    that is safe (see UpstreamAttempts). Returns (name, resp, error): resp is
+    a streamed response whose owner must close it and release the admission
+    slot (stream_back does both); resp None with error None means no node
+    was available, error Overloaded that the request was shed while queued.
+    """
+    key = affinity_key(KEY_SPEC, request.headers.get, request.remote_addr) if BALANCER.uses_key else None
+    plan = UpstreamAttempts(method, body is not None, key,
+                            ADMISSION.priority_of(request.headers.get(PRIORITY_HEADER)))
+
+    for _ in plan:
+        try:
+            target = ADMISSION.admit(*plan.admission())
+        except Overloaded as e:
+            return None, None, e
+        if not target:
+            break
+        name = plan.start(target)
+
+        try:
+            session = get_session(name)
+            prepared = session.prepare_request(requests.Request(
+                method=method,
+                url=f"http://{target['ip']}:{target['port']}/{path}{query}",
+                headers=headers,
+                data=body,
+            ))
+            if 'Content-Length' in headers:
+                # Known size: stream it as-is instead of re-chunking
+                prepared.headers.pop('Transfer-Encoding', None)
+
+            sent = time.perf_counter()
+            resp = session.send(prepared, stream=True, allow_redirects=False, timeout=UPSTREAM_TIMEOUT)
+        except Exception as e:
+            plan.failed(name, e)
+            continue
+
+        if plan.answered(name, resp.status_code, time.perf_counter() - sent):
+            resp.close()
+            ADMISSION.release(name)
+            continue
+        return name, resp, None
+
+    return None, None, plan.error
+
+def upstream_headers(resp):
+    # Body is passed through undecoded, so Content-Encoding/Length stay valid
+    return [(key, value) for (key, value) in resp.raw.headers.items()
+            if key.lower() not in HOP_BY_HOP]
+
+def stream_back(name, resp):
+    return Response(UpstreamBody(name, resp), resp.status_code, upstream_headers(resp), direct_passthrough=True)
+
+def upstream_error(error):
+    if isinstance(error, Overloaded):
+        return "Server busy, retry later", 503, {"Retry-After": str(error.retry_after)}
+    if error is not None:
+        return f"Proxy Error: {str(error)}", 500
+    PROXY_UNAVAILABLE.inc()
+    return "No servers available", 503
+
+def cached_response(status, headers, body, label):
+    """Response with a body from the cache; a HEAD gets the same headers, Content-Length included, and no body."""
+    head = request.method == 'HEAD'
+    response = Response(b"" if head else body, status, headers)
+    if head and status != 304:
+        response.headers['Content-Length'] = str(len(body))
+    response.headers['X-Cache'] = label
+    return response
+
+def from_cache(entry, tier, req_headers, label):
+    return cached_response(*CACHE.serve(entry, tier, req_headers), label)
+
+def revalidation_headers(headers, stale):
+    """(name, value) pairs for fetching a key: the client's, or with a stale entry our own validators instead."""
+    if stale is None:
+        return list(headers)
+    return ([(k, v) for k, v in headers if k.lower() not in ('if-none-match', 'if-modified-since')]
+            + list(CACHE.validators(stale).items()))
+
+def cache_lifetime(method, status, out, length, req_headers):
+    """Freshness lifetime if this upstream response may be stored, else None (stream it through)."""
+    if method != 'GET' or not length or not length.isdigit():
+        return None
+    return CACHE.cacheable(status, out, req_headers, int(length))
+
+def store_fetched(key, req_headers, status, out, body, length, lifetime):
+    """Stores a fully read response, unless the upstream cut it short."""
+    if len(body) == int(length):
+        CACHE.store(key, req_headers, status, out, body, lifetime)
+
+def cache_lookup(key, req_headers, revalidate):
+    """(entry, tier, usable): the cached entry for a request and whether it can be served without upstream."""
+    entry, tier = CACHE.lookup(key, req_headers)
+    return entry, tier, entry is not None and entry.fresh() and not revalidate
+
+def fetch_and_store(key, path, query, headers, req_headers, stale):
+    """Cache miss (or stale entry): fetch, revalidate or store, and answer."""
+    headers = dict(revalidation_headers(headers.items(), stale))
+    name, resp, error = fetch_upstream(request.method, path, query, headers, None)
+    if resp is None:
+        return upstream_error(error)
+
+    if resp.status_code == 304 and stale is not None:
+        finish_upstream(name, resp)()
+        entry = CACHE.refresh(key, req_headers, stale, resp.raw.headers.items())
+        return from_cache(entry, "revalidated", req_headers, "REVALIDATED")
+
+    CACHE.miss()
+    out = upstream_headers(resp)
+    length = resp.headers.get('Content-Length')
+    lifetime = cache_lifetime(request.method, resp.status_code, out, length, req_headers)
+    if lifetime is None:
+        return stream_back(name, resp)
 
-    target_url = f"http://{target['ip']}/{path}"
-    
     try:
-        resp = requests.request(
-            method=request.method,
-            url=target_url,
-            headers={key: value for (key, value) in request.headers if key != 'Host'},
-            data=request.get_data(),
-            cookies=request.cookies,
-            allow_redirects=False,
-            params=request.args
+        body = resp.raw.read(decode_content=False)
+    finally:
+        finish_upstream(name, resp)()
+    store_fetched(key, req_headers, resp.status_code, out, body, length, lifetime)
+    return cached_response(resp.status_code, out, body, 'MISS')
+
+def cached_proxy(path, query, headers):
+    req_headers = {k.lower(): v for k, v in headers.items()}
+    skip, revalidate = CACHE.request_directives(req_headers)
+    if skip:
+        name, resp, error = fetch_upstream(request.method, path, query, headers, None)
+        return stream_back(name, resp) if resp is not None else upstream_error(error)
+
+    key = CACHE.key(f"/{path}{query}")
+    entry, tier, usable = cache_lookup(key, req_headers, revalidate)
+    if usable:
+        return from_cache(entry, tier, req_headers, "HIT")
+
+    leader, flight = CACHE.begin(key)
+    if not leader:
+        # Someone is already fetching this key: wait for it rather than stampeding the backend
+        CACHE.wait(flight, CACHE_WAIT)
+        entry, tier, usable = cache_lookup(key, req_headers, revalidate)
+        if usable:
+            return from_cache(entry, tier, req_headers, "HIT")
+        return fetch_and_store(key, path, query, headers, req_headers, entry)
+    try:
+        return fetch_and_store(key, path, query, headers, req_headers, entry)
+    finally:
+        CACHE.end(key, flight)
+
+@app.route('/', defaults={'path': ''}, methods=PROXY_METHODS)
+@app.route('/<path:path>', methods=PROXY_METHODS)
+def proxy(path):
+    query = ""
+    if request.query_string:
+        query = "?" + request.query_string.decode("latin-1")
+
+    headers = {key: value for (key, value) in request.headers
+               if key.lower() != 'host' and key.lower() not in HOP_BY_HOP}
+
+    body = None
+    if request.content_length or request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        body = iter_request_body(request.stream)
+
+    if CACHE is not None and body is None and request.method in ('GET', 'HEAD'):
+        return cached_proxy(path, query, headers)
+
+    name, resp, error = fetch_upstream(request.method, path, query, headers, body)
+    if resp is None:
+        return upstream_error(error)
+    return stream_back(name, resp)
+
+# ASYNC SERVING MODE (python master.py --async)
+def make_asgi_app():
+    """
+    Same proxy on an event loop: upstream I/O goes through one pooled aiohttp
+    session and bodies are streamed chunk by chunk, so thousands of slow
+    clients don't each pin a thread. /admin/* is still served by Flask.
+    """
+    import aiohttp
+    from asgi import Router, header, iter_body, send_response
+
+    router = Router(app, flask_prefixes=("/admin/", "/metrics"))
+    upstream = {}
+    hop = {h.encode() for h in HOP_BY_HOP} | {b'host'}
+
+    async def startup():
+        upstream["session"] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, limit_per_host=POOL_SIZE, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=UPSTREAM_TIMEOUT[0],
+                                          sock_read=UPSTREAM_TIMEOUT[1]),
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False,
+            skip_auto_headers=("User-Agent", "Accept-Encoding", "Content-Type"),
         )
 
-        excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
-        headers = [(name, value) for (name, value) in resp.raw.headers.items()
-                   if name.lower() not in excluded_headers]
+    async def shutdown():
+        await upstream["session"].close()
+
+    router.on_startup.append(startup)
+    router.on_shutdown.append(shutdown)
+
+    async def fetch(method, url_path, headers, body, key, priority):
+        """Async twin of fetch_upstream(); the caller must release() resp and the admission slot."""
+        plan = UpstreamAttempts(method, body is not None, key, priority)
+
+        for _ in plan:
+            try:
+                target = await ADMISSION.admit_async(*plan.admission())
+            except Overloaded as e:
+                return None, None, e
+            if not target:
+                break
+            name = plan.start(target)
+
+            sent = time.perf_counter()
+            try:
+                resp = await upstream["session"].request(
+                    method, f"http://{target['ip']}:{target['port']}{url_path}",
+                    headers=headers, data=body, allow_redirects=False)
+            except Exception as e:
+                plan.failed(name, e)
+                continue
+
+            if plan.answered(name, resp.status, time.perf_counter() - sent):
+                resp.release()
+                ADMISSION.release(name)
+                continue
+            return name, resp, None
+
+        return None, None, plan.error
+
+    def raw_headers(headers):
+        return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    async def relay(send, name, resp):
+        """Streams an upstream response to the client, then releases it."""
+        try:
+            out = [(k, v) for k, v in resp.raw_headers if k.lower() not in hop]
+            await send({"type": "http.response.start", "status": resp.status, "headers": out})
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        except Exception:
+            PROXY_ERRORS.labels(name).inc()   # headers are out, nothing left to tell the client
+        finally:
+            resp.release()
+            ADMISSION.release(name)
+
+    async def reply_error(send, error):
+        if isinstance(error, Overloaded):
+            return await send_response(send, 503, b"Server busy, retry later",
+                                       [(b"retry-after", str(error.retry_after).encode())])
+        if error is not None:
+            return await send_response(send, 500, f"Proxy Error: {str(error)}".encode())
+        PROXY_UNAVAILABLE.inc()
+        await send_response(send, 503, b"No servers available")
+
+    async def send_cached(send, method, status, headers, body, label):
+        """A body from the cache; a HEAD gets the same headers, Content-Length included, and no body."""
+        headers = raw_headers(headers)
+        if method == "HEAD":
+            if status != 304 and not any(k.lower() == b"content-length" for k, _ in headers):
+                headers.append((b"content-length", str(len(body)).encode()))
+            body = b""
+        await send({"type": "http.response.start", "status": status, "headers": headers + [(b"x-cache", label)]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def reply_cached(send, method, entry, tier, req_headers, label):
+        await send_cached(send, method, *CACHE.serve(entry, tier, req_headers), label)
+
+    async def fetch_and_store(send, method, key, url_path, headers, req_headers, stale, affinity, priority):
+        headers = revalidation_headers(headers, stale)
+        name, resp, error = await fetch(method, url_path, headers, None, affinity, priority)
+        if resp is None:
+            return await reply_error(send, error)
+
+        if resp.status == 304 and stale is not None:
+            resp.release()
+            ADMISSION.release(name)
+            entry = CACHE.refresh(key, req_headers, stale, resp.headers.items())
+            return await reply_cached(send, method, entry, "revalidated", req_headers, b"REVALIDATED")
+
+        CACHE.miss()
+        length = resp.headers.get('Content-Length')
+        out = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in resp.raw_headers if k.lower() not in hop]
+        lifetime = cache_lifetime(method, resp.status, out, length, req_headers)
+        if lifetime is None:
+            return await relay(send, name, resp)
+
+        try:
+            body = await resp.read()
+        finally:
+            resp.release()
+            ADMISSION.release(name)
+        store_fetched(key, req_headers, resp.status, out, body, length, lifetime)
+        await send_cached(send, method, resp.status, out, body, b"MISS")
+
+    async def cached_proxy(send, method, url_path, headers, affinity, priority):
+        req_headers = {k.lower(): v for k, v in headers}
+        skip, revalidate = CACHE.request_directives(req_headers)
+        if skip:
+            name, resp, error = await fetch(method, url_path, headers, None, affinity, priority)
+            return await (relay(send, name, resp) if resp is not None else reply_error(send, error))
+
+        key = CACHE.key(url_path)
+        entry, tier, usable = cache_lookup(key, req_headers, revalidate)
+        if usable:
+            return await reply_cached(send, method, entry, tier, req_headers, b"HIT")
 
-        return Response(resp.content, resp.status_code, headers)
-    except Exception as e:
-        return f"Proxy Error: {str(e)}", 500
+        leader, flight = CACHE.begin(key)
+        if not leader:
+            await CACHE.wait_async(flight, CACHE_WAIT)
+            entry, tier, usable = cache_lookup(key, req_headers, revalidate)
+            if usable:
+                return await reply_cached(send, method, entry, tier, req_headers, b"HIT")
+            return await fetch_and_store(send, method, key, url_path, headers, req_headers, entry, affinity, priority)
+        try:
+            await fetch_and_store(send, method, key, url_path, headers, req_headers, entry, affinity, priority)
+        finally:
+            CACHE.end(key, flight)
+
+    async def proxy_async(scope, receive, send):
+        method = scope["method"]
+        if method not in PROXY_METHODS and method != "HEAD":
+            return await send_response(send, 405, b"Method Not Allowed")
+
+        url_path = scope["path"]
+        if scope["query_string"]:
+            url_path += "?" + scope["query_string"].decode("latin-1")
+
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]
+                   if k.lower() not in hop]
+        lowered = {k.lower(): v for k, v in scope["headers"]}
+        has_body = (lowered.get(b"content-length", b"0") != b"0"
+                    or lowered.get(b"transfer-encoding", b"").lower() == b"chunked")
+
+        affinity = None
+        if BALANCER.uses_key:
+            client = scope.get("client")
+            affinity = affinity_key(KEY_SPEC, lambda n: header(scope, n), client[0] if client else None)
+
+        priority = ADMISSION.priority_of(header(scope, PRIORITY_HEADER))
+
+        if CACHE is not None and not has_body and method in ('GET', 'HEAD'):
+            return await cached_proxy(send, method, url_path, headers, affinity, priority)
+
+        name, resp, error = await fetch(method, url_path, headers, iter_body(receive) if has_body else None,
+                                        affinity, priority)
+        if resp is None:
+            return await reply_error(send, error)
+        await relay(send, name, resp)
+
+    router.default = proxy_async
+    return router
+
+def make_cache(cache_mb, cache_dir):
+    return ResponseCache(cache_mb * 2**20, disk_dir=cache_dir,
+                         disk_max_bytes=CACHE_DISK_MB * 2**20) if cache_mb else None
+
+def serve(async_mode, port, sock=None):
+    """Runs the proxy; with sock, on that already-bound listener (a --workers child)."""
+    if async_mode:
+        import uvicorn
+        if sock is not None:
+            uvicorn.run(make_asgi_app(), fd=sock.fileno(), log_level="warning")
+        else:
+            uvicorn.run(make_asgi_app(), host="0.0.0.0", port=port, log_level="warning")
+    elif sock is not None:
+        from werkzeug.serving import make_server
+        make_server("0.0.0.0", port, app, threaded=True, fd=sock.fileno()).serve_forever()
+    else:
+        app.run(host="0.0.0.0", port=port, threaded=True)
+
+def run_worker(args, index, sock):
+    global IS_WORKER, SHARED, SHARED_SLOT, CACHE
+    IS_WORKER = True
+    SHARED_SLOT = index + 1
+    SHARED = SharedStatus.open(SHARED.path)
+    # Each worker caches on its own; disk tiers can't share a directory
+    CACHE = make_cache(args.cache_mb, os.path.join(args.cache_dir, f"worker-{index}") if args.cache_dir else None)
+    threading.Thread(target=follow_shared, daemon=True).start()
+    threading.Thread(target=publish_shared, daemon=True).start()
+    serve(args.async_mode, args.port, sock)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesh load balancer / reverse proxy")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="serve with uvicorn (ASGI) instead of the threaded Flask server")
+    parser.add_argument("--port", type=int, default=80)
+    parser.add_argument("--cache-mb", type=int, default=CACHE_MAX_MB, help="response cache size, 0 disables it")
+    parser.add_argument("--cache-dir", default=CACHE_DISK_DIR, help="enable the on-disk cache tier here")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="proxy worker processes sharing the port (POSIX only, see shared.py)")
+    args = parser.parse_args()
+
+    workers = []
+    if args.workers > 1:
+        # Fork before any thread starts: the children only proxy and follow SHARED
+        SHARED = SharedStatus.create(default_path("master", args.port), SHARED_CAPACITY, slots=args.workers + 1)
+        workers = fork_workers(args.workers, args.port, lambda i, sock: run_worker(args, i, sock))
+    else:
+        CACHE = make_cache(args.cache_mb, args.cache_dir)
+
+    SCORER.seed(read_recent(HISTORY_DB, [n['name'] for n in NODES], SCORE_SEED_SAMPLES))
+
+    if MEMBERSHIP is not None:
+        MEMBERSHIP.start()
+    if LATENCY is not None:
+        LATENCY.start()
+
     t = threading.Thread(target=check_health)
     t.daemon = True
     t.start()
     
-  #  app.run(host="0.0.0.0", port=80, threaded=True) 
-    app.run(host="0.0.0.0", port=80, threaded=True)
\ No newline at end of file
+    if workers:
+        threading.Thread(target=publish_shared, daemon=True).start()
+        print(f"Proxying on port {args.port} with {len(workers)} workers")
+        try:
+            wait_workers(workers)
+        finally:
+            SHARED.unlink()
+    else:
+        serve(args.async_mode, args.port)
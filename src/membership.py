@@ -0,0 +1,428 @@
+"""
+Mesh membership: SWIM-style gossip over UDP.
+
+Every participant (node agents, brain.py, master.py) runs a Membership with
+its own identity in `meta`. A new member asks one of its seeds for a full
+sync, and from then on membership spreads peer to peer:
+
+- Failure detection: every `period` each member pings one other member
+  (round-robin over a shuffled list). Without an ack in `ack_timeout` it
+  asks `indirect` others to ping it on its behalf (ping-req); still nothing
+  by the end of the period and the target becomes suspect. A suspect that
+  doesn't refute within the suspicion timeout (scaled with log n) is dead.
+- Dissemination: changes are piggybacked on pings and acks, each one
+  retransmitted about retransmit_mult * log10(n) times, so an update
+  reaches everyone in O(log n) periods with O(1) messages per member per
+  period, whatever the mesh size.
+- Incarnations: a member that hears it is suspected or dead bumps its
+  incarnation and re-announces itself alive; a restarted member starts
+  from the wall clock, so it always outranks its previous life.
+- Local health (Lifeguard style): missed acks and having to refute
+  suspicion raise a member's own health score, which stretches its ack
+  timeout, so an overloaded member slows down instead of accusing
+  healthy peers.
+- A full sync from a random member every `sync_every` seconds (sooner
+  right after joining) heals anything the gossip missed: lost datagrams,
+  partitions, many members joining at once.
+
+Every datagram starts with an HMAC-SHA256 tag of the rest, keyed with the
+mesh's shared secret; anything unsigned or badly signed is dropped before
+it is parsed, so only holders of the secret can join or announce members.
+After the tag, the wire format is compact JSON, one message per datagram:
+    {"v": 1, "t": "ping"|"ack"|"ping-req"|"sync-req"|"sync"|"gossip",
+     "me": <sender record>, "u": [<records>], ...}
+A record is {"n": name, "h": host, "p": gossip port, "i": incarnation,
+"s": status, "m": meta}. An empty host is filled in from the datagram's
+source address by whoever hears from the member directly.
+"""
+
+import hashlib
+import hmac
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+VERSION = 1
+
+ALIVE = "alive"
+SUSPECT = "suspect"
+DEAD = "dead"
+LEFT = "left"
+RANK = {ALIVE: 0, SUSPECT: 1, DEAD: 2, LEFT: 2}
+
+MAX_PIGGYBACK = 8   # records per ping/ack
+SYNC_CHUNK = 100    # records per sync datagram, keeps them well under 64 KB
+MAX_HEALTH = 8      # ack timeout stretches up to (1 + MAX_HEALTH) x
+TAG_BYTES = hashlib.sha256().digest_size
+
+
+class Member:
+    __slots__ = ("name", "host", "port", "incarnation", "status", "meta", "since")
+
+    def __init__(self, name, host, port, incarnation, status, meta):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.incarnation = incarnation
+        self.status = status
+        self.meta = meta
+        self.since = time.monotonic()
+
+    @property
+    def addr(self):
+        return (self.host, self.port)
+
+    def wire(self):
+        return {"n": self.name, "h": self.host, "p": self.port, "i": self.incarnation,
+                "s": self.status, "m": self.meta}
+
+    @classmethod
+    def from_wire(cls, record):
+        return cls(record["n"], record.get("h", ""), int(record["p"]), int(record["i"]),
+                   record["s"], record.get("m") or {})
+
+    def as_dict(self):
+        return {"name": self.name, "host": self.host, "port": self.port,
+                "incarnation": self.incarnation, "status": self.status, "meta": self.meta}
+
+
+def _addr(spec):
+    host, port = spec.rsplit(":", 1)
+    return (socket.gethostbyname(host), int(port))
+
+
+class Membership:
+    """
+    One participant in the gossip mesh. on_change(member) is called (from
+    the gossip threads, outside any lock) whenever another member appears,
+    changes status, address or meta; member.status is one of ALIVE,
+    SUSPECT, DEAD or LEFT. Dead and left members are forgotten after
+    `forget_after` seconds. `secret` (str or bytes, the same on every
+    member) signs and authenticates every datagram; start() refuses to run
+    without one.
+    """
+
+    def __init__(self, name, port, meta, seeds=(), on_change=None, host="0.0.0.0", advertise="", secret=None,
+                 period=1.0, ack_timeout=0.3, indirect=3, suspicion_mult=4, retransmit_mult=3,
+                 sync_every=10.0, forget_after=60.0):
+        self.me = Member(name, advertise, port, int(time.time()), ALIVE, meta)
+        self.seeds = list(seeds)
+        self.key = secret.encode() if isinstance(secret, str) else secret
+        self.on_change = on_change
+        self.host = host
+        self.period = period
+        self.ack_timeout = ack_timeout
+        self.indirect = indirect
+        self.suspicion_mult = suspicion_mult
+        self.retransmit_mult = retransmit_mult
+        self.sync_every = sync_every
+        self.forget_after = forget_after
+
+        self.lock = threading.Lock()
+        self.members = {}       # name -> Member, everyone but us
+        self.broadcasts = {}    # name -> transmissions left for its latest record
+        self.pending = {}       # seq -> Event, our outstanding pings
+        self.relays = {}        # seq -> (requester addr, requester seq, expires) for ping-req
+        self.order = []         # probe round-robin
+        self.seq = 0
+        self.health = 0         # local health score, 0 is healthy
+        self.sock = None
+        self.running = False
+        self.joined = threading.Event()
+
+    # --- state ---
+
+    def snapshot(self):
+        """Every member we know of, us included, as plain dicts."""
+        with self.lock:
+            return [self.me.as_dict()] + [m.as_dict() for m in self.members.values()]
+
+    def alive(self):
+        with self.lock:
+            return [m for m in self.members.values() if m.status == ALIVE]
+
+    def _retransmits(self):
+        return self.retransmit_mult * math.ceil(math.log10(len(self.members) + 2))
+
+    def suspicion_timeout(self):
+        return self.suspicion_mult * max(1.0, math.log10(len(self.members) + 1)) * self.period
+
+    def _broadcast(self, member):
+        self.broadcasts[member.name] = self._retransmits()
+
+    def _piggyback(self):
+        with self.lock:
+            if not self.broadcasts:
+                return []
+            names = sorted(self.broadcasts, key=self.broadcasts.get, reverse=True)[:MAX_PIGGYBACK]
+            out = []
+            for name in names:
+                member = self.me if name == self.me.name else self.members.get(name)
+                left = self.broadcasts[name] - 1
+                if member is None or left <= 0:
+                    self.broadcasts.pop(name, None)
+                else:
+                    self.broadcasts[name] = left
+                if member is not None:
+                    out.append(member.wire())
+            return out
+
+    def _merge(self, record):
+        """Applies one record under the SWIM precedence rules. Returns the Member to report, or None."""
+        try:
+            update = Member.from_wire(record)
+            rank = RANK[update.status]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if update.name == self.me.name:
+            if update.status != ALIVE and update.incarnation >= self.me.incarnation and self.running:
+                # Someone thinks we're gone: refute with a newer incarnation
+                self.me.incarnation = update.incarnation + 1
+                self.health = min(MAX_HEALTH, self.health + 1)
+                self._broadcast(self.me)
+            return None
+
+        current = self.members.get(update.name)
+        if current is not None:
+            newer = (update.incarnation > current.incarnation
+                     or (update.incarnation == current.incarnation and rank > RANK[current.status]))
+            learned_host = (update.incarnation == current.incarnation and update.status == current.status
+                            and update.host and not current.host)
+            if not newer and not learned_host:
+                return None
+            update.host = update.host or current.host
+            if update.status == current.status:
+                update.since = current.since
+
+        self.members[update.name] = update
+        self._broadcast(update)
+        if update.name not in self.order:
+            self.order.insert(random.randint(0, len(self.order)), update.name)
+        if current is None:
+            return update if update.status in (ALIVE, SUSPECT) else None
+        if (current.status, current.addr, current.meta) != (update.status, update.addr, update.meta):
+            return update
+        return None
+
+    def _notify(self, changed):
+        if self.on_change is None:
+            return
+        for member in changed:
+            try:
+                self.on_change(member)
+            except Exception as e:
+                print("Membership callback failed:", e)
+
+    def _set_status(self, name, status, expect):
+        with self.lock:
+            current = self.members.get(name)
+            if current is None or current.status != expect:
+                return None
+            member = Member(name, current.host, current.port, current.incarnation, status, current.meta)
+            self.members[name] = member
+            self._broadcast(member)
+            return member
+
+    # --- messaging ---
+
+    def _send(self, addr, msg, piggyback=True):
+        msg["v"] = VERSION
+        msg["me"] = self.me.wire()
+        if piggyback:
+            msg["u"] = self._piggyback()
+        payload = json.dumps(msg, separators=(",", ":")).encode()
+        try:
+            self.sock.sendto(self._sign(payload) + payload, addr)
+        except (OSError, AttributeError):
+            pass    # unreachable, or stopped under us
+
+    def _sign(self, payload):
+        return hmac.new(self.key, payload, hashlib.sha256).digest()
+
+    def _verify(self, datagram):
+        """The payload of a correctly signed datagram, else None."""
+        tag, payload = datagram[:TAG_BYTES], datagram[TAG_BYTES:]
+        if len(tag) != TAG_BYTES or not hmac.compare_digest(tag, self._sign(payload)):
+            return None
+        return payload
+
+    def _next_seq(self):
+        with self.lock:
+            self.seq += 1
+            return self.seq
+
+    def _sync(self, addr):
+        records = [self.me.wire()] + [m.wire() for m in list(self.members.values())]
+        for i in range(0, len(records), SYNC_CHUNK):
+            self._send(addr, {"t": "sync", "m": records[i:i + SYNC_CHUNK]}, piggyback=False)
+
+    def handle(self, datagram, src):
+        payload = self._verify(datagram)
+        if payload is None:
+            return      # unsigned or forged
+        try:
+            msg = json.loads(payload)
+            if msg.get("v") != VERSION:
+                return
+            kind = msg["t"]
+            sender = dict(msg["me"])
+        except (ValueError, KeyError, TypeError):
+            return
+        if not sender.get("h"):
+            sender["h"] = src[0]
+
+        with self.lock:
+            changed = [self._merge(sender)]
+            records = list(msg.get("u") or []) + (list(msg.get("m") or []) if kind == "sync" else [])
+            for record in records:
+                if isinstance(record, dict):
+                    changed.append(self._merge(record))
+        self._notify([m for m in changed if m is not None])
+
+        if kind == "ping":
+            self._send(src, {"t": "ack", "seq": msg.get("seq")})
+        elif kind == "ack":
+            with self.lock:
+                relay = self.relays.pop(msg.get("seq"), None)
+                event = self.pending.get(msg.get("seq"))
+            if relay is not None:
+                self._send(relay[0], {"t": "ack", "seq": relay[1]})
+            if event is not None:
+                event.set()
+        elif kind == "ping-req":
+            with self.lock:
+                target = self.members.get(msg.get("target"))
+            if target is not None and target.host:
+                seq = self._next_seq()
+                with self.lock:
+                    self.relays[seq] = (src, msg.get("seq"), time.monotonic() + self.period)
+                self._send(target.addr, {"t": "ping", "seq": seq})
+        elif kind == "sync-req":
+            self._sync(src)
+        elif kind == "sync":
+            self.joined.set()
+
+    def listen(self):
+        while self.running:
+            try:
+                payload, src = self.sock.recvfrom(65535)
+            except OSError:
+                break
+            self.handle(payload, src)
+
+    # --- probing ---
+
+    def _next_target(self):
+        with self.lock:
+            for _ in range(len(self.order)):
+                name = self.order.pop(0)
+                member = self.members.get(name)
+                if member is None:
+                    continue
+                self.order.append(name)
+                if member.status in (ALIVE, SUSPECT) and member.host:
+                    return member
+            return None
+
+    def probe(self, target):
+        seq = self._next_seq()
+        event = threading.Event()
+        with self.lock:
+            self.pending[seq] = event
+        self._send(target.addr, {"t": "ping", "seq": seq})
+
+        timeout = self.ack_timeout * (1 + self.health)
+        direct = event.wait(timeout)
+        if not direct:
+            helpers = [m for m in self.alive() if m.name != target.name and m.host]
+            for helper in random.sample(helpers, min(self.indirect, len(helpers))):
+                self._send(helper.addr, {"t": "ping-req", "seq": seq, "target": target.name})
+            event.wait(max(self.ack_timeout, self.period * (1 + self.health) - timeout))
+
+        with self.lock:
+            self.pending.pop(seq, None)
+            if direct:
+                self.health = max(0, self.health - 1)
+            else:
+                self.health = min(MAX_HEALTH, self.health + 1)
+        if not event.is_set():
+            return self._set_status(target.name, SUSPECT, ALIVE)
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        timeout = self.suspicion_timeout()
+        changed = []
+        with self.lock:
+            suspects = [m.name for m in self.members.values()
+                        if m.status == SUSPECT and now - m.since >= timeout]
+            gone = [m.name for m in self.members.values()
+                    if m.status in (DEAD, LEFT) and now - m.since >= self.forget_after]
+            for name in gone:
+                del self.members[name]
+                self.broadcasts.pop(name, None)
+            self.relays = {k: v for k, v in self.relays.items() if v[2] > now}
+        for name in suspects:
+            changed.append(self._set_status(name, DEAD, SUSPECT))
+        return changed
+
+    def run(self):
+        last_sync = time.monotonic()
+        sync_wait = self.period     # doubles up to sync_every, so a mass join settles quickly
+        while self.running:
+            start = time.monotonic()
+            changed = []
+            if not self.joined.is_set() and self.seeds:
+                for seed in self.seeds:
+                    self._send(seed, {"t": "sync-req"})
+            elif start - last_sync >= sync_wait:
+                peers = [m for m in self.alive() if m.host]
+                if peers:
+                    self._send(random.choice(peers).addr, {"t": "sync-req"})
+                last_sync = start
+                sync_wait = min(sync_wait * 2, self.sync_every)
+
+            target = self._next_target()
+            if target is not None:
+                changed.append(self.probe(target))
+            changed.extend(self._expire())
+            self._notify([m for m in changed if m is not None])
+            time.sleep(max(0.0, self.period - (time.monotonic() - start)))
+
+    # --- lifecycle ---
+
+    def start(self):
+        if not self.key:
+            raise ValueError("gossip needs a shared secret (Membership(secret=...))")
+        self.seeds = [_addr(s) if isinstance(s, str) else tuple(s) for s in self.seeds]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.me.port))
+        self.me.port = self.sock.getsockname()[1]
+        self.running = True
+        with self.lock:
+            self._broadcast(self.me)
+        threading.Thread(target=self.listen, name="gossip-listen", daemon=True).start()
+        threading.Thread(target=self.run, name="gossip-probe", daemon=True).start()
+
+    def leave(self):
+        """Graceful exit: tell a few peers directly, gossip does the rest."""
+        if not self.running:
+            return
+        with self.lock:
+            self.me.incarnation += 1
+            self.me.status = LEFT
+            self._broadcast(self.me)
+        peers = [m for m in self.alive() if m.host]
+        for peer in random.sample(peers, min(len(peers), 2 * self.indirect)):
+            self._send(peer.addr, {"t": "gossip"})
+        self.stop()
+
+    def stop(self):
+        """Stops without telling anyone (the others will detect it as a failure)."""
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
@@ -5,20 +5,39 @@ import time
 import geocoder
 import locale
 import platform
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-import speedtest
 import socket
 import requests
-from concurrent.futures import ThreadPoolExecutor
+import argparse
 import threading
+import json
+import hashlib
+import atexit
+from telemetry import TelemetrySender
+from membership import Membership
+from latency import EchoResponder
+import statwire
+from sessions import SessionTable
+import capacity
+import metrics
 
 app = Flask(__name__)
 CORS(app)  # Enable Cross-Origin requests
 
 CONFIG_PATH = "config.yaml"
 config = {}
-current_users = 0
+telemetry = None
+membership = None
+
+GOSSIP_PORT = 7947      # membership gossip (config: gossip_port), brain.py listens on 7946
+SESSION_TTL = 300       # seconds a lease lives without a heartbeat (config: session_ttl)
+SAMPLE_INTERVAL = 1.0   # seconds between hardware samples (config: sample_interval)
+TEMP_EVERY = 5          # sensors can be slow, read them every Nth sample
+
+# Instrumentation (scraped from /metrics, see metrics.py)
+SAMPLE_SECONDS = metrics.Histogram("mesh_node_sample_seconds", "Time to take one hardware sample")
+STATS_SERVED = metrics.Counter("mesh_node_stats_requests_total", "/stats requests by response code", ["code"])
 
 def get_cpu_temp():
     """Attempts to read CPU temperature. Works best on Linux/macOS. 
@@ -93,324 +112,72 @@ def detect_region():
     
     return "GLOBAL"
 
-def benchmark_max_users():
-    """
-    Real machine benchmark with:
-    - Sustained CPU saturation (true load)
-    - RAM-based hard limit
-    - Upload-weighted network capacity
-    - Write-heavy disk benchmark
-    - Smart bottleneck modeling (CPU = soft cap)
-    """
-
-    metrics = {}
-
-    try:
-
-        cpu_cores = psutil.cpu_count(logical=True) or 2
-        print("Benchmarking CPU (real sustained load)...")
-
-        def cpu_load_test(_):
-            end = time.time() + 1.5
-            x = 1.000001
-            ops = 0
-            while time.time() < end:
-                x *= 1.0000001
-                ops += 1
-            return ops
-
-        with ThreadPoolExecutor(max_workers=cpu_cores) as executor:
-            results = list(executor.map(cpu_load_test, range(cpu_cores)))
-
-        total_ops = sum(results)
-        ops_per_core = total_ops / cpu_cores
-
-        cpu_capacity = max(10, int((ops_per_core / 250_000) * cpu_cores))
-        metrics["cpu_capacity"] = cpu_capacity
-
-        ram_gb = psutil.virtual_memory().total / (1024 ** 3)
-        ram_capacity = max(10, int((ram_gb - 2) * 40)) 
-        metrics["ram_capacity"] = ram_capacity
-
-
-        print("Benchmarking network (upload-weighted)...")
-        try:
-            st = speedtest.Speedtest()
-            st.get_best_server()
-
-            download_mbps = st.download() / 1_000_000
-            upload_mbps = st.upload() / 1_000_000
-
-            download_kbps = download_mbps * 125
-            upload_kbps = upload_mbps * 125
-
-            user_bw_kbps = 3 
-            net_capacity = int(
-                ((upload_kbps * 5 + download_kbps) / 6) / user_bw_kbps * 0.8
-            )
-
-            metrics["network_capacity"] = max(10, net_capacity)
-            metrics["download_mbps"] = round(download_mbps, 1)
-            metrics["upload_mbps"] = round(upload_mbps, 1)
-
-        except Exception as e:
-            print("Network benchmark failed, using fallback:", e)
-            metrics["network_capacity"] = 100
-
-
-        print("Benchmarking disk I/O...")
-        test_file = "io_bench.tmp"
-        test_size_mb = 50
-
-        start = time.time()
-        with open(test_file, "wb") as f:
-            f.write(b"\0" * (test_size_mb * 1024 * 1024))
-        write_mbps = test_size_mb / max(0.01, time.time() - start)
-
-        io_capacity = max(10, int((write_mbps * 1024) / 20))  
-        metrics["io_capacity"] = io_capacity
-
-
-        cpu = metrics["cpu_capacity"]
-        ram = metrics["ram_capacity"]
-        net = metrics["network_capacity"]
-        io  = metrics["io_capacity"]
-
-        io = min(io, ram * 3)
-        net = min(net, ram * 2)
-
-        hard_cap = min(ram, net)
-
-        cpu_soft = cpu * 2.5
-
-        weighted_capacity = int(
-            1 / (
-                (0.45 / cpu_soft) +
-                (0.30 / ram) +
-                (0.20 / net) +
-                (0.05 / io)
-            )
-        )
-
-        overall_capacity = max(10, min(weighted_capacity, hard_cap))
-        metrics["overall_capacity"] = overall_capacity
-
-        print("Benchmark results:", metrics)
-        return overall_capacity
-
-    except Exception as e:
-        print("Benchmark error:", e)
-        return 20
-
-    """
-    Real machine benchmark with:
-    - TRUE sustained CPU load (100% per core)
-    - RAM capacity estimation
-    - Upload-weighted network benchmark
-    - Disk I/O (write-heavy)
-    Final result = lowest bottleneck
-    """
-
-    metrics = {}
-
-    try:
-
-        cpu_cores = psutil.cpu_count(logical=True) or 4
-        print("Benchmarking CPU (real sustained load)...")
-
-        def cpu_load_test(_):
-            end = time.time() + 1.5  
-            x = 1.000001
-            ops = 0
-            while time.time() < end:
-                x *= 1.0000001
-                ops += 1
-            return ops
-
-        with ThreadPoolExecutor(max_workers=cpu_cores) as executor:
-            results = list(executor.map(cpu_load_test, range(cpu_cores)))
-
-        total_ops = sum(results)
-        ops_per_core = total_ops / cpu_cores
-
-
-        cpu_capacity = max(10, int((ops_per_core / 250_000) * cpu_cores))
-        metrics["cpu_capacity"] = cpu_capacity
+GEO_TIMEOUT = 4     # seconds for the city/location lookups on first start
 
+def benchmark_max_users(quick=False):
+    """Capacity probe, see capacity.py (parallel, time-boxed, cached per hardware)."""
+    return capacity.benchmark(quick=quick)["overall_capacity"]
 
-        ram_gb = psutil.virtual_memory().total / (1024 ** 3)
-        ram_capacity = max(10, int((ram_gb - 2) * 40)) 
-        metrics["ram_capacity"] = ram_capacity
-
-
-        print("Benchmarking network (upload-weighted)...")
-        try:
-            st = speedtest.Speedtest()
-            st.get_best_server()
-
-            download_mbps = st.download() / 1_000_000
-            upload_mbps = st.upload() / 1_000_000
-
-            download_kbps = download_mbps * 125
-            upload_kbps = upload_mbps * 125
-
-            user_bw_kbps = 3
-            net_capacity = int(
-                ((upload_kbps * 5 + download_kbps) / 6) / user_bw_kbps * 0.8
-            )
-
-            metrics["network_capacity"] = max(10, net_capacity)
-            metrics["download_mbps"] = round(download_mbps, 1)
-            metrics["upload_mbps"] = round(upload_mbps, 1)
-
-        except Exception as e:
-            print("Network benchmark failed, using fallback:", e)
-            metrics["network_capacity"] = 100
-
-
-        print("Benchmarking disk I/O...")
-        test_file = "io_bench.tmp"
-        test_size_mb = 50
-
-        start = time.time()
-        with open(test_file, "wb") as f:
-            f.write(b"\0" * (test_size_mb * 1024 * 1024))
-        write_mbps = test_size_mb / max(0.01, time.time() - start)
-
-        io_capacity = max(10, int((write_mbps * 1024) / 5)) 
-        metrics["io_capacity"] = io_capacity
-
-
-        capacities = [
-            metrics["cpu_capacity"],
-            metrics["ram_capacity"],
-            metrics["network_capacity"],
-            metrics["io_capacity"],
-        ]
-
-        overall_capacity = max(10, min(capacities))
-        metrics["overall_capacity"] = overall_capacity
-
-        print("Benchmark results:", metrics)
-        return overall_capacity
-
-    except Exception as e:
-        print("Benchmark error:", e)
-        return 20
+def create_config(quick=False):
+    region = detect_region()
 
-    """
-    Enhanced PC benchmark prioritizing upload speed (5x more important than download).
-    Assumes 1-5 KB/s per user (upload-dominant workload like file sharing, APIs).
-    """
-    metrics = {}
-    
-    try:
-        cpu_cores = psutil.cpu_count(logical=True) or 2
-        print("Benchmarking CPU...")
-        
-        def cpu_load_test():
-            start = time.time()
-            count = 0
-            while time.time() - start < 1.0:
-                count += 1
-                _ = hash(str(count)) * 123.456
-            return count
-
-        def cpu_load_test(_):
-            start = time.time()
-            count = 0
-            while time.time() - start < 1.0:
-                count += 1
-                _ = hash(str(count)) * 123.456
-            return count
-
-        
-        with ThreadPoolExecutor(max_workers=cpu_cores) as executor:
-            results = list(executor.map(cpu_load_test, range(cpu_cores)))
-        
-        total_cpu_score = sum(results) / 1_000_000
-        cpu_capacity = int(total_cpu_score * cpu_cores * 10)
-        metrics['cpu_capacity'] = cpu_capacity
-        
-        ram_gb = psutil.virtual_memory().total / (1024 ** 3)
-        ram_capacity = int((ram_gb - 2) * 40)  # ~25MB per user
-        metrics['ram_capacity'] = ram_capacity
-        
-        print("Benchmarking network...")
+    # City/location lookups run alongside the benchmark, each group has its own time box.
+    # Their thread starts once the CPU probe's pool has forked, not before.
+    geo = {}
+    t = None
+    if not quick:
+        lookups = {"city": detect_city_name, "location": get_location}
+        t = threading.Thread(target=lambda: geo.update(capacity.run_parallel(lookups, GEO_TIMEOUT)), daemon=True)
+    bench = capacity.benchmark(quick=quick, on_pool_ready=t.start if t else None)
+    if t is not None:
+        t.join()
+
+    city = geo.get("city", (None, None))[0]
+    if not city:
         try:
-            st = speedtest.Speedtest()
-            st.get_best_server()
-            
-            download_mbps = st.download() / 1_000_000
-            upload_mbps = st.upload() / 1_000_000
-            
-            download_kbps = download_mbps * 125
-            upload_kbps = upload_mbps * 125
-            
-   
-            user_bw_avg_kbps = 3 
-            weighted_net_capacity = int((upload_kbps * 5 + download_kbps) / (user_bw_avg_kbps * 6) * 0.8)
-            
-            metrics['network_capacity'] = weighted_net_capacity
-            metrics['download_mbps'] = round(download_mbps, 1)
-            metrics['upload_mbps'] = round(upload_mbps, 1)
-            metrics['upload_kbps'] = round(upload_kbps, 1)
-        except:
-            weighted_net_capacity = 100
-            metrics['network_capacity'] = weighted_net_capacity
-        
-        print("Benchmarking disk...")
-        test_file = 'io_bench.tmp'
-        test_size_mb = 50
-        
-        start = time.time()
-        with open(test_file, 'wb') as f:
-            f.write(b'0' * (test_size_mb * 1024 * 1024))
-        write_mbps = test_size_mb / (time.time() - start)
-        
-        io_capacity = int(write_mbps * 1024 / 5)  
-        metrics['io_capacity'] = io_capacity
-        
-        capacities = [cpu_capacity, ram_capacity, weighted_net_capacity, io_capacity]
-        overall_capacity = max(10, min(capacities))
-        
-        metrics['overall_capacity'] = overall_capacity
-        metrics['capacities'] = capacities
-        
-        print(f"Upload-dominant metrics: {metrics}")
-        return overall_capacity
-        
-    except Exception as e:
-        print(f"Benchmark error: {e}")
-        return 20
-
-def create_config():
-    city = detect_city_name()
-    region = detect_region()
-    max_users = benchmark_max_users()
+            city = locale.getdefaultlocale()[0].split("_")[0].upper()
+        except Exception:
+            city = "UNKNOWN"
+    location = geo.get("location", (None, None))[0] or {"lat": 0.0, "lon": 0.0, "city": "Unknown"}
 
     new_config = {
         "server_name": f"{city}-NODE-{int(time.time()) % 1000}",
         "region": region,
-        "max_users": max_users,
         "port": 5001,
-        "location": get_location() 
+        "location": location,
     }
+    apply_benchmark(new_config, bench)
 
     with open(CONFIG_PATH, "w") as f:
         yaml.dump(new_config, f)
 
     return new_config
 
-def load_config():
+def apply_benchmark(cfg, bench):
+    cfg["max_users"] = bench["overall_capacity"]
+    cfg["benchmark"] = {k: v for k, v in bench.items() if k != "quick"}
+
+def rebenchmark_config(quick=False):
+    """--rebenchmark on an existing config: measure again, rewrite max_users and benchmark."""
+    bench = capacity.benchmark(quick=quick, use_cache=False)
+    capacity.save_cached(bench)
+    old = config.get("max_users")
+    apply_benchmark(config, bench)
+    with open(CONFIG_PATH, "w") as f:
+        yaml.dump(config, f)
+    print(f"Re-benchmarked: max_users {old} -> {config['max_users']}")
+
+def load_config(quick=False, rebenchmark=False):
     global config
     if not os.path.exists(CONFIG_PATH):
         print("Config not found — generating config.yaml...")
-        config = create_config()
+        config = create_config(quick)
     else:
         with open(CONFIG_PATH, "r") as f:
             config = yaml.safe_load(f)
-            
+        if rebenchmark:
+            rebenchmark_config(quick)
+
         # FORCE CHECK: If port is missing or old default 5000, update it.
         if config.get("port") == 5000:
             print("WARNING: Config uses Port 5000. Changing to 5001 to avoid conflict.")
@@ -419,46 +186,263 @@ def load_config():
                 yaml.dump(config, f)
 
 
+class StatsSampler:
+    """
+    Background sampler for /stats. psutil and the temperature sensors are
+    read on a fixed cadence off the request path; every refresh also builds
+    the JSON body, the binary statwire record and the ETag once, so requests
+    just hand them out.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.hardware = {"cpu_load": 0.0, "ram_usage": 0.0, "temp": None}
+        self.samples = 0
+        self.stats = None
+        self.body = None
+        self.packed = None
+        self.etag = None
+
+    def sample(self):
+        cpu_load = psutil.cpu_percent(interval=None)
+        sample = {
+            "cpu_load": cpu_load,
+            "ram_usage": psutil.virtual_memory().percent,
+            "temp": get_cpu_temp() if self.samples % TEMP_EVERY == 0 else self.hardware["temp"],
+        }
+        self.samples += 1
+        with self.lock:
+            self.hardware = sample
+            self._rebuild()
+
+    def refresh_users(self):
+        """Cheap rebuild after connect/disconnect, keeps the last hardware sample."""
+        with self.lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        cpu_load = self.hardware["cpu_load"]
+        stats = {
+            "name": config["server_name"],
+            "region": config["region"],
+            "max_users": config["max_users"],
+            "current_users": sessions.count,
+            "cpu_load": cpu_load,
+            "ram_usage": self.hardware["ram_usage"],
+            "temp": self.hardware["temp"],
+            "watts": estimate_power_usage(cpu_load),
+            "location": config.get("location"),
+            "status": "online"
+        }
+        body = json.dumps(stats, separators=(",", ":")).encode()
+        if body != self.body:
+            self.stats = stats
+            self.body = body
+            self.packed = statwire.encode(stats)
+            self.etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+    def current(self, binary=False):
+        """(stats dict, body, etag) of the latest snapshot; the body is a statwire record if binary."""
+        if self.body is None:
+            self.sample()
+        with self.lock:
+            if binary:
+                return self.stats, self.packed, self.etag + "b"
+            return self.stats, self.body, self.etag
+
+    def run(self):
+        while True:
+            try:
+                with SAMPLE_SECONDS.time():
+                    self.sample()
+            except Exception as e:
+                print("Stats sample failed:", e)
+            time.sleep(self.interval)
+
+    def start(self):
+        threading.Thread(target=self.run, name="stats-sampler", daemon=True).start()
+
+def on_sessions_changed():
+    sampler.refresh_users()
+    if telemetry: telemetry.notify()
+
+sampler = StatsSampler()
+sessions = SessionTable(0, ttl=SESSION_TTL, on_change=on_sessions_changed)
+
+metrics.Gauge("mesh_node_sessions", "Leases currently held").set_function(lambda: sessions.count)
+metrics.Gauge("mesh_node_sessions_capacity", "Configured max_users").set_function(lambda: sessions.capacity)
+metrics.Gauge("mesh_node_sessions_rejected", "Lease requests refused because the node was full").set_function(
+    lambda: sessions.rejected)
+metrics.Gauge("mesh_node_sessions_expired", "Leases reclaimed after their TTL").set_function(
+    lambda: sessions.expired)
+
+def collect_stats():
+    return sampler.current()[0]
+
 @app.route('/stats', methods=['GET'])
 def get_stats():
-    cpu_load = psutil.cpu_percent(interval=None)
-    
-    return jsonify({
-        "name": config["server_name"],
-        "region": config["region"],
-        "max_users": config["max_users"],
-        "current_users": current_users,
-        "cpu_load": cpu_load,
-        "ram_usage": psutil.virtual_memory().percent,
-        "temp": get_cpu_temp(),
-        "watts": estimate_power_usage(cpu_load),
-        "location": config.get("location"),
-        "status": "online"
-    })
+    binary = statwire.MEDIA_TYPE in request.headers.get("Accept", "")
+    _, body, etag = sampler.current(binary)
+    resp = Response(body, mimetype=statwire.MEDIA_TYPE if binary else "application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept"
+    resp = resp.make_conditional(request)
+    STATS_SERVED.labels(str(resp.status_code)).inc()
+    return resp
+
+@app.route('/metrics')
+def view_metrics():
+    return metrics.flask_response()
+
+def start_telemetry():
+    """Optional push mode: set push_to: "<brain-host>:5005" and the mesh's push_secret in config.yaml"""
+    global telemetry
+    target = config.get("push_to")
+    if not target:
+        return
+    if not config.get("push_secret"):
+        print(" Not pushing telemetry: push_to is set but push_secret is missing")
+        return
+    telemetry = TelemetrySender(
+        config["server_name"],
+        config.get("port", 5001),
+        target,
+        collect_stats,
+        config["push_secret"],
+        interval=config.get("push_interval", 0.2),
+    )
+    telemetry.start()
+    print(f" Pushing telemetry to {target}")
+
+def start_membership():
+    """
+    Optional self-registration: set seeds: ["<brain-host>:7946"] and the
+    mesh's gossip_secret in config.yaml and the node joins the mesh over
+    gossip (see membership.py) with its config identity; controllers add it
+    without a NODES edit.
+    """
+    global membership
+    seeds = config.get("seeds")
+    if not seeds:
+        return
+    if not config.get("gossip_secret"):
+        print(" Not joining the mesh: seeds are set but gossip_secret is missing")
+        return
+    membership = Membership(
+        config["server_name"],
+        config.get("gossip_port", GOSSIP_PORT),
+        {
+            "role": "node",
+            "region": config.get("region"),
+            "location": config.get("location"),
+            "max_users": config.get("max_users"),
+            "port": config.get("port", 5001),
+            "web_port": config.get("web_port", 8000),
+        },
+        seeds=seeds,
+        advertise=config.get("advertise", ""),
+        secret=config["gossip_secret"],
+    )
+    membership.start()
+    atexit.register(membership.leave)
+    print(f" Joining the mesh via {', '.join(seeds)}")
+
+def start_echo():
+    """Answers the controllers' UDP latency probes (latency.py) on the agent port, or echo_port."""
+    port = config.get("echo_port", config.get("port", 5001))
+    try:
+        EchoResponder(port).start()
+    except OSError as e:
+        print(f" Latency echo disabled: {e}")
+
+def request_ttl(data):
+    try:
+        ttl = float(data.get("ttl", 0))
+    except (TypeError, ValueError):
+        return None
+    return ttl if ttl > 0 else None
 
 @app.route('/connect', methods=['POST'])
 def connect_user():
-    global current_users
-    if current_users < config["max_users"]:
-        current_users += 1
-        return jsonify({"status": "connected", "server": config["server_name"]}), 200
+    data = request.get_json(silent=True) or {}
+    leases = sessions.acquire(1, request_ttl(data))
+    if leases:
+        return jsonify({"status": "connected", "server": config["server_name"],
+                        "lease": leases[0], "ttl": request_ttl(data) or sessions.ttl}), 200
     return jsonify({"status": "full"}), 503
 
 @app.route('/disconnect', methods=['POST'])
 def disconnect_user():
-    global current_users
-    if current_users > 0:
-        current_users -= 1
+    data = request.get_json(silent=True) or {}
+    if data.get("lease"):
+        sessions.release([data["lease"]])
+    else:
+        sessions.release_any()
     return jsonify({"status": "disconnected"}), 200
 
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Keeps leases alive: {"lease": id} or {"leases": [ids]}"""
+    data = request.get_json(silent=True) or {}
+    leases = data.get("leases") or ([data["lease"]] if data.get("lease") else [])
+    renewed = sessions.renew(leases, request_ttl(data))
+    if leases and not renewed:
+        return jsonify({"status": "expired"}), 404
+    return jsonify({"status": "ok", "renewed": renewed}), 200
+
+@app.route('/connect/batch', methods=['POST'])
+def connect_batch():
+    """{"count": n} -> n leases, or 503 if they don't all fit"""
+    data = request.get_json(silent=True) or {}
+    try:
+        count = int(data.get("count", 1))
+    except (TypeError, ValueError):
+        count = 0
+    if count < 1:
+        return jsonify({"error": "count must be a positive integer"}), 400
+    leases = sessions.acquire(count, request_ttl(data))
+    if leases:
+        return jsonify({"status": "connected", "server": config["server_name"],
+                        "leases": leases, "ttl": request_ttl(data) or sessions.ttl}), 200
+    return jsonify({"status": "full"}), 503
+
+@app.route('/disconnect/batch', methods=['POST'])
+def disconnect_batch():
+    data = request.get_json(silent=True) or {}
+    released = sessions.release(data.get("leases") or [])
+    return jsonify({"status": "disconnected", "released": released}), 200
+
+@app.route('/sessions', methods=['GET'])
+def session_stats():
+    return jsonify(sessions.admission_stats())
+
 if __name__ == "__main__":
-    load_config()
+    parser = argparse.ArgumentParser(description="Mesh node agent")
+    parser.add_argument("--quick", action="store_true",
+                        help="first start: short local-only benchmark, no network lookups")
+    parser.add_argument("--rebenchmark", action="store_true",
+                        help="ignore the cached benchmark, measure again and update max_users in config.yaml")
+    args = parser.parse_args()
+    if args.rebenchmark and os.path.exists(capacity.CACHE_PATH):
+        os.remove(capacity.CACHE_PATH)
+
+    load_config(args.quick, args.rebenchmark)
     port = config.get("port", 5001)
+    sessions.capacity = config["max_users"]
+    sessions.ttl = config.get("session_ttl", SESSION_TTL)
+    sessions.start_reaper()
     
     print(f"----------------------------------------")
     print(f" NODE AGENT RUNNING: {config['server_name']}")
     print(f" Region: {config['region']} | Capacity: {config['max_users']}")
     print(f" Listening on Port: {port}")
     print(f"----------------------------------------")
+    sampler.interval = config.get("sample_interval", SAMPLE_INTERVAL)
+    sampler.start()
+    start_telemetry()
+    start_membership()
+    start_echo()
     
     app.run(host="0.0.0.0", port=port, threaded=True)
\ No newline at end of file
@@ -0,0 +1,176 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+import statwire
+from metrics import Counter, Histogram
+
+PROBE_SECONDS = Histogram("mesh_probe_seconds", "Health probe round trip per node", ["node"])
+PROBE_ERRORS = Counter("mesh_probe_errors_total", "Failed or timed-out health probes per node", ["node"])
+SWEEP_SECONDS = Histogram("mesh_probe_sweep_seconds", "Wall time of one probe sweep")
+
+
+class MeshProber:
+    """
+    Concurrent health prober for the mesh:
+    - All due nodes are probed in parallel over one pooled HTTP session
+    - Concurrency is capped with a semaphore (and the connector limit)
+    - Each batch ("sweep") has a hard deadline, late probes count as failures
+    - Every node gets its own jittered interval so probes don't arrive in lockstep
+    - Probes are conditional (If-None-Match), an unchanged snapshot is a bodiless 304
+    - With binary=True they ask for the statwire record instead of JSON; data
+      is then the raw record (bytes), or a dict from agents that only speak JSON
+
+    interval_for(node), if given, overrides the interval per node (e.g. slower
+    polling for nodes that push their own telemetry). poke(name) asks for an
+    immediate probe from any thread.
+    """
+
+    def __init__(self, nodes, interval=3.0, jitter=0.2, timeout=2.0,
+                 deadline=2.5, concurrency=100, path="/stats", interval_for=None, binary=False):
+        self.nodes = nodes
+        self.interval = interval
+        self.interval_for = interval_for
+        self.jitter = jitter
+        self.timeout = timeout
+        self.deadline = deadline
+        self.concurrency = concurrency
+        self.path = path
+        self.accept = f"{statwire.MEDIA_TYPE}, application/json;q=0.5" if binary else None
+        self.next_due = {}
+        self.cached = {}        # name -> (etag, data) for conditional GETs
+        self.loop = None
+        self.wake = None
+
+    def _url(self, node):
+        return f"http://{node['ip']}:{node['agent_port']}{self.path}"
+
+    def _schedule(self, node, now):
+        interval = self.interval_for(node) if self.interval_for else self.interval
+        spread = interval * self.jitter
+        self.next_due[node['name']] = now + interval + random.uniform(-spread, spread)
+
+    def poke(self, name):
+        # next_due belongs to the loop thread (run() iterates it): change it there
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._poke, name)
+        else:
+            self.next_due[name] = 0
+
+    def _poke(self, name):
+        self.next_due[name] = 0
+        self.wake.set()
+
+    def due_nodes(self, now):
+        nodes = self.nodes
+        # Nodes removed since the last pass (gossip, set_nodes) leave no schedule behind
+        if len(self.next_due) > len(nodes) or len(self.cached) > len(nodes):
+            names = {node['name'] for node in nodes}
+            for name in [n for n in self.next_due if n not in names]:
+                del self.next_due[name]
+            for name in [n for n in self.cached if n not in names]:
+                del self.cached[name]
+        due = []
+        for node in nodes:
+            name = node['name']
+            if name not in self.next_due:
+                # First contact: spread the initial probes over one interval
+                self.next_due[name] = now + random.uniform(0, self.interval * self.jitter)
+            if self.next_due[name] <= now:
+                due.append(node)
+        return due
+
+    async def probe(self, session, sem, node):
+        """Returns (node, latency_ms, data, error). data is None on failure."""
+        async with sem:
+            try:
+                cached = self.cached.get(node['name'])
+                headers = {"Accept": self.accept} if self.accept else {}
+                if cached:
+                    headers["If-None-Match"] = cached[0]
+                start = time.perf_counter()
+                async with session.get(self._url(node), headers=headers) as r:
+                    if r.status == 304 and cached:
+                        data = cached[1]
+                    elif r.status != 200:
+                        raise Exception("Bad Status")
+                    else:
+                        if r.content_type == statwire.MEDIA_TYPE:
+                            data = await r.read()
+                        else:
+                            data = await r.json(content_type=None)
+                        etag = r.headers.get("ETag")
+                        if etag:
+                            self.cached[node['name']] = (etag, data)
+                elapsed = time.perf_counter() - start
+                PROBE_SECONDS.labels(node['name']).observe(elapsed)
+                return node, round(elapsed * 1000, 2), data, None
+            except Exception as e:
+                PROBE_ERRORS.labels(node['name']).inc()
+                return node, None, None, str(e) or type(e).__name__
+
+    async def sweep(self, session, sem, nodes):
+        """Probe the given nodes concurrently, bounded by the sweep deadline."""
+        tasks = {asyncio.ensure_future(self.probe(session, sem, node)): node for node in nodes}
+        if not tasks:
+            return []
+
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+
+        results = [t.result() for t in done]
+        for t in pending:
+            t.cancel()
+            PROBE_ERRORS.labels(tasks[t]['name']).inc()
+            results.append((tasks[t], None, None, "Sweep deadline exceeded"))
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return results
+
+    def session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=0,
+            keepalive_timeout=self.interval * 3,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def run(self, on_sweep):
+        """Probe forever. on_sweep(results) is called after every batch."""
+        sem = asyncio.Semaphore(self.concurrency)
+        self.wake = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        async with self.session() as session:
+            while True:
+                now = time.monotonic()
+                due = self.due_nodes(now)
+
+                if due:
+                    with SWEEP_SECONDS.time():
+                        results = await self.sweep(session, sem, due)
+                    done_at = time.monotonic()
+                    for node in due:
+                        self._schedule(node, done_at)
+                    try:
+                        on_sweep(results)
+                    except Exception as e:
+                        print("Sweep handler error:", e)
+
+                if self.next_due:
+                    wait = min(self.next_due.values()) - time.monotonic()
+                else:
+                    wait = self.interval
+                try:
+                    await asyncio.wait_for(self.wake.wait(), max(0.05, wait))
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+
+    def run_forever(self, on_sweep):
+        """Blocking entry point, meant to be the target of a daemon thread."""
+        asyncio.run(self.run(on_sweep))
@@ -0,0 +1,103 @@
+import threading
+
+# Score weights: the original ping + load * 2, plus up to USERS_WEIGHT as a node fills up
+PING_WEIGHT = 1.0
+LOAD_WEIGHT = 2.0
+USERS_WEIGHT = 50.0
+JITTER_WEIGHT = 1.0     # ms of ping per ms of RTT jitter, when latency.py reports it
+
+MIN_GAP = 0.5   # seconds; samples closer together than this are treated as this far apart
+
+
+def _decay(gap, half_life):
+    return 1.0 - 0.5 ** (gap / half_life)
+
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+class ScoreEngine:
+    """
+    Predictive routing score shared by master.py and brain.py.
+
+    For every node it keeps a smoothed level and trend (Holt's linear
+    smoothing) of CPU load, ping and users/max, folded in one sample at a
+    time as health data arrives. Decay is scaled by the real gap between
+    samples, so 1 s pushes and 30 s probes weigh the same per second of
+    history. The score is ping + load * 2 + a fullness penalty, projected
+    `horizon` seconds ahead: a node that is heating up loses traffic before
+    its raw numbers cross a competitor's, and one noisy sample only moves
+    it by a fraction. Each update is O(1), so a sweep of thousands of nodes
+    costs a few microseconds per node.
+
+    A node silent for longer than `reset_after` starts over from its next
+    sample, which also drops seeds from history that are too old to trust.
+    """
+
+    def __init__(self, half_life=10.0, trend_half_life=30.0, horizon=30.0, reset_after=120.0):
+        self.half_life = half_life
+        self.trend_half_life = trend_half_life
+        self.horizon = horizon
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.state = {}   # name -> [t, load, load trend, ping, ping trend, ratio, ratio trend]
+
+    def __len__(self):
+        return len(self.state)
+
+    def observe(self, name, t, load, ping, ratio=None):
+        """Folds in one sample (ratio None if unknown), returns the node's predicted score."""
+        with self.lock:
+            s = self.state.get(name)
+            if s is None or t - s[0] > self.reset_after:
+                s = self.state[name] = [t, load, 0.0, ping, 0.0, ratio, 0.0]
+                return self._score(s)
+
+            gap = max(t - s[0], MIN_GAP)
+            a = _decay(gap, self.half_life)
+            b = _decay(gap, self.trend_half_life)
+            s[0] = max(t, s[0])
+            for i, x in ((1, load), (3, ping), (5, ratio)):
+                if x is None:
+                    continue
+                level, trend = s[i], s[i + 1]
+                if level is None:
+                    s[i] = x
+                    continue
+                expected = level + trend * gap
+                new = expected + a * (x - expected)
+                s[i + 1] = trend + b * ((new - level) / gap - trend)
+                s[i] = new
+            return self._score(s)
+
+    def _score(self, s):
+        h = self.horizon
+        load = _clamp(s[1] + s[2] * h, 0.0, 100.0)
+        ping = max(0.0, s[3] + s[4] * h)
+        ratio = _clamp(s[5] + s[6] * h, 0.0, 1.0) if s[5] is not None else 0.0
+        return PING_WEIGHT * ping + LOAD_WEIGHT * load + USERS_WEIGHT * ratio
+
+    def annotate(self, name, stats, t):
+        """Feeds a live stats dict in and stores the prediction as stats['score'] (see selector.node_score)."""
+        limit = stats.get('max') or 0
+        ratio = stats.get('users', 0) / limit if limit > 0 else None
+        ping = stats['ping'] + JITTER_WEIGHT * (stats.get('jitter') or 0)
+        stats['score'] = round(self.observe(name, t, stats.get('load', 0) or 0, ping, ratio), 2)
+        return stats
+
+    def seed(self, samples):
+        """
+        Warms the estimates from history: {name: [(timestamp, load, ping,
+        users), ...]} oldest first, as HistoryStore.recent() returns them.
+        History has no max_users, so the users ratio starts with live data.
+        """
+        for name, rows in samples.items():
+            for timestamp, load, ping, _users in rows:
+                self.observe(name, timestamp, load or 0, ping or 0)
+        return sum(1 for rows in samples.values() if rows)
+
+    def snapshot(self):
+        """{name: current predicted score}"""
+        with self.lock:
+            return {name: round(self._score(s), 2) for name, s in self.state.items()}
@@ -0,0 +1,99 @@
+import heapq
+import threading
+
+
+def node_score(stats):
+    """Routing score, lower is better: the scoring.ScoreEngine prediction if set, else Ping + Load"""
+    score = stats.get('score')
+    if score is not None:
+        return score
+    return stats['ping'] + (stats.get('load', 0) * 2)
+
+
+def is_eligible(stats):
+    """Alive, not in maintenance and not full"""
+    return (stats.get('alive', False)
+            and not stats.get('maintenance', False)
+            and stats.get('users', 0) < stats.get('max', 100))
+
+
+class NodeIndex:
+    """
+    Best-node index shared by master.py and brain.py.
+
+    The health updater calls update() whenever a node's stats change, so the
+    ordering is maintained incrementally instead of rescanning every node per
+    request. Entries live in a min-heap keyed on node_score(); replaced or
+    removed entries are invalidated lazily and skipped when they surface.
+    best() is O(1) amortized, update() is O(log n).
+
+    With hysteresis > 0, best() keeps returning the node it returned last
+    until another one beats it by that fraction of its score, so two nodes
+    with near-equal scores don't trade places on every update.
+    """
+
+    def __init__(self, hysteresis=0.0):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.live = {}      # name -> (score, seq, name, stats) of the current entry
+        self.seq = 0
+        self.members = None # cached candidates() snapshot, rebuilt after changes
+        self.hysteresis = hysteresis
+        self.current = None # name best() returned last
+
+    def __len__(self):
+        return len(self.live)
+
+    def update(self, name, stats):
+        eligible = is_eligible(stats)
+        self.update_scored(name, stats, eligible, node_score(stats) if eligible else None)
+
+    def update_scored(self, name, stats, eligible, score):
+        """update() with is_eligible() and node_score() already known (StatusTable.routing())."""
+        with self.lock:
+            if not eligible:
+                self.live.pop(name, None)
+            else:
+                self.seq += 1
+                entry = (score, self.seq, name, stats)
+                self.live[name] = entry
+                heapq.heappush(self.heap, entry)
+            self.members = None
+
+            if len(self.heap) > 2 * len(self.live) + 64:
+                self._compact()
+
+    def remove(self, name):
+        with self.lock:
+            self.live.pop(name, None)
+            self.members = None
+
+    def candidates(self):
+        """Immutable list of eligible (name, stats) pairs."""
+        with self.lock:
+            if self.members is None:
+                self.members = tuple((e[2], e[3]) for e in self.live.values())
+            return self.members
+
+    def best(self):
+        """Lowest-score eligible node's stats, or None."""
+        with self.lock:
+            heap = self.heap
+            while heap:
+                entry = heap[0]
+                if self.live.get(entry[2]) is entry:
+                    break
+                heapq.heappop(heap)
+            else:
+                return None
+
+            current = self.live.get(self.current)
+            if current is not None and current is not entry:
+                if entry[0] > current[0] - self.hysteresis * max(current[0], 1.0):
+                    return current[3]
+            self.current = entry[2]
+            return entry[3]
+
+    def _compact(self):
+        self.heap = list(self.live.values())
+        heapq.heapify(self.heap)
@@ -0,0 +1,144 @@
+import heapq
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import Histogram
+
+ADMISSION_SECONDS = Histogram("mesh_node_admission_seconds", "Lease admission (connect) latency")
+
+
+class SessionTable:
+    """
+    Session admission for a node agent.
+
+    Every admitted user holds a lease (random id + expiry). The check against
+    capacity and the insert happen under one lock, so concurrent connects can
+    never overbook the node. Leases that are not renewed before their TTL are
+    reclaimed, so a crashed client cannot leak a slot forever.
+
+    on_change() is called (outside the lock) whenever the count changes.
+    """
+
+    def __init__(self, capacity, ttl=300.0, on_change=None, latency_samples=1024):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.leases = {}        # lease id -> expiry (monotonic)
+        self.expiries = []      # heap of (expiry, lease id), may hold stale entries
+        self.peak = 0
+        self.rejected = 0
+        self.expired = 0
+        self.latencies = deque(maxlen=latency_samples)   # admission time, seconds
+
+    @property
+    def count(self):
+        return len(self.leases)
+
+    def _expire(self, now):
+        n = 0
+        heap = self.expiries
+        while heap and heap[0][0] <= now:
+            expiry, lease = heapq.heappop(heap)
+            if self.leases.get(lease) == expiry:
+                del self.leases[lease]
+                n += 1
+        self.expired += n
+        return n
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def acquire(self, n=1, ttl=None):
+        """All-or-nothing: a list of n lease ids, or None if they don't fit."""
+        start = time.perf_counter()
+        now = time.monotonic()
+        expiry = now + (ttl or self.ttl)
+
+        with self.lock:
+            self._expire(now)
+            if len(self.leases) + n > self.capacity:
+                self.rejected += n
+                leases = None
+            else:
+                leases = [os.urandom(8).hex() for _ in range(n)]
+                for lease in leases:
+                    self.leases[lease] = expiry
+                    heapq.heappush(self.expiries, (expiry, lease))
+                self.peak = max(self.peak, len(self.leases))
+            elapsed = time.perf_counter() - start
+            self.latencies.append(elapsed)
+        ADMISSION_SECONDS.observe(elapsed)
+
+        if leases:
+            self._changed()
+        return leases
+
+    def _compact(self):
+        if len(self.expiries) > 2 * len(self.leases) + 64:
+            self.expiries = [(e, l) for l, e in self.leases.items()]
+            heapq.heapify(self.expiries)
+
+    def release(self, leases):
+        """Drops the given leases. Unknown or expired ids are ignored."""
+        with self.lock:
+            n = sum(1 for lease in leases if self.leases.pop(lease, None) is not None)
+            self._compact()
+        if n:
+            self._changed()
+        return n
+
+    def release_any(self):
+        """Legacy /disconnect without a lease id: drops the lease closest to expiry."""
+        with self.lock:
+            self._expire(time.monotonic())
+            if not self.leases:
+                return 0
+            lease = min(self.leases, key=self.leases.get)
+            del self.leases[lease]
+        self._changed()
+        return 1
+
+    def renew(self, leases, ttl=None):
+        """Pushes expiry out for live leases, returns how many were renewed."""
+        now = time.monotonic()
+        expiry = now + (ttl or self.ttl)
+        renewed = 0
+        with self.lock:
+            self._expire(now)
+            for lease in leases:
+                if lease in self.leases:
+                    self.leases[lease] = expiry
+                    heapq.heappush(self.expiries, (expiry, lease))
+                    renewed += 1
+            self._compact()
+        return renewed
+
+    def reap(self):
+        with self.lock:
+            n = self._expire(time.monotonic())
+        if n:
+            self._changed()
+        return n
+
+    def admission_stats(self):
+        """Admission latency (microseconds) over the recent window plus counters."""
+        with self.lock:
+            samples = sorted(self.latencies)
+            current, peak, rejected, expired = len(self.leases), self.peak, self.rejected, self.expired
+        stats = {"current": current, "capacity": self.capacity, "peak": peak,
+                 "rejected": rejected, "expired": expired}
+        if samples:
+            pick = lambda p: round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1e6, 2)
+            stats["admission_us"] = {"p50": pick(0.50), "p99": pick(0.99), "max": pick(1.0)}
+        return stats
+
+    def start_reaper(self, interval=1.0):
+        def run():
+            while True:
+                time.sleep(interval)
+                self.reap()
+        threading.Thread(target=run, name="session-reaper", daemon=True).start()
@@ -0,0 +1,424 @@
+"""
+Node status shared between processes, for brain.py / master.py --workers N.
+
+One process (the one running the prober) writes node records; N worker
+processes serving HTTP read them without taking any lock. The store is a
+memory-mapped file, in /dev/shm when there is one, so it is plain shared
+memory and never touches a disk.
+
+Layout (native byte order, every section 8-byte aligned):
+    header    magic, layout version, capacity, record size, slots, slot size,
+              table version, count
+    settings  seq, length, JSON document (panic mode, per-node maintenance/weight)
+    slots     per process: seq, length, JSON document it published
+    seqs      one u64 per record
+    records   capacity fixed-size RECORD structs
+
+Records and settings are seqlocked: the writer makes the seq odd, writes,
+then makes it even again; a reader copies the bytes and retries if the seq
+was odd or moved meanwhile. The table version goes up after every record
+write, so a worker with nothing new to read pays one integer read.
+
+Records have a single writer. Settings are changed from any process (a
+control request can land on any worker), so those writers serialize on
+flock(); readers still never lock, and parse the JSON only when its seq
+changed.
+
+Slots carry what only one process knows: slot 0 is the writer's, slot i+1
+worker i's, each with that process as its single writer. The writer
+publishes its gossip view and every process its metrics there, so whichever
+worker answers /metrics or a members endpoint can answer for all of them.
+"""
+
+import json
+import mmap
+import os
+import signal
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:     # Windows: no fork/flock, single-process serving only
+    fcntl = None
+
+MAGIC = b"MSHS"
+LAYOUT = 2
+HEADER = struct.Struct("=4sIIIIIQQ")    # magic, layout, capacity, record size, slots, slot size, version, count
+SETTINGS_HEAD = struct.Struct("=QI4x")  # seq, length (of the settings and of every slot)
+SETTINGS_BYTES = 64 * 1024
+SLOT_BYTES = 1024 * 1024    # pages are only allocated once written
+SEQ = struct.Struct("=Q")
+
+# (field, struct code). Strings are NUL-padded UTF-8, cut to fit.
+FIELDS = (
+    ("present", "?"), ("alive", "?"), ("maintenance", "?"),
+    ("users", "q"), ("max", "q"), ("port", "q"),
+    ("load", "d"), ("ping", "d"), ("probe_ms", "d"), ("score", "d"), ("weight", "d"),
+    ("temp", "d"), ("watts", "d"), ("lat", "d"), ("lon", "d"),
+    ("rtt_p95", "d"), ("jitter", "d"), ("loss", "d"), ("updated", "d"),
+    ("name", "64s"), ("ip", "46s"), ("region", "32s"), ("city", "48s"), ("error", "96s"),
+)
+RECORD = struct.Struct("=" + "".join(code for _, code in FIELDS))
+NAMES = tuple(name for name, _ in FIELDS)
+TEXT_FIELDS = frozenset(name for name, code in FIELDS if code.endswith("s"))
+FLOAT_FIELDS = frozenset(name for name, code in FIELDS if code == "d")
+NAN = float("nan")
+
+READ_RETRIES = 1000
+
+
+def default_path(service, port):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"mesh-{service}-{port}.status")
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def slot_label(slot):
+    """Process name of a slot, as /metrics labels it."""
+    return "main" if slot == 0 else f"worker-{slot - 1}"
+
+
+def _number(value, default=NAN):
+    if value is None or isinstance(value, bool):
+        return default if value is None else float(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _text(value, size):
+    if value is None:
+        return b""
+    raw = str(value).encode("utf-8")[:size]
+    return raw.decode("utf-8", "ignore").encode("utf-8")    # don't cut a character in half
+
+
+class SharedStatus:
+    """
+    create() in the writer before forking workers, open() from any other
+    process. put()/remove() are writer-only; changes() and settings() are
+    for readers; update_settings() is safe from every process. publish(slot)
+    is for the slot's own process, published()/gather() for anyone.
+    """
+
+    def __init__(self, path, capacity, create, slots=0):
+        self.path = path
+        flags = os.O_RDWR | (os.O_CREAT | os.O_TRUNC if create else 0)
+        fd = os.open(path, flags, 0o600)
+        try:
+            if not create:
+                magic, layout, capacity, record_size, slots, slot_bytes, _, _ = \
+                    HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or layout != LAYOUT or record_size != RECORD.size or slot_bytes != SLOT_BYTES:
+                    raise ValueError(f"{path} is not a layout {LAYOUT} status table")
+            self.settings_at = _align(HEADER.size)
+            self.slots_at = self.settings_at + _align(SETTINGS_HEAD.size + SETTINGS_BYTES)
+            self.slot_stride = _align(SETTINGS_HEAD.size + SLOT_BYTES)
+            self.seqs_at = self.slots_at + self.slot_stride * slots
+            self.records_at = self.seqs_at + 8 * capacity
+            size = self.records_at + _align(RECORD.size) * capacity
+            if create:
+                os.ftruncate(fd, size)
+            self.buf = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        if create:
+            HEADER.pack_into(self.buf, 0, MAGIC, LAYOUT, capacity, RECORD.size, slots, SLOT_BYTES, 0, 0)
+        self.capacity = capacity
+        self.slots = slots
+        self.stride = _align(RECORD.size)
+        self.seqs = memoryview(self.buf)[self.seqs_at:self.seqs_at + 8 * capacity].cast("Q")
+
+        self.rows = {}          # writer: name -> row
+        self.seen = {}          # reader: row -> seq last returned
+        self.names = {}         # reader: row -> name
+        self.version = -1       # reader: table version last synced
+        self.settings_seq = -1
+        self.settings_doc = {}
+        self.slot_docs = {}     # reader: slot -> (seq, document)
+        self.lock_fd = None
+        self.lock_pid = None
+        self.thread_lock = threading.Lock()   # flock doesn't exclude threads sharing a descriptor
+
+    @classmethod
+    def create(cls, path, capacity=4096, slots=0):
+        return cls(path, capacity, create=True, slots=slots)
+
+    @classmethod
+    def open(cls, path):
+        return cls(path, 0, create=False)
+
+    def close(self):
+        self.seqs.release()
+        self.buf.close()
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    # -- records (writer) ----------------------------------------------------
+
+    def _bump_version(self):
+        version, count = struct.unpack_from("=QQ", self.buf, HEADER.size - 16)
+        struct.pack_into("=QQ", self.buf, HEADER.size - 16, version + 1, len(self.rows))
+
+    def _write(self, row, values):
+        seqs = self.seqs
+        seqs[row] += 1      # odd: being written
+        RECORD.pack_into(self.buf, self.records_at + row * self.stride, *values)
+        seqs[row] += 1
+        self._bump_version()
+
+    def put(self, name, status):
+        """
+        Publishes one node's status dict (brain's StatusTable snapshot or a
+        master NODE_STATS entry; web_port or port, location as a dict).
+        Returns False if the table is full.
+        """
+        row = self.rows.get(name)
+        if row is None:
+            if len(self.rows) >= self.capacity:
+                return False
+            row = self.rows[name] = len(self.rows)
+        loc = status.get('location') or {}
+        port = status.get('web_port', status.get('port'))
+        values = []
+        for field, code in FIELDS:
+            if field == "present":
+                value = True
+            elif field == "name":
+                value = _text(name, 64)
+            elif field == "port":
+                value = int(port or 0)
+            elif field in ("lat", "lon", "city"):
+                value = loc.get(field)
+                value = _text(value, 48) if field == "city" else _number(value)
+            elif field in TEXT_FIELDS:
+                value = _text(status.get(field), int(code[:-1]))
+            elif field in FLOAT_FIELDS:
+                value = _number(status.get(field))
+            elif code == "?":
+                value = bool(status.get(field))
+            else:
+                value = int(status.get(field) or 0)
+            values.append(value)
+        self._write(row, values)
+        return True
+
+    def remove(self, name):
+        """The node is gone (not just down); readers get (name, None)."""
+        row = self.rows.get(name)
+        if row is None:
+            return
+        values = [False if code == "?" else b"" if code.endswith("s") else 0 for _, code in FIELDS]
+        values[NAMES.index("name")] = _text(name, 64)
+        self._write(row, values)
+
+    # -- records (readers) ---------------------------------------------------
+
+    def read(self, row):
+        """Consistent record dict of one row (seqlock read), or None if removed."""
+        seqs = self.seqs
+        at = self.records_at + row * self.stride
+        for attempt in range(READ_RETRIES):
+            before = seqs[row]
+            if not before & 1:
+                values = RECORD.unpack_from(self.buf, at)
+                if seqs[row] == before:
+                    break
+            if attempt % 64 == 63:
+                time.sleep(0)
+        else:
+            raise RuntimeError(f"row {row} kept changing while being read")
+        self.seen[row] = before
+        record = dict(zip(NAMES, values))
+        for field in TEXT_FIELDS:
+            record[field] = record[field].rstrip(b"\0").decode("utf-8") or None
+        for field in FLOAT_FIELDS:
+            if record[field] != record[field]:
+                record[field] = None
+        return record if record["present"] else None
+
+    def changes(self):
+        """[(name, record or None)] for rows written since the last call."""
+        version, count = struct.unpack_from("=QQ", self.buf, HEADER.size - 16)
+        if version == self.version:
+            return []
+        self.version = version
+        seen = self.seen
+        seqs = self.seqs[:count].tolist()
+        changed = []
+        for row, seq in enumerate(seqs):
+            if seen.get(row) != seq:
+                record = self.read(row)
+                name = self.names.get(row)
+                if record is not None:
+                    name = self.names[row] = record["name"]
+                elif name is None:
+                    continue
+                changed.append((name, record))
+        return changed
+
+    # -- settings (any process) ----------------------------------------------
+
+    def _read_doc(self, at):
+        """(seq, raw JSON) of the document at `at`, seqlocked like a record."""
+        for attempt in range(READ_RETRIES):
+            before, length = SETTINGS_HEAD.unpack_from(self.buf, at)
+            if not before & 1:
+                raw = bytes(self.buf[at + SETTINGS_HEAD.size:at + SETTINGS_HEAD.size + length])
+                if SEQ.unpack_from(self.buf, at)[0] == before:
+                    return before, raw
+            if attempt % 64 == 63:
+                time.sleep(0)
+        raise RuntimeError("shared document kept changing while being read")
+
+    def _write_doc(self, at, doc, limit):
+        """Publishes doc at `at`; the caller is its only writer right now. Returns the new seq."""
+        raw = json.dumps(doc, separators=(",", ":")).encode()
+        if len(raw) > limit:
+            raise ValueError(f"shared document too large ({len(raw)} > {limit} bytes)")
+        seq = SEQ.unpack_from(self.buf, at)[0]
+        SEQ.pack_into(self.buf, at, seq + 1)
+        self.buf[at + SETTINGS_HEAD.size:at + SETTINGS_HEAD.size + len(raw)] = raw
+        SETTINGS_HEAD.pack_into(self.buf, at, seq + 1, len(raw))
+        SEQ.pack_into(self.buf, at, seq + 2)
+        return seq + 2
+
+    def settings(self):
+        """The settings document; re-parsed only when it changed."""
+        at = self.settings_at
+        seq = SEQ.unpack_from(self.buf, at)[0]
+        if seq == self.settings_seq:
+            return self.settings_doc
+        seq, raw = self._read_doc(at)
+        self.settings_doc = json.loads(raw) if raw else {}
+        self.settings_seq = seq
+        return self.settings_doc
+
+    def _locked(self):
+        # flock is per open file, and forked children share their parent's:
+        # every process takes it through its own descriptor
+        if self.lock_pid != os.getpid():
+            self.lock_fd = os.open(self.path, os.O_RDWR)
+            self.lock_pid = os.getpid()
+        return self.lock_fd
+
+    def update_settings(self, change):
+        """change(doc) edits a copy of the settings in place; the result is published atomically."""
+        with self.thread_lock:
+            fd = self._locked()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                self.settings_seq = -1
+                doc = json.loads(json.dumps(self.settings()))
+                change(doc)
+                self.settings_seq = self._write_doc(self.settings_at, doc, SETTINGS_BYTES)
+                self.settings_doc = doc
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        return doc
+
+    # -- slots (one writer each) ---------------------------------------------
+
+    def publish(self, slot, doc):
+        """Replaces slot's document; only that slot's process may call this."""
+        self._write_doc(self.slots_at + slot * self.slot_stride, doc, SLOT_BYTES)
+
+    def published(self, slot):
+        """slot's document, or None if its process hasn't published yet."""
+        at = self.slots_at + slot * self.slot_stride
+        seq = SEQ.unpack_from(self.buf, at)[0]
+        cached = self.slot_docs.get(slot)
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        seq, raw = self._read_doc(at)
+        doc = json.loads(raw) if raw else None
+        self.slot_docs[slot] = (seq, doc)
+        return doc
+
+    def gather(self, key, own_slot=None, own=None):
+        """
+        {slot_label: document[key]} over the slots that published key, with
+        own_slot's entry replaced by `own` (the caller's live value).
+        """
+        found = {}
+        for slot in range(self.slots):
+            if slot == own_slot:
+                found[slot_label(slot)] = own
+                continue
+            doc = self.published(slot)
+            if doc is not None and key in doc:
+                found[slot_label(slot)] = doc[key]
+        return found
+
+
+def listen_socket(port, host="0.0.0.0", backlog=1024):
+    """A listening socket on port, with SO_REUSEPORT so every worker can bind its own."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def fork_workers(count, port, serve):
+    """
+    Forks `count` HTTP workers, each calling serve(index, sock) with its own
+    SO_REUSEPORT listener on port (the kernel spreads connections across
+    them). Call it before the parent starts any thread. Returns the pids.
+    """
+    pids = []
+    for i in range(count):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                serve(i, listen_socket(port))
+            except BaseException as e:
+                print(f"Worker {i} exiting: {e!r}")
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    return pids
+
+
+def wait_workers(pids):
+    """Blocks until every worker has exited; SIGINT/SIGTERM are passed on to them."""
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    remaining = set(pids)
+    while remaining:
+        try:
+            pid, status = os.wait()
+        except KeyboardInterrupt:
+            stop(None, None)
+            continue
+        except ChildProcessError:
+            break
+        if pid in remaining:
+            remaining.discard(pid)
+            print(f"Worker {pid} exited ({status})")
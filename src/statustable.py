@@ -0,0 +1,365 @@
+"""
+Controller-side node status, stored by column instead of one dict per node.
+
+Every node gets a row id on first sight; each numeric field is one typed
+array indexed by row id, strings are plain lists. An update writes a
+handful of array slots in place (straight from a statwire record, or from
+a /stats JSON dict for older agents), so a sweep over thousands of nodes
+allocates no per-node dicts. NaN marks an unset float.
+
+table[name] is a NodeStatus: a live, read-write mapping view of one row
+with the same keys the old status dicts had, so NodeIndex and the balancing
+strategies use it unchanged. annotate() scores a row from its columns,
+routing() gives NodeIndex.update_scored() its eligibility and score,
+snapshot()/as_dict() build plain dicts for /api/stream and JSON responses.
+"""
+
+import threading
+from array import array
+
+import statwire
+from scoring import JITTER_WEIGHT
+
+NAN = float("nan")
+COUNT_MAX = 2**63 - 1   # "q" columns
+
+# Numeric columns: name -> array typecode
+NUMERIC = (
+    ("alive", "b"), ("maintenance", "b"), ("web_port", "q"), ("users", "q"), ("max", "q"),
+    ("load", "d"), ("ping", "d"), ("probe_ms", "d"), ("rtt_p95", "d"), ("jitter", "d"),
+    ("loss", "d"), ("temp", "d"), ("watts", "d"), ("lat", "d"), ("lon", "d"),
+    ("weight", "d"), ("score", "d"), ("updated", "d"),
+)
+TEXT = ("name", "ip", "region", "city", "error")
+
+# Keys a row shows, by state. Optional ones are left out while unset (NaN).
+UP_KEYS = ("ip", "web_port", "alive", "ping", "probe_ms", "users", "max", "load", "temp", "watts",
+           "location", "region", "maintenance", "weight", "score", "rtt_p95", "jitter", "loss")
+DOWN_KEYS = ("alive", "ping", "error", "maintenance")
+UP_SET, DOWN_SET = frozenset(UP_KEYS), frozenset(DOWN_KEYS)
+OPTIONAL = frozenset(("score", "rtt_p95", "jitter", "loss"))
+BOOLS = frozenset(("alive", "maintenance"))
+
+
+class NodeStatus:
+    """Mapping view of one StatusTable row."""
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def get(self, key, default=None):
+        try:
+            return self.table.readers[key](self.row, default)
+        except KeyError:
+            return default
+
+    def __getitem__(self, key):
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.table.write(self.row, key, value)
+
+    def __contains__(self, key):
+        return self.get(key, KeyError) is not KeyError
+
+    def keys(self):
+        return self.table.snapshot(self.row).keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return self.table.snapshot(self.row).items()
+
+    def values(self):
+        return self.table.snapshot(self.row).values()
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            self.table.write(self.row, key, value)
+
+    def __eq__(self, other):
+        return dict(self.items()) == (dict(other.items()) if hasattr(other, "items") else other)
+
+    def __repr__(self):
+        return f"NodeStatus({dict(self.items())!r})"
+
+
+class StatusTable:
+    """
+    name -> NodeStatus, backed by columns. Writes come from the probe/push
+    threads; readers may see a row mid-update (each field is read atomically).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()    # row allocation only
+        self.ids = {}                   # name -> row
+        self.free = []                  # rows of removed nodes, reused before appending
+        self.columns = {name: array(code) for name, code in NUMERIC}
+        self.text = {name: [] for name in TEXT}
+        self.views = []
+        for name, _ in NUMERIC:
+            setattr(self, name, self.columns[name])     # self.users is self.columns["users"], ...
+        self.readers = {key: self._reader(key) for key in UP_SET | DOWN_SET}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __iter__(self):
+        return iter(list(self.ids))
+
+    def __getitem__(self, name):
+        return self.views[self.ids[name]]
+
+    def get(self, name, default=None):
+        row = self.ids.get(name)
+        return self.views[row] if row is not None else default
+
+    def items(self):
+        return [(name, self.views[row]) for name, row in list(self.ids.items())]
+
+    def values(self):
+        return [self.views[row] for row in list(self.ids.values())]
+
+    def row(self, name):
+        """Row id for a node, allocated (as down, never seen) on first use."""
+        row = self.ids.get(name)
+        if row is not None:
+            return row
+        with self.lock:
+            row = self.ids.get(name)
+            if row is None and self.free:
+                row = self.free.pop()
+                for column in self.columns.values():
+                    column[row] = NAN if column.typecode == "d" else 0
+                for key, column in self.text.items():
+                    column[row] = name if key == "name" else None
+                self.views[row] = NodeStatus(self, row)
+                self.ids[name] = row
+            elif row is None:
+                row = len(self.views)
+                for column in self.columns.values():
+                    column.append(NAN if column.typecode == "d" else 0)
+                for key, column in self.text.items():
+                    column.append(name if key == "name" else None)
+                self.views.append(NodeStatus(self, row))
+                self.ids[name] = row
+            return row
+
+    def remove(self, name):
+        """The node left the mesh (not just down): drop it, its row goes to the next new node."""
+        with self.lock:
+            row = self.ids.pop(name, None)
+            if row is not None:
+                self.alive[row] = 0     # keeps alive_count() right
+                self.free.append(row)
+
+    # -- reads -------------------------------------------------------------
+
+    def _reader(self, key):
+        """reader(row, default) for one key, specialised once so views read fast."""
+        alive = self.alive
+        shown = 2 if key in UP_SET and key in DOWN_SET else 1 if key in UP_SET else 0
+        if key == "location":
+            lat, lon, city = self.lat, self.lon, self.text["city"]
+
+            def read(row, default):
+                if alive[row] != shown and shown != 2:
+                    return default
+                if lat[row] != lat[row]:
+                    return {}
+                return {"lat": lat[row], "lon": lon[row], "city": city[row]}
+        elif key in BOOLS:
+            column = self.columns[key]
+
+            def read(row, default):
+                if alive[row] != shown and shown != 2:
+                    return default
+                return bool(column[row])
+        elif key in self.columns:
+            column = self.columns[key]
+            missing = key in OPTIONAL
+
+            def read(row, default):
+                if alive[row] != shown and shown != 2:
+                    return default
+                v = column[row]
+                if v != v:     # NaN: unset
+                    return default if missing else None
+                return v
+        else:
+            column = self.text[key]
+
+            def read(row, default):
+                if alive[row] != shown and shown != 2:
+                    return default
+                return column[row]
+        return read
+
+    def read(self, row, key, default=None):
+        reader = self.readers.get(key)
+        return reader(row, default) if reader is not None else default
+
+    def routing(self, row):
+        """(eligible, score) of a row as selector.is_eligible/node_score see it, straight from the columns."""
+        if not self.alive[row] or self.maintenance[row] or self.users[row] >= self.max[row]:
+            return False, None
+        score = self.score[row]
+        return True, score if score == score else self.ping[row] + self.load[row] * 2
+
+    def alive_count(self):
+        return sum(self.alive)
+
+    def snapshot(self, row):
+        """Plain status dict of one row, as the old per-node dicts looked."""
+        if not self.alive[row]:
+            ping = self.ping[row]
+            return {"alive": False, "ping": ping if ping == ping else None,
+                    "error": self.text["error"][row], "maintenance": bool(self.maintenance[row])}
+        temp, lat = self.temp[row], self.lat[row]
+        status = {
+            "ip": self.text["ip"][row],
+            "web_port": self.web_port[row],
+            "alive": True,
+            "ping": self.ping[row],
+            "probe_ms": self.probe_ms[row],
+            "users": self.users[row],
+            "max": self.max[row],
+            "load": self.load[row],
+            "temp": temp if temp == temp else None,
+            "watts": self.watts[row],
+            "location": {"lat": lat, "lon": self.lon[row], "city": self.text["city"][row]} if lat == lat else {},
+            "region": self.text["region"][row],
+            "maintenance": bool(self.maintenance[row]),
+            "weight": self.weight[row],
+        }
+        for key in ("score", "rtt_p95", "jitter", "loss"):
+            value = self.columns[key][row]
+            if value == value:
+                status[key] = value
+        return status
+
+    def as_dict(self):
+        """{name: plain status dict} for JSON responses."""
+        return {name: self.snapshot(row) for name, row in list(self.ids.items())}
+
+    # -- writes ------------------------------------------------------------
+
+    def write(self, row, key, value):
+        column = self.columns.get(key)
+        if column is not None:
+            if value is None:
+                value = NAN if column.typecode == "d" else 0
+            column[row] = value
+        elif key == "location":
+            self._locate(row, value)
+        elif key in self.text:
+            self.text[key][row] = value
+        else:
+            raise KeyError(key)
+
+    def _locate(self, row, loc):
+        loc = loc or {}
+        try:
+            lat, lon = float(loc["lat"]), float(loc["lon"])
+        except (KeyError, TypeError, ValueError):
+            lat = lon = NAN
+        self.lat[row] = lat
+        self.lon[row] = lon
+        self.text["city"][row] = loc.get("city")
+
+    def load_packed(self, row, payload):
+        """Stats fields from a statwire record (ValueError if it isn't one)."""
+        users, max_users, cpu, _ram, temp, watts, lat, lon, region, city, _name = statwire.unpack(payload)
+        self.users[row] = users
+        self.max[row] = max_users
+        self.load[row] = cpu
+        self.temp[row] = NAN if temp is None else temp
+        self.watts[row] = watts
+        self.lat[row] = NAN if lat is None else lat
+        self.lon[row] = NAN if lon is None else lon
+        self.text["region"][row] = region
+        self.text["city"][row] = city
+
+    def load_stats(self, row, data):
+        """Stats fields from a /stats JSON dict (or a telemetry push)."""
+        get = data.get
+        users, max_users = get('current_users', 0) or 0, get('max_users', 100) or 0
+        load, watts = get('cpu_load', 0) or 0, get('watts', 0) or 0
+        # Convert and check everything before the first write, so a bad agent can't leave half a row
+        if users.__class__ is not int or max_users.__class__ is not int:
+            try:
+                users, max_users = int(users), int(max_users)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"bad user counts {users!r}/{max_users!r}") from None
+        if not (0 <= users <= COUNT_MAX and 0 <= max_users <= COUNT_MAX):
+            raise ValueError(f"user counts out of range: {users}/{max_users}")
+        if load.__class__ is not float or watts.__class__ is not float:
+            try:
+                load, watts = float(load), float(watts)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"bad load/watts {load!r}/{watts!r}") from None
+        self.users[row] = users
+        self.max[row] = max_users
+        self.load[row] = load
+        self.watts[row] = watts
+        temp = get('temp')
+        self.temp[row] = temp if temp.__class__ is float or temp.__class__ is int else NAN
+        loc = get('location')
+        if loc.__class__ is dict and loc.get('lat').__class__ is float and loc.get('lon').__class__ is float:
+            self.lat[row] = loc['lat']
+            self.lon[row] = loc['lon']
+            self.text["city"][row] = loc.get('city')
+        else:
+            self._locate(row, loc)
+        self.text["region"][row] = get('region')
+
+    def load_record(self, row, record):
+        """Every field from a shared.SharedStatus record: this row as another process wrote it."""
+        for key in ("users", "max", "load", "ping", "probe_ms", "score", "weight", "temp", "watts",
+                    "lat", "lon", "rtt_p95", "jitter", "loss", "maintenance", "updated"):
+            self.write(row, key, record[key])
+        self.web_port[row] = record["port"]
+        for key in ("ip", "region", "city", "error"):
+            self.text[key][row] = record[key]
+        self.alive[row] = record["alive"]
+
+    def set_up(self, row, ip, web_port, latency, maintenance, weight, now):
+        self.text["ip"][row] = ip
+        self.text["error"][row] = None
+        self.web_port[row] = web_port
+        self.ping[row] = latency
+        self.probe_ms[row] = latency
+        self.maintenance[row] = maintenance
+        self.weight[row] = weight
+        self.updated[row] = now
+        self.alive[row] = 1
+
+    def annotate(self, row, scorer, now):
+        """ScoreEngine.annotate for a row, read straight from the columns."""
+        limit = self.max[row]
+        jitter = self.jitter[row]
+        ping = self.ping[row] + (JITTER_WEIGHT * jitter if jitter == jitter else 0.0)
+        ratio = self.users[row] / limit if limit > 0 else None
+        self.score[row] = round(scorer.observe(self.text["name"][row], now, self.load[row], ping, ratio), 2)
+        return self.views[row]
+
+    def set_down(self, row, error):
+        self.alive[row] = 0
+        self.maintenance[row] = 0
+        self.ping[row] = 9999
+        self.score[row] = NAN
+        self.rtt_p95[row] = self.jitter[row] = self.loss[row] = NAN
+        self.text["error"][row] = error
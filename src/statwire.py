@@ -0,0 +1,112 @@
+"""
+Compact binary encoding of a node agent's /stats snapshot.
+
+The controller asks for it with "Accept: application/x-mesh-stats" and
+falls back to JSON for agents that answer with JSON. One record is a fixed
+30-byte big-endian head plus three short length-prefixed strings:
+
+    magic "MS", version u8, flags u8,
+    current_users u32, max_users u32,
+    cpu_load u16 (1/100 %), ram_usage u16 (1/100 %), temp i16 (1/10 °C),
+    watts u32 (1/100 W), lat i32 (1e-5 °), lon i32 (1e-5 °),
+    region (u8 length + UTF-8), city (same), name (same)
+
+Fixed point keeps the record small and decodes to the same short decimals
+the JSON carried. Flags say which optional fields are present (a missing
+temp or location is sent as zeros). A record with a different VERSION is
+rejected; fields added later go after the name, so older readers ignore them.
+"""
+
+import struct
+
+MEDIA_TYPE = "application/x-mesh-stats"
+MAGIC = b"MS"
+VERSION = 1
+HEAD = struct.Struct("!2sBBIIHHhIii")
+
+HAS_TEMP = 1
+HAS_LOCATION = 2
+
+_TEXTS = {}     # raw bytes -> str; region, city and name repeat in every record
+
+
+def _number(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _fixed(value, scale, low, high):
+    return min(high, max(low, int(round(value * scale))))
+
+
+def _text(value):
+    raw = str(value).encode("utf-8")[:255] if value is not None else b""
+    return bytes((len(raw),)) + raw
+
+
+def _decode_text(raw):
+    text = _TEXTS.get(raw)
+    if text is None:
+        if len(_TEXTS) > 4096:
+            _TEXTS.clear()
+        text = _TEXTS[raw] = raw.decode("utf-8", "replace") or None
+    return text
+
+
+def encode(stats):
+    """Record for a stats dict shaped like the /stats JSON."""
+    flags = 0
+    temp = stats.get("temp")
+    if isinstance(temp, (int, float)):
+        flags |= HAS_TEMP
+    loc = stats.get("location") or {}
+    lat, lon = _number(loc.get("lat"), None), _number(loc.get("lon"), None)
+    if lat is not None and lon is not None:
+        flags |= HAS_LOCATION
+    head = HEAD.pack(
+        MAGIC, VERSION, flags,
+        _fixed(_number(stats.get("current_users")), 1, 0, 0xFFFFFFFF),
+        _fixed(_number(stats.get("max_users")), 1, 0, 0xFFFFFFFF),
+        _fixed(_number(stats.get("cpu_load")), 100, 0, 0xFFFF),
+        _fixed(_number(stats.get("ram_usage")), 100, 0, 0xFFFF),
+        _fixed(temp, 10, -0x8000, 0x7FFF) if flags & HAS_TEMP else 0,
+        _fixed(_number(stats.get("watts")), 100, 0, 0xFFFFFFFF),
+        _fixed(lat or 0.0, 1e5, -9000000, 9000000),
+        _fixed(lon or 0.0, 1e5, -18000000, 18000000),
+    )
+    return head + _text(stats.get("region")) + _text(loc.get("city")) + _text(stats.get("name"))
+
+
+def unpack(payload):
+    """
+    (users, max_users, cpu_load, ram_usage, temp, watts, lat, lon, region, city, name),
+    temp/lat/lon None when absent. Raises ValueError for anything that isn't a record.
+    """
+    try:
+        magic, version, flags, users, max_users, cpu, ram, temp, watts, lat, lon = HEAD.unpack_from(payload)
+    except struct.error:
+        raise ValueError("short stats record")
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a v{VERSION} stats record")
+    pos = HEAD.size
+    try:
+        end = pos + 1 + payload[pos]
+        region = _decode_text(payload[pos + 1:end])
+        pos = end + 1 + payload[end]
+        city = _decode_text(payload[end + 1:pos])
+        name = _decode_text(payload[pos + 1:pos + 1 + payload[pos]])
+    except IndexError:
+        raise ValueError("truncated stats record")
+    has_location = flags & HAS_LOCATION
+    return (users, max_users, cpu / 100, ram / 100, temp / 10 if flags & HAS_TEMP else None, watts / 100,
+            lat / 1e5 if has_location else None, lon / 1e5 if has_location else None, region, city, name)
+
+
+def decode(payload):
+    """Record back to the /stats JSON shape (for tools and old call sites)."""
+    users, max_users, cpu, ram, temp, watts, lat, lon, region, city, name = unpack(payload)
+    location = {"lat": lat, "lon": lon, "city": city} if lat is not None else None
+    return {"name": name, "region": region, "max_users": max_users, "current_users": users,
+            "cpu_load": cpu, "ram_usage": ram, "temp": temp, "watts": watts, "location": location}
@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import json
+import queue
+import threading
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+class _LoopClosed(Exception):
+    """The subscriber's event loop is gone; nothing will read its queue again."""
+
+
+class _LoopQueue:
+    """
+    queue.Queue look-alike for an asyncio subscriber: publish() runs on
+    monitor threads, so items go into a locked deque and the event loop is
+    woken thread-safely. A get() that times out takes nothing. put_nowait()
+    raises _LoopClosed once the loop has been closed.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.items = collections.deque()
+        self.ready = asyncio.Event()
+
+    def put_nowait(self, message):
+        with self.lock:
+            if message is not None and len(self.items) >= self.maxsize:
+                raise queue.Full
+            self.items.append(message)
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            raise _LoopClosed from None
+
+    def get_nowait(self):
+        with self.lock:
+            if not self.items:
+                raise queue.Empty
+            return self.items.popleft()
+
+    async def get(self, timeout=None):
+        """Next message; queue.Empty if none arrives within `timeout` seconds."""
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                pass
+            # A put after this clear() sets it again: its call_soon_threadsafe runs after we yield
+            self.ready.clear()
+            remaining = None if deadline is None else deadline - self.loop.time()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            try:
+                await asyncio.wait_for(self.ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class StatusBroadcaster:
+    """
+    Fans status changes out to Server-Sent Events subscribers.
+
+    publish() diffs a node's new status against the last one sent and, only
+    if something changed, encodes a single "node" event ({"name", "set",
+    "unset"}) that is queued as-is for every subscriber. New subscribers
+    start from a "snapshot" event, which is cached until the next change.
+    Encoding cost is per change, not per client per poll.
+    """
+
+    def __init__(self, max_backlog=256):
+        self.lock = threading.Lock()
+        self.nodes = {}
+        self.panic = {}
+        self.subscribers = set()
+        self.max_backlog = max_backlog
+        self.snapshot = None
+
+    def _fan_out(self, message):
+        self.snapshot = None
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(message)
+            except _LoopClosed:
+                # Its event loop has shut down without unsubscribing
+                self.subscribers.discard(q)
+            except queue.Full:
+                # Too far behind: drop it, the browser reconnects and resyncs
+                self.subscribers.discard(q)
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(None)
+                except _LoopClosed:
+                    pass
+
+    def publish(self, name, status):
+        with self.lock:
+            old = self.nodes.get(name, {})
+            changed = {k: v for k, v in status.items() if old.get(k) != v or k not in old}
+            removed = [k for k in old if k not in status]
+            if not changed and not removed and name in self.nodes:
+                return
+            self.nodes[name] = dict(status)
+            self._fan_out(sse("node", {"name": name, "set": changed, "unset": removed}))
+
+    def remove(self, name):
+        """The node left the mesh: a "gone" event drops it from every dashboard."""
+        with self.lock:
+            if self.nodes.pop(name, None) is not None:
+                self._fan_out(sse("gone", {"name": name}))
+
+    def publish_panic(self, panic):
+        with self.lock:
+            if panic == self.panic:
+                return
+            self.panic = dict(panic)
+            self._fan_out(sse("panic", self.panic))
+
+    def subscribe(self, q=None):
+        """Returns (snapshot event, queue of later events). None on the queue means "go away"."""
+        if q is None:
+            q = queue.Queue(maxsize=self.max_backlog)
+        with self.lock:
+            if self.snapshot is None:
+                self.snapshot = sse("snapshot", {"nodes": self.nodes, "panic": self.panic})
+            self.subscribers.add(q)
+            return self.snapshot, q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def events(self, keepalive=15):
+        """Generator for a streaming response body."""
+        snapshot, q = self.subscribe()
+        try:
+            yield snapshot
+            while True:
+                try:
+                    message = q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
+
+    async def aevents(self, keepalive=15):
+        """Async generator twin of events() for the ASGI server."""
+        snapshot, q = self.subscribe(_LoopQueue(asyncio.get_running_loop(), self.max_backlog))
+        try:
+            yield snapshot
+            while True:
+                try:
+                    message = await q.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(q)
@@ -0,0 +1,222 @@
+"""
+Push telemetry: node agents stream stats to the controller over UDP.
+
+Every datagram starts with an HMAC-SHA256 tag of the rest, keyed with the
+mesh's push secret (the same scheme as membership.py's gossip); anything
+unsigned or badly signed is dropped before it is parsed, so only holders
+of the secret can move a node's routing state. After the tag, compact JSON:
+    {"v": 1, "n": name, "p": agent_port, "b": boot_id, "s": seq, "k": "f"|"d", "d": {...}}
+"f" carries every field, "d" only the fields that changed since the last
+datagram (an empty "d" is a plain heartbeat). A full snapshot is resent every
+`full_every` seconds, so a restarted controller or a lost datagram heals on
+its own. Field names are shortened on the wire, see FIELDS.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+
+VERSION = 1
+FIELDS = {
+    "current_users": "u",
+    "max_users": "m",
+    "cpu_load": "c",
+    "ram_usage": "r",
+    "temp": "t",
+    "watts": "w",
+    "location": "l",
+    "region": "g",
+}
+LONG_NAMES = {v: k for k, v in FIELDS.items()}
+
+# Changes smaller than this are not worth a datagram
+TOLERANCE = {"cpu_load": 1.0, "ram_usage": 1.0, "temp": 1.0, "watts": 1.0}
+TAG_BYTES = hashlib.sha256().digest_size
+
+
+def _key(secret):
+    key = secret.encode() if isinstance(secret, str) else secret
+    if not key:
+        raise ValueError("push telemetry needs a shared secret (secret=...)")
+    return key
+
+
+def sign(key, payload):
+    return hmac.new(key, payload, hashlib.sha256).digest() + payload
+
+
+def verify(key, datagram):
+    """The payload of a correctly signed datagram, else None."""
+    tag, payload = datagram[:TAG_BYTES], datagram[TAG_BYTES:]
+    if len(tag) != TAG_BYTES or not hmac.compare_digest(tag, hmac.new(key, payload, hashlib.sha256).digest()):
+        return None
+    return payload
+
+
+def _changed(field, old, new):
+    tol = TOLERANCE.get(field)
+    if tol is not None and isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return abs(new - old) >= tol
+    return old != new
+
+
+class TelemetrySender:
+    """Node side. Samples `collect()` and pushes signed deltas to the controller."""
+
+    def __init__(self, name, agent_port, target, collect, secret,
+                 interval=0.2, heartbeat=1.0, full_every=10.0):
+        self.key = _key(secret)
+        host, port = target.rsplit(":", 1)
+        self.addr = (host, int(port))
+        self.name = name
+        self.agent_port = agent_port
+        self.collect = collect
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.full_every = full_every
+        self.boot = os.urandom(4).hex()
+        self.seq = 0
+        self.wake = threading.Event()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def notify(self):
+        """Something important changed (e.g. a user connected): send now."""
+        self.wake.set()
+
+    def _send(self, kind, fields):
+        self.seq += 1
+        msg = {"v": VERSION, "n": self.name, "p": self.agent_port, "b": self.boot,
+               "s": self.seq, "k": kind,
+               "d": {FIELDS[k]: v for k, v in fields.items() if k in FIELDS}}
+        try:
+            self.sock.sendto(sign(self.key, json.dumps(msg, separators=(",", ":")).encode()), self.addr)
+        except OSError as e:
+            print("Telemetry send failed:", e)
+
+    def run(self):
+        sent = {}
+        last_send = 0.0
+        last_full = 0.0
+
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                stats = self.collect()
+            except Exception as e:
+                print("Telemetry sample failed:", e)
+                continue
+
+            now = time.monotonic()
+            if now - last_full >= self.full_every:
+                self._send("f", stats)
+                sent = dict(stats)
+                last_full = last_send = now
+                continue
+
+            delta = {k: v for k, v in stats.items() if k in FIELDS and _changed(k, sent.get(k), v)}
+            if delta or now - last_send >= self.heartbeat:
+                self._send("d", delta)
+                sent.update(delta)
+                last_send = now
+
+    def start(self):
+        threading.Thread(target=self.run, name="telemetry-sender", daemon=True).start()
+
+
+class TelemetryReceiver:
+    """
+    Controller side. Applies pushed snapshots/deltas and reports staleness.
+
+    Senders are keyed by (source ip, agent port), the same pair the prober
+    uses. on_update(key, name, stats) gets the merged stats dict (long field
+    names, same shape as /stats) after every datagram that carries data.
+    on_stale(key) fires once when a sender has been quiet for `stale_after`
+    seconds. `secret` (str or bytes) must match the senders'.
+    """
+
+    def __init__(self, port, on_update, on_stale, secret, stale_after=3.0, host="0.0.0.0"):
+        self.key = _key(secret)
+        self.port = port
+        self.host = host
+        self.on_update = on_update
+        self.on_stale = on_stale
+        self.stale_after = stale_after
+        self.lock = threading.Lock()
+        self.state = {}     # (ip, agent_port) -> {"boot", "seq", "stats", "seen", "stale"}
+
+    def is_fresh(self, key):
+        st = self.state.get(key)
+        return st is not None and time.monotonic() - st["seen"] < self.stale_after
+
+    def handle(self, datagram, ip):
+        payload = verify(self.key, datagram)
+        if payload is None:
+            return
+        try:
+            msg = json.loads(payload)
+            if msg.get("v") != VERSION:
+                return
+            name, boot, seq = msg["n"], msg["b"], msg["s"]
+            key = (ip, int(msg["p"]))
+            fields = {LONG_NAMES[k]: v for k, v in msg.get("d", {}).items() if k in LONG_NAMES}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+
+        with self.lock:
+            st = self.state.get(key)
+            if st is None or st["boot"] != boot:
+                if msg.get("k") != "f":
+                    return  # wait for the next full snapshot
+                st = self.state[key] = {"boot": boot, "seq": 0, "stats": {}, "seen": 0, "stale": False}
+            if seq <= st["seq"]:
+                return  # duplicate or reordered datagram
+            st["seq"] = seq
+            st["seen"] = time.monotonic()
+            revived = st["stale"]
+            st["stale"] = False
+            if msg.get("k") == "f":
+                st["stats"] = fields
+            elif fields:
+                st["stats"] = dict(st["stats"], **fields)
+            elif not revived:
+                return  # heartbeat only
+            stats = st["stats"]
+
+        self.on_update(key, name, stats)
+
+    def listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.host, self.port))
+        while True:
+            try:
+                payload, (ip, _) = sock.recvfrom(65535)
+            except OSError as e:
+                print("Telemetry receive failed:", e)
+                time.sleep(0.1)
+                continue
+            try:
+                self.handle(payload, ip)
+            except Exception as e:
+                # A signed push the controller can't apply: skip it, keep listening
+                print(f"Telemetry update from {ip} failed:", e)
+
+    def reap(self):
+        while True:
+            time.sleep(self.stale_after / 4)
+            now = time.monotonic()
+            with self.lock:
+                stale = [k for k, st in self.state.items()
+                         if not st["stale"] and now - st["seen"] >= self.stale_after]
+                for key in stale:
+                    self.state[key]["stale"] = True
+            for key in stale:
+                self.on_stale(key)
+
+    def start(self):
+        threading.Thread(target=self.listen, name="telemetry-listen", daemon=True).start()
+        threading.Thread(target=self.reap, name="telemetry-reap", daemon=True).start()
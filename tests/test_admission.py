@@ -0,0 +1,129 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from admission import AdmissionController, Overloaded
+
+
+def pick_a(full):
+    return None if "A" in full else {"name": "A"}
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.001)
+
+
+def test_aimd_grows_under_use_and_backs_off_once_per_burst():
+    ctrl = AdmissionController(initial_limit=10, min_limit=2, backoff=0.5)
+    ctrl.observe("A", 0.1)
+    assert ctrl.snapshot()["A"] == 10       # idle backend: no growth
+    for _ in range(5):
+        ctrl.admit(pick_a)
+    ctrl.observe("A", 0.1)
+    assert ctrl.snapshot()["A"] == pytest.approx(10.1, abs=0.01)
+
+    ctrl.observe("A", 0.5)
+    assert ctrl.snapshot()["A"] == pytest.approx(5.05, abs=0.01)
+    ctrl.observe("A", 0.5)
+    ctrl.observe("A", None, ok=False)
+    assert ctrl.snapshot()["A"] == pytest.approx(5.05, abs=0.01)
+    time.sleep(0.5)
+    for _ in range(10):
+        ctrl.observe("A", None, ok=False)
+    assert ctrl.snapshot()["A"] == 2
+
+
+def test_limit_is_enforced_and_freed_slots_go_to_waiters():
+    ctrl = AdmissionController(initial_limit=2, min_limit=1)
+    assert ctrl.admit(pick_a)["name"] == "A"
+    assert ctrl.admit(pick_a)["name"] == "A"
+    assert ctrl.admit(pick_a) is None and ctrl.full == {"A"}
+    with pytest.raises(Overloaded):
+        ctrl.admit(pick_a, deadline=time.monotonic() + 0.02)
+
+    got = []
+    t = threading.Thread(target=lambda: got.append(ctrl.admit(pick_a, deadline=time.monotonic() + 2)))
+    t.start()
+    wait_for(lambda: sum(ctrl.queued) == 1)
+    assert ctrl.admit(pick_a) is None       # no queue jumping
+    ctrl.release("A")
+    t.join()
+    assert got == [{"name": "A"}] and ctrl.in_flight.get("A") == 2
+
+
+def test_higher_priority_evicts_the_newest_low_waiter():
+    ctrl = AdmissionController(initial_limit=1, min_limit=1, queue_size=2, shares=(1.0, 1.0, 1.0))
+    ctrl.admit(pick_a)
+    results = {}
+
+    def request(label, priority):
+        try:
+            results[label] = ctrl.admit(pick_a, priority, time.monotonic() + 2)["name"]
+        except Overloaded as e:
+            results[label] = e.reason
+
+    threads = {label: threading.Thread(target=request, args=(label, priority))
+               for label, priority in (("low-1", 2), ("low-2", 2), ("high", 0))}
+    threads["low-1"].start()
+    wait_for(lambda: ctrl.queued[2] == 1)
+    threads["low-2"].start()
+    wait_for(lambda: ctrl.queued[2] == 2)
+    threads["high"].start()
+    wait_for(lambda: "low-2" in results and ctrl.queued[0] == 1)
+
+    assert results == {"low-2": "evicted by a higher priority request"}
+    assert ctrl.queued == [1, 0, 1]
+    ctrl.release("A")
+    wait_for(lambda: "high" in results)
+    assert "low-1" not in results
+    ctrl.release("A")
+    for t in threads.values():
+        t.join()
+    assert results["low-1"] == "A" and results["high"] == "A"
+
+
+def test_share_limits_lower_classes_and_shed_carries_retry_after():
+    shed = []
+    ctrl = AdmissionController(initial_limit=1, min_limit=1, queue_size=4, shares=(1.0, 1.0, 0.25),
+                               on_shed=lambda priority, reason: shed.append((priority, reason)))
+    ctrl.admit(pick_a)
+    t = threading.Thread(target=lambda: pytest.raises(Overloaded, ctrl.admit, pick_a, 2, time.monotonic() + 0.2))
+    t.start()
+    wait_for(lambda: ctrl.queued[2] == 1)
+    with pytest.raises(Overloaded) as e:
+        ctrl.admit(pick_a, 2, time.monotonic() + 1)
+    assert e.value.reason == "queue full" and e.value.retry_after >= 1
+    t.join()
+    assert shed == [("low", "queue full"), ("low", "queue deadline")]
+    assert ctrl.queued == [0, 0, 0]
+
+
+def test_pick_runs_outside_the_lock_and_stale_picks_are_discarded():
+    discarded = []
+    ctrl = AdmissionController(initial_limit=1, min_limit=1, on_discard=discarded.append)
+
+    def pick(full):
+        assert not ctrl.lock.locked()
+        return {"name": "A"}    # ignores `full`, as a pick racing another request would
+
+    assert ctrl.admit(pick) == {"name": "A"}
+    assert ctrl.admit(pick) is None
+    assert discarded == [{"name": "A"}] * 3
+
+    got = []
+    t = threading.Thread(target=lambda: got.append(ctrl.admit(pick, deadline=time.monotonic() + 2)))
+    t.start()
+    wait_for(lambda: sum(ctrl.queued) == 1 and len(discarded) == 9)
+    time.sleep(0.05)
+    assert len(discarded) == 9      # its own dispatch gave up too instead of spinning
+    ctrl.release("A")
+    t.join()
+    assert got == [{"name": "A"}] and ctrl.in_flight.get("A") == 1
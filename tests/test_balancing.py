@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from balancing import STRATEGIES, InFlight
+from selector import NodeIndex
+
+
+def make_index(count):
+    index = NodeIndex()
+    for i in range(count):
+        index.update(f"NODE-{i}", {"name": f"NODE-{i}", "alive": True, "maintenance": False,
+                                   "ping": 10.0 + i, "load": 5, "users": 0, "max": 100})
+    return index
+
+
+@pytest.mark.parametrize("name", sorted(STRATEGIES))
+def test_strategies_skip_excluded_nodes(name):
+    strategy = STRATEGIES[name](make_index(4), InFlight())
+    exclude = {"NODE-0", "NODE-1", "NODE-2"}
+    for i in range(50):
+        assert strategy.pick(f"client-{i}", exclude)['name'] == "NODE-3"
+    assert strategy.pick("client", exclude | {"NODE-3"}) is None
+
+
+def test_consistent_hash_keeps_keys_on_their_node():
+    index = make_index(5)
+    strategy = STRATEGIES["consistent-hash"](index, InFlight())
+    placed = {f"user-{i}": strategy.pick(f"user-{i}")['name'] for i in range(500)}
+    assert len(set(placed.values())) == 5
+    assert all(strategy.pick(key)['name'] == name for key, name in placed.items())
+
+    index.remove("NODE-2")
+    moved = {key for key, name in placed.items() if strategy.pick(key)['name'] != name}
+    assert moved == {key for key, name in placed.items() if name == "NODE-2"}
+
+
+def test_consistent_hash_spills_past_the_load_bound():
+    in_flight = InFlight()
+    strategy = STRATEGIES["consistent-hash"](make_index(4), in_flight, balance=0.25)
+    home = strategy.pick("hot-key")['name']
+    for _ in range(8):
+        in_flight.acquire(home)
+    assert strategy.pick("hot-key")['name'] != home
+    for _ in range(8):
+        in_flight.release(home)
+    assert strategy.pick("hot-key")['name'] == home
+
+
+def test_forgotten_nodes_leave_the_ring():
+    index = make_index(4)
+    strategy = STRATEGIES["consistent-hash"](index, InFlight())
+    strategy.pick("key")
+    points = len(strategy.ring[0])
+    index.remove("NODE-3")
+    strategy.forget("NODE-3")
+    assert "NODE-3" not in strategy.ring[1] and "NODE-3" not in strategy.weights
+    assert len(strategy.ring[0]) == points * 3 // 4
+    assert all(strategy.pick(f"user-{i}")['name'] != "NODE-3" for i in range(200))
+    strategy.forget("NODE-3")
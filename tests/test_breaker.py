@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from breaker import CLOSED, HALF_OPEN, OPEN, OutlierDetector
+
+
+def eject(breaker, name="NODE-1"):
+    for _ in range(breaker.consecutive_failures):
+        breaker.record(name, False)
+    assert breaker.states()[name] == OPEN
+
+
+def test_failures_eject_and_trial_outcome_closes_or_doubles():
+    events = []
+    breaker = OutlierDetector(base_ejection=0.01, on_eject=lambda n: events.append(("out", n)),
+                              on_restore=lambda n: events.append(("in", n)))
+    eject(breaker)
+    assert breaker.take_trial() is None
+    time.sleep(0.02)
+    assert breaker.take_trial() == "NODE-1"
+    assert breaker.states()["NODE-1"] == HALF_OPEN and breaker.take_trial() is None
+
+    before = time.monotonic()
+    assert breaker.record("NODE-1", False)
+    assert breaker.backends["NODE-1"].open_until - before >= 0.02
+    time.sleep(0.03)
+    assert breaker.take_trial() == "NODE-1"
+    breaker.record("NODE-1", True, 0.01)
+    assert breaker.states()["NODE-1"] == CLOSED
+    assert events == [("out", "NODE-1"), ("out", "NODE-1"), ("in", "NODE-1")]
+
+
+def test_released_trial_costs_nothing_and_stays_due():
+    breaker = OutlierDetector(base_ejection=0.01)
+    eject(breaker)
+    time.sleep(0.02)
+    assert breaker.take_trial() == "NODE-1"
+    open_until, streak = breaker.backends["NODE-1"].open_until, breaker.backends["NODE-1"].streak
+
+    breaker.release_trial("NODE-1")
+    assert breaker.states()["NODE-1"] == OPEN
+    assert (breaker.backends["NODE-1"].open_until, breaker.backends["NODE-1"].streak) == (open_until, streak)
+    assert breaker.take_trial() == "NODE-1"
+
+
+def test_never_ejects_more_than_the_allowed_fraction():
+    breaker = OutlierDetector(total=lambda: 4, max_ejected_fraction=0.5)
+    for name in ("NODE-1", "NODE-2", "NODE-3"):
+        for _ in range(breaker.consecutive_failures):
+            breaker.record(name, False)
+    assert sorted(breaker.ejected()) == ["NODE-1", "NODE-2"]
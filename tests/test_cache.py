@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from cache import ResponseCache, etag_matches
+
+FRESH = [("Cache-Control", "max-age=60"), ("Content-Type", "text/plain")]
+
+
+def test_storage_policy():
+    cache = ResponseCache()
+    assert cache.lifetime(FRESH) == 60
+    assert cache.lifetime([("Cache-Control", "max-age=60, s-maxage=5")]) == 5
+    assert cache.lifetime([("ETag", '"v1"')]) == 0
+    assert cache.lifetime([("Content-Type", "text/plain")]) is None
+    assert cache.lifetime(FRESH + [("Set-Cookie", "a=b")]) is None
+    assert cache.lifetime([("Cache-Control", "private, max-age=60")]) is None
+    assert cache.lifetime(FRESH + [("Vary", "*")]) is None
+    assert cache.lifetime(FRESH, {"authorization": "Bearer x"}) is None
+    assert cache.lifetime([("Cache-Control", "public, max-age=60")], {"authorization": "Bearer x"}) == 60
+    assert cache.cacheable(500, FRESH, length=10) is None
+    assert cache.cacheable(200, FRESH, length=cache.max_entry_bytes + 1) is None
+    assert ResponseCache.request_directives({"cache-control": "no-store"}) == (True, True)
+    assert ResponseCache.request_directives({"cache-control": "max-age=0"}) == (False, True)
+    assert etag_matches('W/"v1", "v2"', '"v1"') and not etag_matches('"v3"', '"v1"')
+
+
+def test_vary_keeps_one_variant_per_header_value():
+    cache = ResponseCache()
+    headers = FRESH + [("Vary", "Accept-Encoding")]
+    cache.store("/a", {"accept-encoding": "gzip"}, 200, headers, b"zipped", 60)
+    cache.store("/a", {"accept-encoding": "br"}, 200, headers, b"brotli", 60)
+    assert cache.lookup("/a", {"accept-encoding": "gzip"})[0].body == b"zipped"
+    assert cache.lookup("/a", {"accept-encoding": "br"})[0].body == b"brotli"
+    assert cache.lookup("/a", {}) == (None, None)
+
+
+def test_tinylfu_keeps_popular_entries_over_one_off_ones():
+    cache = ResponseCache(max_bytes=2000, max_entry_bytes=1000)
+    for key in ("/hot-1", "/hot-2"):
+        cache.store(key, {}, 200, FRESH, b"x" * 500, 60)
+        for _ in range(5):
+            cache.lookup(key, {})
+    cache.store("/once", {}, 200, FRESH, b"y" * 500, 60)
+    assert cache.lookup("/once", {}) == (None, None)
+    assert cache.lookup("/hot-1", {})[1] == "memory" and cache.lookup("/hot-2", {})[1] == "memory"
+
+    plain = ResponseCache(max_bytes=2000, max_entry_bytes=1000, admission=None)
+    for key in ("/hot-1", "/hot-2", "/once"):
+        plain.store(key, {}, 200, FRESH, b"x" * 500, 60)
+    assert plain.lookup("/hot-1", {}) == (None, None)
+    assert plain.lookup("/once", {})[0] is not None
+
+
+def test_not_modified_refreshes_and_conditional_hits_get_304():
+    cache = ResponseCache()
+    entry = cache.store("/a", {}, 200, [("ETag", '"v1"'), ("Cache-Control", "no-cache")], b"body", 0)
+    assert not entry.fresh()
+    assert cache.validators(entry) == {"If-None-Match": '"v1"'}
+
+    refreshed = cache.refresh("/a", {}, entry, [("Cache-Control", "max-age=30"), ("Content-Length", "0")])
+    assert refreshed.fresh() and refreshed.body == b"body"
+    assert dict(refreshed.headers)["Cache-Control"] == "max-age=30"
+    assert cache.lookup("/a", {})[0] is refreshed
+
+    status, headers, body = cache.serve(refreshed, "memory", {"if-none-match": '"v1"'})
+    assert (status, body) == (304, b"") and "Age" in dict(headers)
+    assert cache.serve(refreshed, "memory", {})[::2] == (200, b"body")
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResponseCache()
+    leader, flight = cache.begin("/a")
+    assert leader
+    results = []
+    joined = threading.Barrier(5)
+
+    def follower():
+        first, f = cache.begin("/a")
+        joined.wait()
+        if not first and cache.wait(f, 5):
+            results.append(cache.lookup("/a", {})[0].body)
+
+    threads = [threading.Thread(target=follower) for _ in range(4)]
+    for t in threads:
+        t.start()
+    joined.wait()
+    cache.store("/a", {}, 200, FRESH, b"once", 60)
+    cache.end("/a", flight)
+    for t in threads:
+        t.join()
+    assert results == [b"once"] * 4
+    assert cache.begin("/a")[0]
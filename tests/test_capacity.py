@@ -0,0 +1,65 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import capacity
+
+
+def fake_measure(calls):
+    def measure(quick=False, on_pool_ready=None):
+        calls.append(quick)
+        if on_pool_ready is not None:
+            on_pool_ready()
+        return {"overall_capacity": 50 if quick else 80, "quick": quick}
+    return measure
+
+
+def test_cached_result_is_reused_and_quick_never_stands_in_for_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+    monkeypatch.setattr(capacity, "measure", fake_measure(calls))
+
+    assert capacity.benchmark(quick=True)["overall_capacity"] == 50
+    assert capacity.benchmark(quick=True)["overall_capacity"] == 50
+    assert calls == [True]
+    assert capacity.benchmark(quick=False)["overall_capacity"] == 80
+    assert capacity.benchmark(quick=True)["overall_capacity"] == 80
+    assert calls == [True, False]
+
+
+def test_cache_is_ignored_on_other_hardware_or_version(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.yaml")
+    capacity.save_cached({"overall_capacity": 80, "quick": False}, path)
+    assert capacity.load_cached(path)["overall_capacity"] == 80
+
+    monkeypatch.setattr(capacity, "hardware_fingerprint", lambda: "elsewhere")
+    assert capacity.load_cached(path) is None
+    monkeypatch.undo()
+    monkeypatch.setattr(capacity, "CACHE_VERSION", capacity.CACHE_VERSION + 1)
+    assert capacity.load_cached(path) is None
+
+
+def test_pool_ready_hook_runs_on_a_cache_hit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(capacity, "measure", fake_measure([]))
+    capacity.benchmark(quick=True)
+    ready = []
+    capacity.benchmark(quick=True, on_pool_ready=lambda: ready.append(True))
+    assert ready == [True]
+
+
+def test_quick_mode_falls_back_to_one_core_when_the_pool_is_slow(tmp_path, monkeypatch):
+    timeouts = []
+
+    def start_pool(cores, timeout):
+        timeouts.append(timeout)
+        raise TimeoutError()
+
+    monkeypatch.setattr(capacity, "start_pool", start_pool)
+    monkeypatch.setattr(capacity, "probe_disk", lambda size_mb: {"io_capacity": 500})
+    ready = []
+    metrics = capacity.measure(quick=True, on_pool_ready=lambda: ready.append(True))
+    assert timeouts == [capacity.QUICK["pool_timeout"]] and ready == [True]
+    assert metrics["cpu_estimated"] and metrics["cpu_capacity"] >= 10
+    assert capacity.QUICK["pool_timeout"] < capacity.FULL["pool_timeout"]
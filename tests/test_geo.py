@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import geo
+from balancing import GeoNearest, InFlight
+from selector import NodeIndex
+
+CITIES = {
+    "MONTREAL": (45.50, -73.57, "NA-EAST"),
+    "TORONTO": (43.65, -79.38, "NA-EAST"),
+    "PARIS": (48.86, 2.35, "EU"),
+    "TOKYO": (35.68, 139.69, "ASIA"),
+}
+
+
+def test_prefix_table_takes_the_longest_match():
+    table = geo.PrefixTable()
+    table.insert("10.0.0.0/8", "wide")
+    table.insert("10.1.0.0/16", "narrow")
+    table.insert("10.1.2.128/25", "narrowest")
+    table.insert("2001:db8::/32", "v6")
+    assert table.lookup("10.9.9.9") == "wide"
+    assert table.lookup("10.1.2.3") == "narrow"
+    assert table.lookup("10.1.2.200") == "narrowest"
+    assert table.lookup("2001:db8::1") == "v6"
+    assert table.lookup("11.0.0.1") is None
+    assert table.lookup("not an ip") is None
+    assert len(table) == 4
+
+
+def test_node_tree_matches_brute_force():
+    rng = random.Random(7)
+    located = {f"NODE-{i}": (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(200)}
+    tree = geo.NodeTree(located)
+    for _ in range(50):
+        lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        q = geo.unit_vector(lat, lon)
+        expected = sorted(located, key=lambda n: sum((a - b) ** 2 for a, b in zip(geo.unit_vector(*located[n]), q)))
+        found = tree.nearest(lat, lon, lambda n: n != expected[0], 2)
+        assert [name for _, name in found] == expected[1:3]
+        assert found[0][0] <= found[1][0]
+    assert geo.NodeTree({}).nearest(0, 0, lambda n: True) == []
+
+
+def make_strategy():
+    index = NodeIndex()
+    for name, (lat, lon, region) in CITIES.items():
+        index.update(name, {"name": name, "alive": True, "maintenance": False, "ping": 10.0, "load": 5,
+                            "users": 0, "max": 100, "region": region,
+                            "location": {"lat": lat, "lon": lon}})
+    prefixes = geo.PrefixTable()
+    prefixes.insert("198.51.100.0/24", (48.1, 11.6, "EU", "Munich"))
+    prefixes.insert("203.0.113.0/24", (None, None, "ASIA", None))
+    return index, GeoNearest(index, InFlight(), prefixes=prefixes, slack_km=300)
+
+
+def test_geo_routes_to_the_nearest_node_then_the_region():
+    index, strategy = make_strategy()
+    assert strategy.pick("198.51.100.7, 10.0.0.1")['name'] == "PARIS"
+    assert strategy.pick("203.0.113.9")['name'] == "TOKYO"
+    assert strategy.pick("198.51.100.7", exclude={"PARIS"})['name'] in CITIES
+    assert strategy.pick("192.0.2.1")['name'] in CITIES
+
+
+def test_forgotten_nodes_leave_the_tree():
+    index, strategy = make_strategy()
+    strategy.pick("198.51.100.7")
+    assert strategy.tree.size == 4
+    index.remove("PARIS")
+    strategy.forget("PARIS")
+    assert "PARIS" not in strategy.located and strategy.tree.size == 3
+    assert strategy.pick("198.51.100.7")['name'] != "PARIS"
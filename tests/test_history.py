@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from history import HistoryStore
+
+
+def test_day_range_resolves_to_ten_minutes(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.db"))
+    now = int(time.time())
+    assert store.pick_resolution(now - 86400, now) == 600
+    assert store.pick_resolution(now - 600, now) == 0
+    assert store.pick_resolution(now - 86400, now, resolution=60) == 60
+
+
+def test_rollups_leave_missing_values_out(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.db"))
+    conn = store._connect()
+    now = int(time.time())
+    bucket = now - now % 3600
+    store._write(conn, [(bucket, "NODE-1", 10.0, None, 4), (bucket + 1, "NODE-1", None, 30.0, 6)], set())
+    store._write(conn, [(bucket + 2, "NODE-1", 20.0, 50.0, None)], set())
+    width, rows = store.query("NODE-1", bucket, bucket + 59, resolution=60)
+    assert width == 60
+    assert rows == [(bucket, 3, 10.0, 20.0, 15.0, 30.0, 50.0, 40.0, 4.0, 6.0, 5.0)]
+
+
+def test_old_rollup_tables_gain_counts(tmp_path):
+    path = str(tmp_path / "h.db")
+    conn = sqlite3.connect(path)
+    stats = ", ".join(f"{m}_min REAL, {m}_max REAL, {m}_sum REAL" for m in ("load", "ping", "users"))
+    conn.execute(f"CREATE TABLE rollup_60 (node_name TEXT, bucket INTEGER, n INTEGER, {stats}, "
+                 f"PRIMARY KEY (node_name, bucket)) WITHOUT ROWID")
+    bucket = int(time.time()) // 60 * 60
+    conn.execute("INSERT INTO rollup_60 VALUES ('NODE-1', ?, 2, 1, 3, 4, 5, 7, 12, 0, 2, 2)", (bucket,))
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path)
+    _, rows = store.query("NODE-1", bucket, bucket, resolution=60)
+    assert rows == [(bucket, 2, 1.0, 3.0, 2.0, 5.0, 7.0, 6.0, 0.0, 2.0, 1.0)]
+
+
+def test_legacy_table_is_rolled_up_before_it_is_dropped(tmp_path):
+    path = str(tmp_path / "h.db")
+    now = int(time.time())
+    hour = now - now % 3600
+    week_ago = hour - 7 * 86400
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE history (timestamp INTEGER, node_name TEXT, cpu_load REAL, ping REAL, users INTEGER)")
+    conn.executemany("INSERT INTO history VALUES (?, 'NODE-1', ?, 20.0, 1)",
+                     [(week_ago, 10.0), (week_ago + 60, 30.0), (hour, 50.0)])
+    conn.commit()
+    conn.close()
+
+    store = HistoryStore(path, retention=86400)
+    assert store.query("NODE-1", hour, hour, resolution=0) == (0, [(hour, 50.0, 20.0, 1)])
+    assert store.query("NODE-1", week_ago, week_ago + 3599, resolution=3600)[1] == \
+        [(week_ago, 2, 10.0, 30.0, 20.0, 20.0, 20.0, 20.0, 1.0, 1.0, 1.0)]
+    assert store.query("NODE-1", week_ago, week_ago + 599, resolution=600)[1][0][1] == 2
+    conn = store._connect()
+    assert conn.execute("SELECT count(*) FROM rollup_60 WHERE bucket < ?", (now - 2 * 86400,)).fetchone()[0] == 0
+    assert conn.execute("SELECT type FROM sqlite_master WHERE name='history'").fetchone() == ("view",)
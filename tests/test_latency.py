@@ -0,0 +1,30 @@
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from latency import LatencyProber
+
+
+def test_refused_connect_is_lost_not_a_sample():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]     # closed again before the probe: refused
+    prober = LatencyProber(lambda: [("down", "127.0.0.1", port)], mode="tcp", timeout=0.5, tcp_interval=0)
+    prober.sweep()
+    prober.sweep()
+    assert prober.stats("down") is None
+    assert prober.windows["down"].count == 2
+
+
+def test_tcp_probes_wait_for_tcp_interval():
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(8)
+        target = [("up", "127.0.0.1", listener.getsockname()[1])]
+        prober = LatencyProber(lambda: target, mode="tcp", timeout=0.5, tcp_interval=60)
+        for _ in range(3):
+            prober.sweep()
+        assert prober.windows["up"].count == 1
+        assert prober.stats("up")["loss"] == 0
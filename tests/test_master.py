@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import master
+
+NODE = "STUB-1"
+
+
+class Upstream(BaseHTTPRequestHandler):
+    """Stub backend: /stream sends two chunks with a pause the test controls, /headers echoes what it got."""
+
+    protocol_version = "HTTP/1.1"
+    release = None      # threading.Event set by the test to send the second chunk
+    received = []       # request headers seen by /headers
+
+    def do_GET(self):
+        if self.path == "/stream":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.chunk(b"first")
+            Upstream.release.wait(5)
+            self.chunk(b"second")
+            self.chunk(b"")
+        else:
+            Upstream.received.append(dict(self.headers))
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.send_header("Keep-Alive", "timeout=5")
+            self.send_header("Upgrade", "h2c")
+            self.send_header("Proxy-Authenticate", "Basic")
+            self.send_header("X-Backend", NODE)
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    def chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def client(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Upstream.release = threading.Event()
+    Upstream.received = []
+    monkeypatch.setattr(master, "CACHE", None)      # proxy straight through, no cache fill
+    master.set_node_stats(NODE, {"name": NODE, "ip": "127.0.0.1", "port": server.server_address[1],
+                                 "alive": True, "ping": 1.0, "load": 0, "users": 0, "max": 100})
+    try:
+        yield master.app.test_client()
+    finally:
+        Upstream.release.set()
+        master.remove_node_stats(NODE)
+        master.SESSIONS.pop(NODE, None)
+        server.shutdown()
+        server.server_close()
+
+
+def test_body_is_streamed_before_the_upstream_finishes(client):
+    resp = client.get("/stream", buffered=False)
+    assert resp.status_code == 200
+    chunks = iter(resp.response)
+    assert next(chunks) == b"first"         # the upstream is still holding back the rest
+    Upstream.release.set()
+    assert b"".join(chunks) == b"second"
+    resp.close()
+
+
+def test_admission_slot_is_released_when_the_client_response_closes(client):
+    resp = client.get("/stream", buffered=False)
+    assert next(iter(resp.response)) == b"first"
+    assert master.IN_FLIGHT.counts.get(NODE) == 1
+    resp.close()        # client went away mid-body
+    assert master.IN_FLIGHT.counts.get(NODE, 0) == 0
+
+    Upstream.release.set()
+    with client.get("/stream") as resp:    # read to the end this time
+        assert resp.data == b"firstsecond"
+    assert master.IN_FLIGHT.counts.get(NODE, 0) == 0
+
+
+def test_hop_by_hop_headers_are_stripped_both_ways(client):
+    with client.get("/headers", headers={"Keep-Alive": "timeout=1", "TE": "trailers",
+                                         "Proxy-Authorization": "Basic eA==", "X-Client": "1"}) as resp:
+        assert resp.data == b"ok"
+    sent = {k.lower() for k in Upstream.received[0]}
+    assert "x-client" in sent
+    assert not sent & {"keep-alive", "te", "proxy-authorization"}
+
+    got = {k.lower() for k in resp.headers.keys()}
+    assert resp.headers["X-Backend"] == NODE and resp.headers["Content-Length"] == "2"
+    assert not got & {"keep-alive", "upgrade", "proxy-authenticate", "transfer-encoding"}
@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from membership import ALIVE, DEAD, LEFT, SUSPECT, Membership
+
+SECRET = "mesh-secret"
+
+
+def make(**kwargs):
+    # Never started: no socket, sends are dropped, so handle()/probe()/_expire() run in isolation
+    changes = []
+    kwargs.setdefault("on_change", changes.append)
+    return Membership("controller", 0, {"role": "controller"}, secret=SECRET, **kwargs), changes
+
+
+def record(name="NODE-1", incarnation=1, status=ALIVE, host="10.0.0.1", meta=None):
+    return {"n": name, "h": host, "p": 7946, "i": incarnation, "s": status, "m": meta or {"role": "node"}}
+
+
+def datagram(msg, key=SECRET):
+    msg = dict(msg, v=1)
+    payload = json.dumps(msg).encode()
+    signer = Membership("signer", 0, {}, secret=key)
+    return signer._sign(payload) + payload
+
+
+def gossip(member, *records, sender=None):
+    sender = sender or record("PEER", host="10.0.0.9")
+    member.handle(datagram({"t": "gossip", "me": sender, "u": list(records)}), ("10.0.0.9", 7946))
+
+
+def test_merge_follows_incarnation_then_status_rank():
+    member, changes = make()
+    gossip(member, record(incarnation=2))
+    assert member.members["NODE-1"].status == ALIVE
+
+    gossip(member, record(incarnation=1, status=DEAD))       # older life: ignored
+    assert member.members["NODE-1"].status == ALIVE
+    gossip(member, record(incarnation=2, status=SUSPECT))    # same life, worse status: wins
+    assert member.members["NODE-1"].status == SUSPECT
+    gossip(member, record(incarnation=2, status=ALIVE))      # can't undo it without a new incarnation
+    assert member.members["NODE-1"].status == SUSPECT
+    gossip(member, record(incarnation=3, status=ALIVE))
+    assert member.members["NODE-1"].status == ALIVE
+
+    assert [(m.name, m.status) for m in changes] == [
+        ("PEER", ALIVE), ("NODE-1", ALIVE), ("NODE-1", SUSPECT), ("NODE-1", ALIVE)]
+
+
+def test_merge_learns_a_missing_host_and_refutes_suspicion_of_itself():
+    member, changes = make()
+    gossip(member, record(host=""))
+    assert member.members["NODE-1"].host == ""
+    gossip(member, record(host="10.0.0.1"))
+    assert member.members["NODE-1"].host == "10.0.0.1"
+
+    member.running = True
+    before = member.me.incarnation
+    gossip(member, record(name="controller", incarnation=before, status=SUSPECT))
+    assert member.me.incarnation == before + 1 and member.me.status == ALIVE
+    assert "controller" in member.broadcasts
+
+
+def test_unacked_member_becomes_suspect_then_dead_then_forgotten():
+    member, changes = make(period=0.01, ack_timeout=0.001, suspicion_mult=1, forget_after=0.05)
+    gossip(member, record())
+    changes.clear()
+
+    suspected = member.probe(member.members["NODE-1"])
+    assert suspected.status == SUSPECT and member.members["NODE-1"].status == SUSPECT
+
+    assert member._expire() == []       # suspicion timeout not up yet
+    time.sleep(member.suspicion_timeout())
+    dead = [m for m in member._expire() if m is not None]
+    assert [(m.name, m.status) for m in dead] == [("NODE-1", DEAD)]
+
+    time.sleep(0.05)
+    member._expire()
+    assert "NODE-1" not in member.members and "NODE-1" not in member.broadcasts
+
+
+def test_left_members_are_reported_and_not_probed():
+    member, changes = make()
+    gossip(member, record())
+    gossip(member, record(incarnation=2, status=LEFT))
+    assert changes[-1].status == LEFT
+    assert all(member._next_target().name != "NODE-1" for _ in range(3))
+
+
+def test_unsigned_and_forged_datagrams_are_dropped():
+    member, changes = make()
+    msg = {"t": "gossip", "me": record("PEER"), "u": [record()]}
+    payload = json.dumps(dict(msg, v=1)).encode()
+
+    member.handle(payload, ("10.0.0.9", 7946))
+    member.handle(b"\0" * 32 + payload, ("10.0.0.9", 7946))
+    member.handle(datagram(msg, key="other-mesh"), ("10.0.0.9", 7946))
+    member.handle(datagram(msg)[:-1] + b" ", ("10.0.0.9", 7946))
+    assert member.members == {} and changes == []
+
+    member.handle(datagram(msg), ("10.0.0.9", 7946))
+    assert set(member.members) == {"PEER", "NODE-1"}
+
+
+def test_start_refuses_to_run_without_a_secret():
+    member = Membership("controller", 0, {})
+    with pytest.raises(ValueError):
+        member.start()
+    assert member.sock is None
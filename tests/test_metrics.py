@@ -0,0 +1,118 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_help_type_and_labelled_samples():
+    registry = Registry()
+    total = Counter("mesh_requests_total", "Requests", registry=registry)
+    per_node = Counter("mesh_errors_total", "Errors per node", ["node"], registry=registry)
+    total.inc()
+    total.inc(2.5)
+    per_node.labels("NODE-1").inc()
+    per_node.labels('say "hi"\\\n').inc(3)
+
+    assert registry.render() == (
+        "# HELP mesh_requests_total Requests\n"
+        "# TYPE mesh_requests_total counter\n"
+        "mesh_requests_total 3.5\n"
+        "# HELP mesh_errors_total Errors per node\n"
+        "# TYPE mesh_errors_total counter\n"
+        'mesh_errors_total{node="NODE-1"} 1\n'
+        'mesh_errors_total{node="say \\"hi\\"\\\\\\n"} 3\n'
+    )
+
+
+def test_labels_must_match_the_declared_names():
+    counter = Counter("mesh_errors_total", "Errors", ["node"], registry=Registry())
+    with pytest.raises(ValueError):
+        counter.labels("NODE-1", "extra")
+    assert counter.labels("NODE-1") is counter.labels("NODE-1")
+
+
+def test_gauge_values_functions_and_collectors():
+    registry = Registry()
+    plain = Gauge("mesh_queue_depth", "Depth", registry=registry)
+    plain.set(4)
+    plain.labels().dec()
+    read = Gauge("mesh_nodes_alive", "Alive", registry=registry)
+    read.set_function(lambda: 2.0)
+    broken = Gauge("mesh_broken", "Raises at scrape time", registry=registry)
+    broken.set_function(lambda: 1 / 0)
+    scores = {"NODE-1": 1.5, "NODE-2": float("inf")}
+    per_node = Gauge("mesh_node_score", "Score", ["node"], registry=registry)
+    per_node.collect_from(lambda: scores)
+
+    lines = registry.render().splitlines()
+    assert "mesh_queue_depth 3" in lines
+    assert "mesh_nodes_alive 2" in lines
+    assert "# TYPE mesh_broken gauge" in lines and not any(l.startswith("mesh_broken ") for l in lines)
+    assert 'mesh_node_score{node="NODE-1"} 1.5' in lines
+    assert 'mesh_node_score{node="NODE-2"} +Inf' in lines
+
+    del scores["NODE-1"]    # collectors replace their samples on every scrape
+    assert not any("NODE-1" in l for l in registry.render().splitlines())
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = Registry()
+    seconds = Histogram("mesh_select_seconds", "Select", buckets=(0.1, 1.0, 0.5), registry=registry)
+    for value in (0.05, 0.1, 0.7, 3.0):
+        seconds.observe(value)
+    per_node = Histogram("mesh_upstream_seconds", "Upstream", ["node"], buckets=(1.0,), registry=registry)
+    with per_node.labels("NODE-1").time():
+        pass
+
+    lines = registry.render().splitlines()
+    assert lines[:9] == [
+        "# HELP mesh_select_seconds Select",
+        "# TYPE mesh_select_seconds histogram",
+        'mesh_select_seconds_bucket{le="0.1"} 2',
+        'mesh_select_seconds_bucket{le="0.5"} 2',
+        'mesh_select_seconds_bucket{le="1"} 3',
+        'mesh_select_seconds_bucket{le="+Inf"} 4',
+        "mesh_select_seconds_sum 3.85",
+        "mesh_select_seconds_count 4",
+        "# HELP mesh_upstream_seconds Upstream",
+    ]
+    assert 'mesh_upstream_seconds_bucket{node="NODE-1",le="1"} 1' in lines
+    assert 'mesh_upstream_seconds_count{node="NODE-1"} 1' in lines
+
+
+def test_collect_and_merge_label_every_sample_with_its_process():
+    def process(requests, observed):
+        registry = Registry()
+        Counter("mesh_requests_total", "Requests", registry=registry).inc(requests)
+        Histogram("mesh_select_seconds", "Select", ["node"], buckets=(1.0,), registry=registry) \
+            .labels("NODE-1").observe(observed)
+        return registry.collect()
+
+    families = process(2, 0.5)
+    assert families[0] == ["mesh_requests_total",
+                           ["# HELP mesh_requests_total Requests", "# TYPE mesh_requests_total counter"],
+                           ["mesh_requests_total 2"]]
+
+    merged = metrics.merge({"main": families, "worker-1": process(5, 2.0)})
+    assert merged.splitlines() == [
+        "# HELP mesh_requests_total Requests",
+        "# TYPE mesh_requests_total counter",
+        'mesh_requests_total{process="main"} 2',
+        'mesh_requests_total{process="worker-1"} 5',
+        "# HELP mesh_select_seconds Select",
+        "# TYPE mesh_select_seconds histogram",
+        'mesh_select_seconds_bucket{process="main",node="NODE-1",le="1"} 1',
+        'mesh_select_seconds_bucket{process="main",node="NODE-1",le="+Inf"} 1',
+        'mesh_select_seconds_sum{process="main",node="NODE-1"} 0.5',
+        'mesh_select_seconds_count{process="main",node="NODE-1"} 1',
+        'mesh_select_seconds_bucket{process="worker-1",node="NODE-1",le="1"} 0',
+        'mesh_select_seconds_bucket{process="worker-1",node="NODE-1",le="+Inf"} 1',
+        'mesh_select_seconds_sum{process="worker-1",node="NODE-1"} 2',
+        'mesh_select_seconds_count{process="worker-1",node="NODE-1"} 1',
+    ]
+    assert merged.endswith("\n")
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import capacity
+import node
+
+
+def test_rebenchmark_rewrites_an_existing_config(tmp_path, monkeypatch):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.dump({"server_name": "NODE-1", "region": "EU", "port": 5001,
+                               "max_users": 40, "benchmark": {"overall_capacity": 40}}))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(node, "CONFIG_PATH", str(path))
+    calls = []
+
+    def measure(quick=False, on_pool_ready=None):
+        calls.append(quick)
+        return {"cpu_capacity": 900, "ram_capacity": 500, "network_capacity": 100,
+                "io_capacity": 300, "overall_capacity": 123, "quick": quick}
+
+    monkeypatch.setattr(capacity, "measure", measure)
+
+    node.load_config(quick=True)
+    assert node.config["max_users"] == 40 and calls == []
+
+    node.load_config(quick=True, rebenchmark=True)
+    assert calls == [True]
+    written = yaml.safe_load(path.read_text())
+    assert written["max_users"] == node.config["max_users"] == 123
+    assert written["benchmark"]["cpu_capacity"] == 900 and "quick" not in written["benchmark"]
+    assert written["server_name"] == "NODE-1"
+    assert capacity.load_cached(allow_quick=True)["overall_capacity"] == 123
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import statwire
+from prober import MeshProber
+
+RECORD = statwire.encode({"name": "NODE-1", "current_users": 3, "max_users": 10, "cpu_load": 12.5})
+ETAG = '"abc123b"'
+
+
+def test_binary_probe_is_conditional_and_reuses_bytes_on_304():
+    seen = []
+
+    async def stats(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == ETAG:
+            return web.Response(status=304, headers={"ETag": ETAG})
+        return web.Response(body=RECORD, content_type=statwire.MEDIA_TYPE, headers={"ETag": ETAG})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/stats", stats)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        node = {"name": "NODE-1", "ip": "127.0.0.1", "agent_port": port}
+        prober = MeshProber([node], binary=True)
+        try:
+            async with prober.session() as session:
+                sem = asyncio.Semaphore(1)
+                first = await prober.probe(session, sem, node)
+                second = await prober.probe(session, sem, node)
+        finally:
+            await runner.cleanup()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first[2] == RECORD and first[3] is None
+    assert seen == [None, ETAG]
+    assert second[2] is first[2]
+
+
+def test_poke_from_another_thread_runs_on_the_loop():
+    node = {"name": "NODE-1", "ip": "127.0.0.1", "agent_port": 9}
+    prober = MeshProber([node], interval=3600)
+
+    async def run():
+        prober.wake = asyncio.Event()
+        prober.loop = asyncio.get_running_loop()
+        prober.next_due["NODE-1"] = time.monotonic() + 3600
+        thread = threading.Thread(target=prober.poke, args=("NODE-1",))
+        thread.start()
+        thread.join()
+        assert prober.next_due["NODE-1"] > 0     # not touched off the loop thread
+        await asyncio.wait_for(prober.wake.wait(), 1)
+        return prober.due_nodes(time.monotonic())
+
+    assert asyncio.run(run()) == [node]
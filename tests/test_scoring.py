@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import scoring
+from scoring import ScoreEngine
+from selector import NodeIndex
+
+
+def test_steady_node_scores_like_ping_plus_load():
+    engine = ScoreEngine()
+    for t in range(0, 60, 5):
+        score = engine.observe("A", t, 20, 30, 0.5)
+    assert score == pytest.approx(30 + 2 * 20 + scoring.USERS_WEIGHT * 0.5)
+
+
+def test_rising_load_is_penalised_before_it_overtakes():
+    engine = ScoreEngine(horizon=30)
+    for t in range(0, 60, 5):
+        steady = engine.observe("steady", t, 40, 20)
+        heating = engine.observe("heating", t, 10 + t / 2, 20)
+    assert 10 + 55 / 2 < 40
+    assert heating > steady
+
+
+def test_one_spike_only_moves_the_score_a_little():
+    engine = ScoreEngine(half_life=10)
+    for t in range(0, 60, 5):
+        base = engine.observe("A", t, 10, 20)
+    spiked = engine.observe("A", 60, 90, 20)
+    assert base < spiked < base + 2 * 80 / 2
+
+
+def test_silent_nodes_start_over_and_seeds_warm_up():
+    engine = ScoreEngine(reset_after=120)
+    engine.seed({"A": [(0, 90, 200, 5), (10, 90, 200, 5)], "B": []})
+    assert len(engine) == 1
+    assert engine.observe("A", 500, 0, 10) == pytest.approx(10)
+
+    stats = engine.annotate("B", {"ping": 10, "load": 5, "users": 50, "max": 100, "jitter": 2}, 0)
+    assert stats['score'] == pytest.approx(12 + 10 + scoring.USERS_WEIGHT * 0.5)
+    assert engine.snapshot()["B"] == stats['score']
+
+
+def test_hysteresis_keeps_the_current_best_until_it_is_clearly_beaten():
+    index = NodeIndex(hysteresis=0.1)
+    node = lambda name, score: {"name": name, "alive": True, "ping": 0, "load": 0, "max": 100, "score": score}
+    index.update("A", node("A", 100))
+    index.update("B", node("B", 105))
+    assert index.best()['name'] == "A"
+    index.update("B", node("B", 95))
+    assert index.best()['name'] == "A"
+    index.update("B", node("B", 89))
+    assert index.best()['name'] == "B"
+    index.remove("B")
+    assert index.best()['name'] == "A"
@@ -0,0 +1,54 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from selector import NodeIndex, is_eligible, node_score
+
+
+def stats(name, ping, load=0, users=0, max_users=100, alive=True, maintenance=False):
+    return {"name": name, "alive": alive, "maintenance": maintenance, "ping": ping,
+            "load": load, "users": users, "max": max_users}
+
+
+def test_best_matches_a_linear_scan_under_churn():
+    rng = random.Random(3)
+    index = NodeIndex()
+    current = {}
+    for _ in range(2000):
+        name = f"NODE-{rng.randrange(30)}"
+        if rng.random() < 0.1:
+            index.remove(name)
+            current.pop(name, None)
+            continue
+        s = stats(name, rng.uniform(1, 200), rng.randrange(100), users=rng.randrange(12), max_users=10,
+                  alive=rng.random() > 0.1)
+        index.update(name, s)
+        current[name] = s
+        eligible = [s for s in current.values() if is_eligible(s)]
+        best = index.best()
+        if eligible:
+            assert node_score(best) == min(node_score(s) for s in eligible)
+        else:
+            assert best is None
+        assert len(index) == len(eligible)
+    assert len(index.heap) <= 2 * len(index.live) + 64
+
+
+def test_ineligible_nodes_are_not_candidates():
+    index = NodeIndex()
+    index.update("A", stats("A", 10))
+    index.update("B", stats("B", 5, maintenance=True))
+    index.update("C", stats("C", 1, users=100))
+    index.update("D", stats("D", 1, alive=False))
+    assert [name for name, _ in index.candidates()] == ["A"]
+    assert index.candidates() is index.candidates()
+    index.update("B", stats("B", 5))
+    assert sorted(name for name, _ in index.candidates()) == ["A", "B"]
+    assert index.best()['name'] == "B"
+
+
+def test_a_routing_score_overrides_ping_and_load():
+    assert node_score({"ping": 10, "load": 5}) == 20
+    assert node_score({"ping": 10, "load": 5, "score": 3.5}) == 3.5
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from sessions import SessionTable
+
+
+def test_concurrent_connects_never_overbook():
+    capacity, threads, rounds = 20, 16, 300
+    table = SessionTable(capacity)
+    over = []
+    admitted = [0] * threads
+    released = [0] * threads
+    start = threading.Barrier(threads)
+
+    def worker(i):
+        start.wait()
+        held = []
+        for r in range(rounds):
+            leases = table.acquire(1 + r % 3)
+            if leases:
+                admitted[i] += len(leases)
+                held.extend(leases)
+            if table.count > capacity:
+                over.append(table.count)
+            if held and r % 2:
+                released[i] += table.release(held[:2])
+                del held[:2]
+        released[i] += table.release(held)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    assert not over and table.peak <= capacity
+    assert sum(admitted) == sum(released) > 0
+    assert table.count == 0
+    assert table.rejected > 0
+
+
+def test_batches_are_all_or_nothing():
+    table = SessionTable(5)
+    assert len(table.acquire(4)) == 4
+    assert table.acquire(2) is None
+    assert (table.count, table.rejected) == (4, 2)
+    assert len(table.acquire(1)) == 1
+
+
+def test_unrenewed_leases_expire_and_free_their_slot():
+    changes = []
+    table = SessionTable(2, ttl=0.05, on_change=lambda: changes.append(table.count))
+    kept, dropped = table.acquire(1) + table.acquire(1, ttl=0.05)
+    assert table.acquire(1) is None
+    time.sleep(0.03)
+    assert table.renew([kept, "unknown"], ttl=1.0) == 1
+    time.sleep(0.04)
+    assert table.reap() == 1
+    assert (table.count, table.expired) == (1, 1)
+    assert table.renew([dropped]) == 0
+    assert table.acquire(1) is not None
+    assert changes == [1, 2, 1, 2]
+
+
+def test_legacy_disconnect_releases_the_lease_closest_to_expiry():
+    table = SessionTable(3)
+    late = table.acquire(1, ttl=100)[0]
+    early = table.acquire(1, ttl=10)[0]
+    assert table.release_any() == 1
+    assert list(table.leases) == [late]
+    assert table.release([early]) == 0
+    assert table.release_any() == 1
+    assert table.release_any() == 0
+    assert table.count == 0
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import metrics
+from shared import SharedStatus
+
+
+def test_counts_past_32_bits_round_trip(tmp_path):
+    table = SharedStatus.create(str(tmp_path / "status"), capacity=4)
+    try:
+        assert table.put("NODE-1", {"alive": True, "users": 2**31 + 5, "max": 2**40, "web_port": 8080})
+        (name, record), = SharedStatus.open(table.path).changes()
+        assert (name, record["users"], record["max"], record["port"]) == ("NODE-1", 2**31 + 5, 2**40, 8080)
+    finally:
+        table.close()
+
+
+def test_worker_serves_what_other_processes_published(tmp_path):
+    path = str(tmp_path / "status")
+    writer = SharedStatus.create(path, capacity=4, slots=3)
+    registry = metrics.Registry()
+    probes = metrics.Counter("mesh_probes_total", "Probes sent", registry=registry)
+    probes.inc(7)
+    try:
+        pid = os.fork()
+        if pid == 0:
+            SharedStatus.open(path).publish(2, {"metrics": registry.collect()})
+            os._exit(0)
+        os.waitpid(pid, 0)
+        writer.publish(0, {"metrics": registry.collect(), "members": [{"name": "NODE-1"}]})
+
+        worker = SharedStatus.open(path)
+        assert worker.published(0)["members"] == [{"name": "NODE-1"}]
+        assert worker.published(1) is None
+        sources = worker.gather("metrics", 1, [["mesh_probes_total", [], ["mesh_probes_total 1"]]])
+        assert list(sources) == ["main", "worker-0", "worker-1"]
+        text = metrics.merge(sources)
+        assert text.count("# TYPE mesh_probes_total counter") == 1
+        assert 'mesh_probes_total{process="main"} 7' in text
+        assert 'mesh_probes_total{process="worker-0"} 1' in text
+        assert 'mesh_probes_total{process="worker-1"} 7' in text
+    finally:
+        writer.close()
@@ -0,0 +1,95 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import statwire
+from selector import is_eligible, node_score
+from statustable import StatusTable
+
+STATS = {"name": "MONTRÉAL-NODE-1", "region": "NA-EAST", "max_users": 250, "current_users": 17,
+         "cpu_load": 42.37, "ram_usage": 61.5, "temp": 55.4, "watts": 61.28,
+         "location": {"lat": 45.50884, "lon": -73.58781, "city": "Montréal"}, "status": "online"}
+
+
+def test_record_round_trips_the_stats_json():
+    payload = statwire.encode(STATS)
+    assert len(payload) < len(str(STATS))
+    decoded = statwire.decode(payload)
+    assert decoded == {k: v for k, v in STATS.items() if k != "status"}
+
+
+def test_missing_fields_and_bad_records():
+    decoded = statwire.decode(statwire.encode({"name": "N", "temp": None, "location": None}))
+    assert decoded["temp"] is None and decoded["location"] is None and decoded["region"] is None
+    with pytest.raises(ValueError):
+        statwire.unpack(b"MS")
+    with pytest.raises(ValueError):
+        statwire.unpack(b"{" + statwire.encode(STATS)[1:])
+    with pytest.raises(ValueError):
+        statwire.unpack(statwire.encode(STATS)[:statwire.HEAD.size + 3])
+
+
+def test_binary_and_json_ingest_give_the_same_row():
+    rows = []
+    for load in (lambda t, r: t.load_packed(r, statwire.encode(STATS)), lambda t, r: t.load_stats(r, STATS)):
+        table = StatusTable()
+        row = table.row("NODE-1")
+        load(table, row)
+        table.set_up(row, "10.0.0.1", 8000, 12.5, False, 1.0, 100.0)
+        rows.append(table["NODE-1"])
+    binary, json_row = rows
+    assert dict(binary.items()) == dict(json_row.items())
+    assert binary["users"] == 17 and binary["location"]["city"] == "Montréal"
+
+
+def test_row_views_route_like_plain_dicts():
+    table = StatusTable()
+    row = table.row("NODE-1")
+    assert table["NODE-1"]["alive"] is False and "users" not in table["NODE-1"]
+    table.load_stats(row, STATS)
+    table.set_up(row, "10.0.0.1", 8000, 12.5, False, 1.0, 100.0)
+    view = table["NODE-1"]
+    assert table.routing(row) == (is_eligible(view), node_score(view)) == (True, 12.5 + 42.37 * 2)
+    assert "score" not in view
+    view["score"] = 3.0
+    assert table.routing(row) == (True, 3.0)
+
+    table.set_down(row, "timeout")
+    assert table.snapshot(row) == {"alive": False, "ping": 9999, "error": "timeout", "maintenance": False}
+    assert table.routing(row) == (False, None) and not is_eligible(table["NODE-1"])
+
+
+@pytest.mark.parametrize("bad", [{"current_users": "12x"}, {"current_users": 2**63}, {"max_users": -1},
+                                 {"max_users": float("inf")}, {"cpu_load": "hot"}, {"watts": [1]}])
+def test_malformed_json_stats_leave_the_row_untouched(bad):
+    table = StatusTable()
+    row = table.row("NODE-1")
+    table.load_stats(row, STATS)
+    table.set_up(row, "10.0.0.1", 8000, 12.5, False, 1.0, 100.0)
+    before = table.snapshot(row)
+    with pytest.raises(ValueError):
+        table.load_stats(row, dict(STATS, region="ELSEWHERE", **bad))
+    assert table.snapshot(row) == before
+
+
+def test_counts_past_32_bits_fit():
+    table = StatusTable()
+    row = table.row("NODE-1")
+    table.load_stats(row, dict(STATS, current_users="7", max_users=2**40))
+    assert (table.users[row], table.max[row]) == (7, 2**40)
+
+
+def test_removed_rows_are_reused_clean():
+    table = StatusTable()
+    row = table.row("NODE-1")
+    table.load_stats(row, STATS)
+    table.set_up(row, "10.0.0.1", 8000, 12.5, False, 1.0, 100.0)
+    table.remove("NODE-1")
+    assert "NODE-1" not in table and len(table) == 0 and table.alive_count() == 0
+    assert table.row("NODE-2") == row
+    assert table["NODE-2"]["alive"] is False and table.text["name"][row] == "NODE-2"
+    assert table.users[row] == 0 and table.lat[row] != table.lat[row]
+    assert table.row("NODE-1") == row + 1
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from stream import StatusBroadcaster, _LoopQueue
+
+
+def test_timed_out_gets_take_nothing_and_keep_the_bound():
+    async def run():
+        q = _LoopQueue(asyncio.get_running_loop(), 2)
+        for _ in range(3):
+            with pytest.raises(queue.Empty):
+                await q.get(timeout=0.01)
+        threading.Thread(target=lambda: [q.put_nowait(b"a"), q.put_nowait(b"b")]).start()
+        assert await q.get(timeout=1) == b"a"
+        assert await q.get(timeout=1) == b"b"
+        q.put_nowait(b"c")
+        q.put_nowait(b"d")
+        with pytest.raises(queue.Full):
+            q.put_nowait(b"e")
+
+    asyncio.run(run())
+
+
+def test_async_subscriber_gets_events_from_other_threads():
+    broadcaster = StatusBroadcaster(max_backlog=4)
+
+    async def run():
+        events = broadcaster.aevents(keepalive=0.01)
+        assert (await events.__anext__()).startswith(b"event: snapshot")
+        assert await events.__anext__() == b": keepalive\n\n"
+        thread = threading.Thread(target=broadcaster.publish, args=("NODE-1", {"alive": True}))
+        thread.start()
+        thread.join()
+        while (message := await events.__anext__()) == b": keepalive\n\n":
+            pass
+        assert message.startswith(b"event: node")
+        await events.aclose()
+
+    asyncio.run(run())
+    assert not broadcaster.subscribers
+
+
+def test_subscriber_on_a_closed_loop_is_dropped():
+    broadcaster = StatusBroadcaster(max_backlog=4)
+    loop = asyncio.new_event_loop()
+    _, q = broadcaster.subscribe(_LoopQueue(loop, 4))
+    loop.close()
+    broadcaster.publish("NODE-1", {"alive": True})
+    assert q not in broadcaster.subscribers
+    broadcaster.publish("NODE-1", {"alive": False})
+
+
+def test_removed_node_is_announced_and_left_out_of_snapshots():
+    broadcaster = StatusBroadcaster(max_backlog=4)
+    broadcaster.publish("NODE-1", {"alive": True})
+    _, q = broadcaster.subscribe()
+    broadcaster.remove("NODE-1")
+    broadcaster.remove("NODE-1")
+    assert q.get_nowait().startswith(b"event: gone")
+    assert q.empty()
+    snapshot, _ = broadcaster.subscribe()
+    assert b"NODE-1" not in snapshot
@@ -0,0 +1,68 @@
+import json
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import telemetry
+from telemetry import TelemetryReceiver
+
+
+def datagram(seq, kind="f", **fields):
+    return json.dumps({"v": telemetry.VERSION, "n": "NODE-1", "p": 5001, "b": "boot", "s": seq,
+                       "k": kind, "d": {telemetry.FIELDS[k]: v for k, v in fields.items()}}).encode()
+
+
+def test_only_signed_datagrams_change_state():
+    updates = []
+    receiver = TelemetryReceiver(0, lambda key, name, stats: updates.append((key, stats)),
+                                 lambda key: None, "mesh-secret")
+
+    receiver.handle(datagram(1, current_users=999), "10.0.0.1")
+    receiver.handle(telemetry.sign(b"wrong", datagram(2, current_users=999)), "10.0.0.1")
+    receiver.handle(telemetry.sign(b"mesh-secret", datagram(3, current_users=999))[:-1], "10.0.0.1")
+    assert updates == []
+
+    receiver.handle(telemetry.sign(b"mesh-secret", datagram(4, current_users=3)), "10.0.0.1")
+    receiver.handle(telemetry.sign(b"mesh-secret", datagram(5, "d", cpu_load=50.0)), "10.0.0.1")
+    receiver.handle(telemetry.sign(b"mesh-secret", datagram(5, "d", cpu_load=99.0)), "10.0.0.1")
+    assert updates == [(("10.0.0.1", 5001), {"current_users": 3}),
+                       (("10.0.0.1", 5001), {"current_users": 3, "cpu_load": 50.0})]
+
+
+def test_a_secret_is_required():
+    with pytest.raises(ValueError):
+        TelemetryReceiver(0, None, None, None)
+    with pytest.raises(ValueError):
+        telemetry.TelemetrySender("NODE-1", 5001, "127.0.0.1:5005", dict, "")
+
+
+def test_listener_survives_a_push_it_cannot_apply():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    applied = threading.Event()
+
+    def on_update(key, name, stats):
+        users = int(stats["current_users"])     # ValueError for "12x", like StatusTable.load_stats
+        if users == 3:
+            applied.set()
+
+    receiver = TelemetryReceiver(port, on_update, lambda key: None, "mesh-secret", host="127.0.0.1")
+    receiver.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for _ in range(50):
+            sender.sendto(telemetry.sign(b"mesh-secret", datagram(1, current_users="12x")), ("127.0.0.1", port))
+            sender.sendto(telemetry.sign(b"mesh-secret", datagram(2, "d", current_users=3)), ("127.0.0.1", port))
+            if applied.wait(0.05):
+                break
+        assert applied.is_set()
+    finally:
+        sender.close()